@@ -0,0 +1,202 @@
+import io
+import json
+import hashlib
+import tarfile
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .database import db_config
+from .manifest import scan_tree
+
+logger = logging.getLogger(__name__)
+
+FRAME_SIZE = 4 * 1024 * 1024  # largest uncompressed frame; big members span several frames
+SMALL_FRAME = 1024 * 1024  # a member starts a new frame once the open one holds this much
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+DEFAULT_LEVEL = 3  # zstd CLI default
+MAX_WORKERS = 2  # volumes compressed at the same time
+
+
+def use_python_builder() -> bool:
+    """True if archives should be built in-process (WDM_ARCHIVE_ENGINE=python) instead of by tar | zstd."""
+    if str(db_config.get_config("WDM_ARCHIVE_ENGINE", "shell")).lower() != "python":
+        return False
+    if zstandard is None:
+        logger.warning("WDM_ARCHIVE_ENGINE=python needs the 'zstandard' package; falling back to tar | zstd.")
+        return False
+    return True
+
+
+def index_path_for(archive_path: Path) -> Path:
+    return Path(f"{archive_path}{INDEX_SUFFIX}")
+
+
+class _FrameWriter:
+    """
+    File object tarfile writes into. The tar stream is cut into independent zstd frames (their
+    concatenation is still a normal .tar.zst), and members are placed so each index entry can
+    name the compressed byte range that holds it.
+    """
+
+    def __init__(self, raw, level: int):
+        self.raw = raw
+        self.compressor = zstandard.ZstdCompressor(level=level, write_checksum=True)
+        self.buffer = bytearray()
+        self.position = 0  # compressed bytes written
+        self.uncompressed = 0
+        self._open = []  # entries that end inside the frame being filled
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.uncompressed += len(data)
+        while len(self.buffer) >= FRAME_SIZE:
+            self._flush(FRAME_SIZE)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.uncompressed
+
+    def _flush(self, size: Optional[int] = None):
+        chunk = bytes(self.buffer[:size]) if size else bytes(self.buffer)
+        del self.buffer[:len(chunk)]
+        frame = self.compressor.compress(chunk)
+        self.raw.write(frame)
+        self.position += len(frame)
+        for entry in self._open:
+            entry["length"] = self.position - entry["offset"]
+        self._open = []
+
+    def begin(self) -> tuple:
+        """Called before a member is written; returns (compressed offset of its first frame, bytes to skip in it)."""
+        if len(self.buffer) >= SMALL_FRAME:
+            self._flush()
+        return self.position, len(self.buffer)
+
+    def end(self, entry: dict):
+        if self.buffer:
+            self._open.append(entry)
+        else:
+            entry["length"] = self.position - entry["offset"]
+
+    def close(self):
+        if self.buffer:
+            self._flush()
+
+
+class _HashingReader:
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.hash.update(data)
+        return data
+
+
+def build_archive(source_dir: str, rel_paths: Optional[List[str]], archive_path: str, level: int = DEFAULT_LEVEL) -> dict:
+    """
+    Writes source_dir's files (rel_paths, or everything) to archive_path as tar in seekable zstd
+    frames, plus a sidecar index (archive_path + INDEX_SUFFIX) mapping each member to its
+    compressed offset/length, the bytes to skip inside the first frame, its size and sha256.
+    Runs in a worker process; returns a summary.
+    """
+    source = Path(source_dir)
+    names = rel_paths if rel_paths is not None else [path for path, _, _ in scan_tree(source)]
+    members = []
+    with open(archive_path, "wb") as raw:
+        writer = _FrameWriter(raw, level)
+        with tarfile.open(fileobj=writer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+            for name in names:
+                path = source / name
+                tarinfo = tar.gettarinfo(str(path), arcname=name)
+                offset, skip = writer.begin()
+                entry = {"name": name, "offset": offset, "skip": skip, "size": tarinfo.size, "length": 0}
+                if tarinfo.isreg():
+                    with open(path, "rb") as f:
+                        reader = _HashingReader(f)
+                        tar.addfile(tarinfo, reader)
+                    entry["sha256"] = reader.hash.hexdigest()
+                else:
+                    tar.addfile(tarinfo)
+                writer.end(entry)
+                members.append(entry)
+        # tarfile's end-of-archive blocks are in the last frame
+        writer.close()
+        compressed = writer.position
+
+    index = {
+        "version": INDEX_VERSION,
+        "archive": Path(archive_path).name,
+        "format": "tar+zstd-frames",
+        "size": compressed,
+        "members": members,
+    }
+    index_path = index_path_for(Path(archive_path))
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    return {"archive": archive_path, "index": str(index_path), "members": len(members), "size": compressed}
+
+
+def read_member(fetch_range: Callable[[int, int], bytes], entry: dict) -> bytes:
+    """
+    Extracts one file from a remote archive using its index entry. fetch_range(offset, length)
+    returns those bytes of the archive (e.g. an HTTP Range request); only the member's frames are read.
+    """
+    if zstandard is None:
+        raise RuntimeError("Reading archive members needs the 'zstandard' package.")
+    raw = fetch_range(entry["offset"], entry["length"])
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(raw), read_across_frames=True)
+    data = reader.read()
+    with tarfile.open(fileobj=io.BytesIO(data[entry["skip"]:]), mode="r:") as tar:
+        tarinfo = tar.next()
+        if tarinfo is None or tarinfo.name != entry["name"]:
+            raise ValueError(f"Index entry does not point at {entry['name']}")
+        f = tar.extractfile(tarinfo)
+        content = f.read() if f else b""
+    if entry.get("sha256") and hashlib.sha256(content).hexdigest() != entry["sha256"]:
+        raise ValueError(f"Checksum mismatch for {entry['name']}")
+    return content
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None  # one per pool worker, so callers can tell when a build starts
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # fork, not spawn: a spawned worker re-imports run.py and with it app.config, which wipes
+        # TMP_DIR (all running downloads) on import. It also works inside the PyInstaller binary.
+        _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("fork"))
+    return _executor
+
+
+async def build_archive_async(source_dir: Path, rel_paths: Optional[List[str]], archive_path: Path, level: int = DEFAULT_LEVEL,
+                              on_start: Optional[Callable[[], None]] = None) -> dict:
+    """Runs build_archive in the process pool; on_start is called once a worker is free for it."""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_WORKERS)
+    async with _slots:
+        if on_start:
+            on_start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), build_archive, str(source_dir), rel_paths, str(archive_path), level)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
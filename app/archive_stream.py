@@ -0,0 +1,151 @@
+import os
+import signal
+import asyncio
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+
+import psutil
+
+from .database import db_config
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+STREAM_ATTEMPTS = 2  # a failed stream is re-run from the source tree, it cannot be resumed
+
+
+def use_stream_upload(params: dict) -> bool:
+    """True if a single-volume archive should be piped into the upload instead of written to ARCHIVES_DIR."""
+    value = params.get("stream_upload") or db_config.get_config("WDM_STREAM_UPLOAD", "false")
+    return str(value).lower() == "true"
+
+
+class ArchiveStream:
+    """
+    `tar -cf - . | zstd -c` run as separate processes joined by OS pipes, without a shell, so the
+    exit code of every stage is checked (sh has no pipefail). All processes share a new process
+    group led by tar (not a new session: processes can only join groups of their own session),
+    so pause/resume and the stall watchdog handle the pipeline like any other command.
+
+    With a consumer command (e.g. rclone rcat) the compressed stream goes straight into its stdin;
+    otherwise start() returns a file descriptor to read it from (see read_chunks/iter_chunks).
+    """
+
+    def __init__(self, source_dir: Path, log_file: Path):
+        self.source_dir = Path(source_dir)
+        self.log_file = Path(log_file)
+        self.processes: List[asyncio.subprocess.Process] = []
+        self.sent = 0  # compressed bytes handed to the reader
+        self._reader_fd: Optional[int] = None  # returned by start(), until a generator takes it over
+
+    @property
+    def leader(self) -> Optional[asyncio.subprocess.Process]:
+        return self.processes[0] if self.processes else None
+
+    async def start(self, consumer: Optional[List[str]] = None) -> Optional[int]:
+        log = await asyncio.to_thread(open, self.log_file, "a", encoding="utf-8")
+        tar_read, tar_write = os.pipe()
+        out_read, out_write = os.pipe()
+        try:
+            tar = await asyncio.create_subprocess_exec(
+                "tar", "-cf", "-", "-C", str(self.source_dir), ".",
+                stdout=tar_write, stderr=log, process_group=0
+            )
+            self.processes.append(tar)
+            pgid = os.getpgid(tar.pid)
+            zstd = await asyncio.create_subprocess_exec(
+                "zstd", "-c", "-q",
+                stdin=tar_read, stdout=out_write, stderr=log, process_group=pgid
+            )
+            self.processes.append(zstd)
+            if consumer:
+                upload = await asyncio.create_subprocess_exec(
+                    *consumer, stdin=out_read, stdout=log, stderr=log, process_group=pgid
+                )
+                self.processes.append(upload)
+        except Exception:
+            os.close(out_read)
+            await self.kill()
+            raise
+        finally:
+            log.close()
+            # The children hold their own copies of the pipe ends
+            os.close(tar_read)
+            os.close(tar_write)
+            os.close(out_write)
+        if consumer:
+            os.close(out_read)
+            return None
+        self._reader_fd = out_read
+        return out_read
+
+    def _claim(self, fd: int):
+        """The generator reading fd now closes it; kill() no longer has to."""
+        if self._reader_fd == fd:
+            self._reader_fd = None
+
+    def read_progress(self) -> int:
+        """Bytes tar has read from the source tree so far (from /proc I/O counters)."""
+        leader = self.leader
+        if leader is None:
+            return 0
+        try:
+            io = psutil.Process(leader.pid).io_counters()
+            return getattr(io, "read_chars", io.read_bytes)
+        except (psutil.Error, AttributeError):
+            return 0
+
+    def iter_chunks(self, fd: int, on_bytes: Optional[Callable[[int], None]] = None) -> Iterator[bytes]:
+        """Blocking generator over the compressed stream, for requests' chunked uploads in a thread."""
+        self._claim(fd)
+        with os.fdopen(fd, "rb", buffering=0) as stream:
+            while True:
+                chunk = stream.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    return
+                self.sent += len(chunk)
+                if on_bytes:
+                    on_bytes(self.sent)
+                yield chunk
+
+    async def read_chunks(self, fd: int, on_bytes: Optional[Callable[[int], None]] = None) -> AsyncIterator[bytes]:
+        """Async generator over the compressed stream, reading off the event loop."""
+        self._claim(fd)
+        stream = os.fdopen(fd, "rb", buffering=0)
+        try:
+            while True:
+                chunk = await asyncio.to_thread(stream.read, STREAM_CHUNK_SIZE)
+                if not chunk:
+                    return
+                self.sent += len(chunk)
+                if on_bytes:
+                    on_bytes(self.sent)
+                yield chunk
+        finally:
+            stream.close()
+
+    async def wait(self):
+        """Waits for every stage; raises if any of them failed."""
+        for process, name in zip(self.processes, ("tar", "zstd", "upload")):
+            code = await process.wait()
+            if code != 0:
+                raise RuntimeError(f"{name} exited with code {code} while streaming the archive.")
+
+    async def kill(self):
+        # An upload that failed before reading anything never started the generator that closes it
+        if self._reader_fd is not None:
+            os.close(self._reader_fd)
+            self._reader_fd = None
+        leader = self.leader
+        if leader is None:
+            return
+        try:
+            os.killpg(os.getpgid(leader.pid), signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        for process in self.processes:
+            try:
+                await process.wait()
+            except Exception:
+                pass
@@ -0,0 +1,281 @@
+import re
+import time
+import shlex
+import socket
+import secrets
+import asyncio
+import logging
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from .database import db_config
+from .progress import parse_size
+from .utils import update_task_status
+
+logger = logging.getLogger(__name__)
+
+DOWN = "down"
+UP = "up"
+
+ADJUST_INTERVAL = 5  # seconds between live rclone limit adjustments
+# A transfer using less than its share is assumed to need this much more than it currently uses
+DEMAND_HEADROOM = 1.25
+MIN_SHARE = 64 * 1024  # never throttle a transfer below this (bytes/s)
+RC_TIMEOUT = 3
+
+# What the controller can split; anything else rclone accepts (timetables, "up:down" pairs) is passed through
+_PLAIN_LIMIT_RE = re.compile(r'^\s*[\d.]+\s*[KMGT]?(?:i?B)?\s*$', re.IGNORECASE)
+
+
+def _parse_limit(value) -> int:
+    """'4M', '512K', '1048576' -> bytes/s; '', 'off' or invalid -> 0 (unlimited)."""
+    value = str(value or "").strip()
+    if not value or value.lower() == "off":
+        return 0
+    return parse_size(value)
+
+
+def _passthrough_limit(value) -> Optional[str]:
+    """A requested limit the controller cannot interpret, to be handed to the tool as given; else None."""
+    value = str(value or "").strip()
+    if not value or value.lower() == "off" or _PLAIN_LIMIT_RE.match(value):
+        return None
+    return value
+
+
+def parse_schedule(schedule: str) -> List[Tuple[int, int, int]]:
+    """
+    Parses 'HH:MM,DOWN,UP' entries separated by ';' or newlines, e.g.
+    '08:00,2M,512K; 23:00,off,off', into sorted (minute_of_day, down, up) tuples.
+    Each entry applies from its time until the next one (wrapping around midnight).
+    """
+    entries = []
+    for raw in (schedule or "").replace("\n", ";").split(";"):
+        parts = [p.strip() for p in raw.split(",")]
+        if len(parts) < 2 or not parts[0]:
+            continue
+        try:
+            hours, minutes = parts[0].split(":")
+            minute_of_day = int(hours) * 60 + int(minutes)
+        except ValueError:
+            logger.warning(f"[Bandwidth] Ignoring invalid schedule entry: {raw.strip()}")
+            continue
+        down = _parse_limit(parts[1])
+        up = _parse_limit(parts[2]) if len(parts) > 2 else down
+        entries.append((minute_of_day % (24 * 60), down, up))
+    return sorted(entries)
+
+
+def get_global_limits(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Returns the total {down, up} bandwidth in bytes/s (0 = unlimited) in effect right now."""
+    limits = {
+        DOWN: _parse_limit(db_config.get_config("WDM_GLOBAL_DOWNLOAD_LIMIT", "")),
+        UP: _parse_limit(db_config.get_config("WDM_GLOBAL_UPLOAD_LIMIT", "")),
+    }
+    schedule = parse_schedule(db_config.get_config("WDM_BANDWIDTH_SCHEDULE", ""))
+    if schedule:
+        now = now or datetime.now()
+        minute_of_day = now.hour * 60 + now.minute
+        # The last entry before now; before the first entry of the day, yesterday's last one
+        started = [entry for entry in schedule if entry[0] <= minute_of_day]
+        _, down, up = started[-1] if started else schedule[-1]
+        limits = {DOWN: down, UP: up}
+    return limits
+
+
+def global_limit_configured(direction: str) -> bool:
+    """True if a global limit or a schedule may throttle this direction (now or later today)."""
+    if parse_schedule(db_config.get_config("WDM_BANDWIDTH_SCHEDULE", "")):
+        return True
+    key = "WDM_GLOBAL_DOWNLOAD_LIMIT" if direction == DOWN else "WDM_GLOBAL_UPLOAD_LIMIT"
+    return _parse_limit(db_config.get_config(key, "")) > 0
+
+
+def fair_shares(total: int, demands: List[Optional[float]]) -> List[int]:
+    """
+    Max-min fair split of `total` bytes/s. A transfer with a known demand lower than an equal
+    share gets its demand; what it leaves unused is split among the others.
+    Unknown demand (None) means "as much as possible".
+    """
+    shares = [0] * len(demands)
+    pending = list(range(len(demands)))
+    remaining = total
+    while pending:
+        equal = remaining / len(pending)
+        satisfied = [i for i in pending if demands[i] is not None and demands[i] < equal]
+        if not satisfied:
+            for i in pending:
+                shares[i] = int(equal)
+            break
+        for i in satisfied:
+            shares[i] = int(demands[i])
+            remaining -= demands[i]
+            pending.remove(i)
+    return [max(MIN_SHARE, share) for share in shares]
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Transfer:
+    """One running download or upload subprocess that draws from the global bandwidth."""
+
+    def __init__(self, task_id: str, direction: str, cap: int = 0, progress=None, passthrough: Optional[str] = None):
+        self.task_id = task_id
+        self.direction = direction
+        self.cap = cap  # the job's own limit, bytes/s (0 = none)
+        self.passthrough = passthrough  # the job's own limit in a form only the tool understands
+        self.progress = progress
+        self.rc_port: Optional[int] = None
+        self.rc_auth: Optional[Tuple[str, str]] = None  # random per-transfer rc credentials
+        self.rc_stats: Optional[dict] = None  # last rclone core/stats response
+        self.limit = 0
+        self.speed: Optional[float] = None
+        self.started_at = time.time()
+
+    def rclone_flags(self) -> str:
+        """rc server flags (for live limit changes, only under a global limit) plus the starting --bwlimit."""
+        if self.passthrough:
+            return f" --bwlimit {shlex.quote(self.passthrough)}"
+        flags = ""
+        if global_limit_configured(self.direction):
+            self.rc_port = _free_port()
+            # Without auth any local process could reach the rc API (change limits, stop rclone, read files)
+            self.rc_auth = ("wdm", secrets.token_urlsafe(16))
+            flags = f" --rc --rc-addr 127.0.0.1:{self.rc_port} --rc-user {self.rc_auth[0]} --rc-pass {self.rc_auth[1]}"
+        if self.limit:
+            # rclone reads a bare number as KiB/s; the limit is in bytes/s
+            flags += f" --bwlimit {self.limit}B"
+        return flags
+
+    def mask(self, command: str) -> str:
+        """The command with the rc password hidden, for logs."""
+        return command.replace(self.rc_auth[1], "***") if self.rc_auth else command
+
+    def rate_limit(self) -> Optional[str]:
+        """The starting limit as a downloader argument (bytes/s), or None if unlimited."""
+        if self.passthrough:
+            return self.passthrough
+        return str(self.limit) if self.limit else None
+
+
+class BandwidthController:
+    """
+    Splits the configured global download/upload bandwidth across all running transfers.
+    Downloaders get their share when they start; rclone uploads are re-balanced live
+    through their rc API using the speeds they actually reach.
+    """
+
+    def __init__(self):
+        self._transfers: List[Transfer] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def _rebalance(self, direction: str):
+        # Transfers with a passthrough limit keep it; the controller cannot tell what they may use
+        transfers = [t for t in self._transfers if t.direction == direction and not t.passthrough]
+        total = get_global_limits()[direction]
+        if not transfers:
+            return
+        if not total:
+            for t in transfers:
+                t.limit = t.cap
+            return
+        demands = []
+        for t in transfers:
+            demand = t.speed * DEMAND_HEADROOM if t.speed is not None and time.time() - t.started_at > 2 * ADJUST_INTERVAL else None
+            if t.cap:
+                demand = min(demand, t.cap) if demand is not None else t.cap
+            demands.append(demand)
+        for t, share in zip(transfers, fair_shares(total, demands)):
+            t.limit = min(share, t.cap) if t.cap else share
+
+    def start(self, task_id: str, direction: str, requested_limit: Optional[str] = None, progress=None) -> Transfer:
+        """Registers a transfer and computes its starting share. Pair with finish()."""
+        passthrough = _passthrough_limit(requested_limit)
+        if passthrough:
+            logger.info(f"[Bandwidth] Task {task_id}: passing limit '{passthrough}' through unchanged, outside the global split")
+        transfer = Transfer(task_id, direction, 0 if passthrough else _parse_limit(requested_limit), progress, passthrough)
+        self._transfers.append(transfer)
+        self._rebalance(direction)
+        self._ensure_running()
+        return transfer
+
+    def finish(self, transfer: Transfer):
+        """Unregisters a transfer (idempotent) and hands its share back to the others."""
+        if transfer not in self._transfers:
+            return
+        self._transfers.remove(transfer)
+        self._rebalance(transfer.direction)
+        update_task_status(transfer.task_id, {"bandwidth": None})
+
+    @contextmanager
+    def track(self, task_id: str, direction: str, requested_limit: Optional[str] = None, progress=None):
+        """Registers a transfer for the duration of a block."""
+        transfer = self.start(task_id, direction, requested_limit, progress)
+        try:
+            yield transfer
+        finally:
+            self.finish(transfer)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _poll_rclone_speed(self, client: httpx.AsyncClient, transfer: Transfer):
+        try:
+            response = await client.post(f"http://127.0.0.1:{transfer.rc_port}/core/stats", auth=transfer.rc_auth, timeout=RC_TIMEOUT)
+            transfer.rc_stats = response.json()
+            transfer.speed = float(transfer.rc_stats.get("speed", 0))
+        except Exception:
+            # rclone not listening yet, or between retries
+            pass
+
+    async def _apply_rclone_limit(self, client: httpx.AsyncClient, transfer: Transfer):
+        rate = f"{transfer.limit}B" if transfer.limit else "off"
+        try:
+            await client.post(f"http://127.0.0.1:{transfer.rc_port}/core/bwlimit", json={"rate": rate}, auth=transfer.rc_auth, timeout=RC_TIMEOUT)
+        except Exception:
+            pass
+
+    async def _run(self):
+        async with httpx.AsyncClient() as client:
+            while self._transfers:
+                await asyncio.sleep(ADJUST_INTERVAL)
+                uploads = [t for t in self._transfers if t.rc_port]
+                await asyncio.gather(*(self._poll_rclone_speed(client, t) for t in uploads))
+                for t in self._transfers:
+                    if t.progress is not None:
+                        t.speed = t.progress.rate
+
+                previous = {id(t): t.limit for t in uploads}
+                self._rebalance(DOWN)
+                self._rebalance(UP)
+                await asyncio.gather(*(self._apply_rclone_limit(client, t) for t in uploads if previous[id(t)] != t.limit))
+
+                for t in list(self._transfers):
+                    update_task_status(t.task_id, {"bandwidth": {
+                        "direction": t.direction,
+                        "limit": t.limit,
+                        "speed": round(t.speed, 1) if t.speed is not None else None,
+                    }})
+
+    def stats(self) -> dict:
+        limits = get_global_limits()
+        result = {}
+        for direction in (DOWN, UP):
+            transfers = [t for t in self._transfers if t.direction == direction]
+            result[direction] = {
+                "limit": limits[direction],
+                "transfers": len(transfers),
+                "speed": round(sum(t.speed or 0 for t in transfers), 1),
+            }
+        return result
+
+
+bandwidth_controller = BandwidthController()
@@ -27,6 +27,9 @@ if TMP_DIR.exists():
 DOWNLOADS_DIR = DATA_ROOT / "downloads"
 ARCHIVES_DIR = DATA_ROOT / "archives"
 STATUS_DIR = DATA_ROOT / "status"
+# Downloads kept after a job by the retention policy; outside TMP_DIR so a restart does not wipe them,
+# on the same filesystem so they can be hardlinks
+RETAINED_DIR = BASE_DIR / "retained"
 
 # Create directories
 os.makedirs(DOWNLOADS_DIR, exist_ok=True)
@@ -44,6 +47,10 @@ AVATAR_URL = os.getenv("AVATAR_URL", "https://github.com/Jyf0214.png")
 # Database is placed at the same level as TMP_DIR (inside BASE_DIR) so it is NOT cleared
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR / 'webdl-manager.db'}")
 
+# --- Proxy Pool ---
+# Scored proxies survive restarts, so auto_proxy jobs start from a warm pool
+PROXY_POOL_FILE = BASE_DIR / "proxy_pool.json"
+
 # --- Redis Configuration ---
 # Upstash Redis Connection String, e.g., "rediss://:password@endpoint:port"
 REDIS_URL = os.getenv("REDIS_URL")
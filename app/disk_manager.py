@@ -0,0 +1,243 @@
+import json
+import time
+import shutil
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import DATA_ROOT, DOWNLOADS_DIR, ARCHIVES_DIR, STATUS_DIR
+from .database import db_config
+from .task_log import append_log
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_FREE_GB = 2  # admission stops while less than this would be left
+DEFAULT_JOB_RESERVE_GB = 1  # assumed size of a job whose download size is not known yet
+ADMISSION_RECHECK = 30  # seconds; space also frees up outside our control
+JANITOR_INTERVAL = 600  # seconds
+ORPHAN_GRACE = 3600  # seconds an unclaimed entry must sit untouched before it is removed
+RCLONE_CONFIG_DIR = Path("/tmp/rclone_configs")
+FINISHED_STATES = ("completed", "failed")
+
+
+def _get_gb(key: str, default: float) -> int:
+    try:
+        value = float(db_config.get_config(key, default) or default)
+    except (TypeError, ValueError):
+        value = default
+    return int(max(0.0, value) * 1024 ** 3)
+
+
+def get_disk_settings() -> tuple:
+    """Returns (min_free_bytes, default_job_reserve_bytes)."""
+    return (_get_gb("WDM_DISK_MIN_FREE_GB", DEFAULT_MIN_FREE_GB),
+            _get_gb("WDM_DISK_JOB_RESERVE_GB", DEFAULT_JOB_RESERVE_GB))
+
+
+class DiskReservation:
+    """
+    Space a running job is still expected to write. `expected` is the job's total for the current
+    phase (a default guess, the size from the remote listing, then the archive size); what the
+    progress tracker reports as already written is no longer reserved, it shows up in the free space.
+    """
+
+    def __init__(self, task_id: str, expected: int, archive_name: Optional[str] = None):
+        self.task_id = task_id
+        self.expected = expected
+        self.archive_name = archive_name
+        self.progress = None
+        self.started_at = time.time()
+
+    def outstanding(self) -> int:
+        written = getattr(self.progress, "bytes_downloaded", 0) if self.progress is not None else 0
+        return max(0, self.expected - written)
+
+
+class DiskManager:
+    """
+    Admits jobs only while the data volume keeps WDM_DISK_MIN_FREE_GB free after everything the
+    running jobs are still expected to write, so one volume filling up does not fail every job at
+    once. A job that does not fit waits until others finish (or space is freed elsewhere).
+    """
+
+    def __init__(self):
+        self._reservations: Dict[str, DiskReservation] = {}
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def free_space(self) -> int:
+        try:
+            return shutil.disk_usage(DATA_ROOT).free
+        except OSError:
+            return 0
+
+    def reserved(self) -> int:
+        return sum(reservation.outstanding() for reservation in self._reservations.values())
+
+    def available(self) -> int:
+        """Free space left once every running job has written what it is expected to."""
+        return self.free_space() - self.reserved()
+
+    async def admit(self, task_id: str, archive_name: Optional[str] = None, status_file: Optional[Path] = None) -> DiskReservation:
+        """Waits until the job's default reservation fits above the free-space threshold, then reserves it."""
+        condition = self._get_condition()
+        announced = False
+        async with condition:
+            while True:
+                min_free, reserve = get_disk_settings()
+                available = await asyncio.to_thread(self.available)
+                # With nothing else running there is nothing to wait for; let the job try
+                if available - reserve >= min_free or not self._reservations:
+                    break
+                if not announced:
+                    logger.info(f"[Disk] Task {task_id} waiting for disk space ({available // 1024 ** 2} MB available after reservations)")
+                    append_log(status_file, f"Waiting for disk space ({available // 1024 ** 2} MB available, {min_free // 1024 ** 2} MB must stay free)...\n")
+                    announced = True
+                try:
+                    await asyncio.wait_for(condition.wait(), timeout=ADMISSION_RECHECK)
+                except asyncio.TimeoutError:
+                    pass
+            reservation = DiskReservation(task_id, reserve, archive_name)
+            self._reservations[task_id] = reservation
+        if announced:
+            append_log(status_file, "Disk space available, starting.\n")
+        return reservation
+
+    def track(self, task_id: str, progress):
+        """Counts the progress tracker's written bytes against the reservation."""
+        reservation = self._reservations.get(task_id)
+        if reservation is not None:
+            reservation.progress = progress
+
+    def expect(self, task_id: str, size: int, progress=None):
+        """Replaces the job's estimate, e.g. with the size from the remote listing or the archive size to come."""
+        reservation = self._reservations.get(task_id)
+        if reservation is None:
+            return
+        reservation.expected = max(0, int(size))
+        reservation.progress = progress
+
+    async def release(self, task_id: str):
+        """Drops the job's reservation (no-op if it holds none) and wakes waiting jobs."""
+        if self._reservations.pop(task_id, None) is None:
+            return
+        await self.wake()
+
+    async def wake(self):
+        """Lets waiting jobs re-check the free space."""
+        condition = self._get_condition()
+        async with condition:
+            condition.notify_all()
+
+    def is_active(self, task_id: str) -> bool:
+        return task_id in self._reservations
+
+    def archive_names(self) -> List[str]:
+        return [r.archive_name for r in self._reservations.values() if r.archive_name]
+
+    def stats(self) -> dict:
+        min_free, reserve = get_disk_settings()
+        free = self.free_space()
+        reserved = self.reserved()
+        return {
+            "free": free,
+            "reserved": reserved,
+            "available": free - reserved,
+            "min_free": min_free,
+            "job_reserve": reserve,
+            "jobs": {task_id: r.outstanding() for task_id, r in self._reservations.items()},
+        }
+
+
+disk_manager = DiskManager()
+
+
+def _task_finished(task_id: str) -> bool:
+    """True if no job of this task is running: no reservation and no status, or a final one."""
+    if disk_manager.is_active(task_id):
+        return False
+    try:
+        with open(STATUS_DIR / f"{task_id}.json", "r", encoding="utf-8") as f:
+            status = json.load(f).get("status")
+    except (OSError, ValueError):
+        return True
+    return status in FINISHED_STATES
+
+
+def _stale(path: Path, now: float) -> bool:
+    try:
+        return now - path.stat().st_mtime > ORPHAN_GRACE
+    except OSError:
+        return False
+
+
+def _remove(path: Path) -> int:
+    """Deletes a file or tree; returns the bytes freed."""
+    try:
+        if path.is_dir() and not path.is_symlink():
+            size = sum(f.stat().st_size for f in path.rglob("*") if f.is_file() and not f.is_symlink())
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            size = path.stat().st_size
+            path.unlink()
+        return size
+    except OSError:
+        return 0
+
+
+def clean_orphans() -> dict:
+    """
+    Removes what crashed or killed jobs left behind: download directories and rclone configs of
+    tasks that are no longer running, and archives no running job can have produced. Entries
+    touched within ORPHAN_GRACE are left alone.
+    """
+    now = time.time()
+    removed = []
+    freed = 0
+
+    if DOWNLOADS_DIR.exists():
+        for path in DOWNLOADS_DIR.iterdir():
+            # Only a running job (which holds a reservation from admission to cleanup) owns one
+            if _stale(path, now) and not disk_manager.is_active(path.name):
+                freed += _remove(path)
+                removed.append(str(path))
+
+    if ARCHIVES_DIR.exists():
+        # Archives are named after the URL, not the task; keep anything a running job may own
+        active_names = disk_manager.archive_names()
+        for path in ARCHIVES_DIR.iterdir():
+            if any(path.name.startswith(name) for name in active_names):
+                continue
+            if _stale(path, now):
+                freed += _remove(path)
+                removed.append(str(path))
+
+    if RCLONE_CONFIG_DIR.exists():
+        for path in RCLONE_CONFIG_DIR.glob("*.conf"):
+            # <task_id>.conf or <task_id>_<destination hash>.conf
+            task_id = path.stem.split("_")[0]
+            if _stale(path, now) and _task_finished(task_id):
+                freed += _remove(path)
+                removed.append(str(path))
+
+    if removed:
+        logger.info(f"[Disk] Removed {len(removed)} orphaned entries ({freed // 1024 ** 2} MB): {', '.join(removed[:10])}")
+    return {"removed": removed, "freed": freed}
+
+
+async def disk_janitor():
+    """Background loop removing orphaned downloads, archives and rclone configs."""
+    while True:
+        await asyncio.sleep(JANITOR_INTERVAL)
+        try:
+            result = await asyncio.to_thread(clean_orphans)
+            if result["removed"]:
+                # Freed space may let a waiting job in
+                await disk_manager.wake()
+        except Exception as e:
+            logger.error(f"[Disk] Janitor run failed: {e}")
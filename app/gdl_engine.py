@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import shlex
+import asyncio
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from .database import db_config
+from .config import PROJECT_ROOT
+from .utils import update_task_status
+from .task_log import append_log, flush_log
+from .watchdog import ProcessWatchdog
+from .site_budget import site_budget
+from .retry_policy import TRANSIENT, classify_failure, should_retry, get_retry_delay, max_attempts, read_output_tail
+
+logger = logging.getLogger(__name__)
+
+# Warm workers kept around between jobs; matches the global task concurrency
+MAX_IDLE_WORKERS = 2
+WORKER_START_TIMEOUT = 120  # seconds to import gallery-dl and all extractors
+
+
+def use_inprocess_engine() -> bool:
+    """True if gallery-dl jobs should run in warm worker processes instead of one CLI subprocess each."""
+    if getattr(sys, 'frozen', False):
+        # A PyInstaller binary cannot start `python -m app.gdl_worker`
+        return False
+    return str(db_config.get_config("WDM_GALLERY_DL_ENGINE", "subprocess")).lower() == "inprocess"
+
+
+def parse_extra_options(extra_args: str, status_file: Optional[Path] = None) -> dict:
+    """
+    Converts the `-o key=value` options from WDM_GALLERY_DL_ARGS into a nested config dict.
+    Other command line flags have no in-process equivalent and are skipped with a note in the log.
+    """
+    options = {}
+    try:
+        args = shlex.split(extra_args or "")
+    except ValueError:
+        args = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ("-o", "--option") and i + 1 < len(args):
+            key, _, raw_value = args[i + 1].partition("=")
+            try:
+                value = json.loads(raw_value)
+            except ValueError:
+                value = raw_value
+            path = key.split(".")
+            node = options
+            for part in path[:-1]:
+                node = node.setdefault(part, {})
+            node[path[-1]] = value
+            i += 2
+            continue
+        append_log(status_file, f"Ignoring gallery-dl argument not supported by the in-process engine: {arg}\n")
+        i += 1
+    return options
+
+
+def merge_config(base: dict, extra: dict) -> dict:
+    for key, value in extra.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge_config(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+class _Worker:
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def read_event(self) -> Optional[dict]:
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                return None
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+
+
+class GalleryDlWorkerPool:
+    """Keeps gallery-dl worker processes warm so interpreter start-up and extractor imports are paid once."""
+
+    def __init__(self):
+        self._idle: List[_Worker] = []
+
+    async def _spawn(self) -> _Worker:
+        env = os.environ.copy()
+        env["PYTHONUNBUFFERED"] = "1"
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(PROJECT_ROOT), env.get("PYTHONPATH")]))
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "app.gdl_worker",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=str(PROJECT_ROOT),
+            # Own process group, so pause/resume and the stall watchdog only touch this worker
+            preexec_fn=os.setsid,
+            env=env
+        )
+        worker = _Worker(process)
+        event = await asyncio.wait_for(worker.read_event(), timeout=WORKER_START_TIMEOUT)
+        if not event or event.get("event") != "ready":
+            process.kill()
+            message = event.get("message") if event else "worker exited during start-up"
+            raise RuntimeError(f"gallery-dl worker failed to start: {message}")
+        return worker
+
+    async def acquire(self) -> _Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.alive:
+                return worker
+        return await self._spawn()
+
+    def release(self, worker: _Worker):
+        if worker.alive and len(self._idle) < MAX_IDLE_WORKERS:
+            self._idle.append(worker)
+        elif worker.alive:
+            worker.process.stdin.close()
+
+    async def shutdown(self):
+        workers, self._idle = self._idle, []
+        for worker in workers:
+            if worker.alive:
+                worker.process.stdin.close()
+                try:
+                    await asyncio.wait_for(worker.process.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    worker.process.kill()
+
+
+worker_pool = GalleryDlWorkerPool()
+
+
+async def _run_once(url: str, config_data: dict, status_file: Path, task_id: str, progress) -> int:
+    """Runs one attempt on a warm worker and returns gallery-dl's exit code (negative if the worker died)."""
+    worker = await worker_pool.acquire()
+    request = {"url": url, "config": config_data, "verbose": True}
+    worker.process.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+    await worker.process.stdin.drain()
+
+    update_task_status(task_id, {"pgid": worker.process.pid})
+    watchdog = ProcessWatchdog(task_id, worker.process, status_file, progress=progress).start()
+    code = None
+    try:
+        while True:
+            event = await worker.read_event()
+            if event is None:
+                # Worker died (crash or killed by the watchdog)
+                await worker.process.wait()
+                code = worker.process.returncode if worker.process.returncode < 0 else -1
+                break
+            kind = event.get("event")
+            if kind == "exit":
+                code = event.get("code", 1)
+                break
+            if kind == "log":
+                append_log(status_file, event.get("message", "") + "\n")
+            elif kind == "skip":
+                append_log(status_file, f"# {event.get('path')}\n")
+                if progress is not None:
+                    progress.record("skip")
+            elif kind == "success":
+                append_log(status_file, f"{event.get('path')}\n")
+                if progress is not None:
+                    progress.record("done", (Path(event.get("path", "")).name, event.get("size", 0)))
+            elif kind == "start":
+                if progress is not None:
+                    progress.current_file = Path(event.get("path", "")).name
+                    progress.record("active")
+            elif kind == "progress" and progress is not None:
+                progress.record("active")
+            if progress is not None:
+                progress.publish()
+    finally:
+        watchdog.stop()
+        # A finished attempt also ends a stall flagged on an earlier one
+        update_task_status(task_id, {"pgid": None, "stall": None} if code == 0 else {"pgid": None})
+        if code is None or code < 0:
+            # Cancelled or crashed mid-job: never hand a busy worker to the next job
+            if worker.alive:
+                worker.process.kill()
+        else:
+            worker_pool.release(worker)
+        if progress is not None:
+            progress.publish(force=True)
+    return code
+
+
+async def run_gallery_dl_inprocess(url: str, config_data: dict, status_file: Path, task_id: str, progress=None):
+    """
+    Runs a gallery-dl download on a warm worker with the same retry policy as run_command.
+    Per-file events go straight into the progress tracker instead of being parsed from text.
+    """
+    last_error = None
+    attempt = 0
+    while True:
+        attempt += 1
+        if attempt > 1:
+            await site_budget.wait_for_backoff(task_id, status_file)
+        append_log(status_file, f"\n[Attempt {attempt}] Running gallery-dl in-process for {url}\n")
+        await flush_log(status_file)
+        try:
+            output_start = os.path.getsize(status_file)
+        except OSError:
+            output_start = 0
+
+        try:
+            code = await _run_once(url, config_data, status_file, task_id, progress)
+        except Exception as e:
+            append_log(status_file, f"\n--- EXCEPTION DURING IN-PROCESS DOWNLOAD (Attempt {attempt}) ---\nException: {e}\n")
+            last_error = e
+            category = TRANSIENT
+        else:
+            if code == 0:
+                append_log(status_file, f"\n[Attempt {attempt}] Task finished successfully.\n")
+                site_budget.report(task_id, None)
+                return
+            await flush_log(status_file)
+            output = await asyncio.to_thread(read_output_tail, status_file, output_start)
+            category = classify_failure("gallery-dl", code, output or "")
+            site_budget.report(task_id, category)
+            append_log(status_file, f"\n--- TASK FAILED (Attempt {attempt}, Exit Code: {code}, Class: {category}) ---\n")
+            last_error = RuntimeError(f"gallery-dl failed with exit code {code}.")
+
+        if attempt >= max_attempts() or not should_retry(category, attempt):
+            break
+        retry_delay = get_retry_delay(category, attempt)
+        update_task_status(task_id, {"retry": {"attempt": attempt, "class": category, "delay": round(retry_delay)}})
+        append_log(status_file, f"Waiting {retry_delay:.0f} seconds before retry ({category})...\n")
+        await asyncio.sleep(retry_delay)
+
+    append_log(status_file, f"\n--- ALL RETRY ATTEMPTS FAILED ---\nFinal error: {last_error}\n")
+    raise last_error
@@ -0,0 +1,135 @@
+"""
+Long-lived gallery-dl worker, started by gdl_engine as `python -m app.gdl_worker`.
+
+Reads one JSON job per line from stdin ({"url": ..., "config": {...}, "verbose": bool}),
+runs it with gallery_dl.job.DownloadJob in this process and writes JSON events to stdout:
+ready, log, start, skip, success, progress and finally exit (with gallery-dl's exit code).
+
+This module must not import anything from the app package: importing app.config
+would wipe the download directories of the running server.
+"""
+import os
+import sys
+import json
+import logging
+import threading
+
+_protocol_lock = threading.Lock()
+_protocol_out = None
+
+
+def emit(event: str, **fields):
+    fields["event"] = event
+    line = json.dumps(fields, ensure_ascii=False)
+    with _protocol_lock:
+        _protocol_out.write(line + "\n")
+        _protocol_out.flush()
+
+
+class _EventStream:
+    """Stands in for sys.stdout/sys.stderr so stray prints become log events instead of corrupting the protocol."""
+
+    def __init__(self):
+        self._pending = ""
+
+    def write(self, text):
+        self._pending += text
+        while "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            if line:
+                emit("log", message=line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class _EventLogHandler(logging.Handler):
+    def emit(self, record):
+        try:
+            emit("log", message=self.format(record), level=record.levelname.lower())
+        except Exception:
+            pass
+
+
+class _EventOutput:
+    """gallery-dl output backend that reports per-file events instead of printing paths."""
+
+    def start(self, path, *args):
+        emit("start", path=path)
+
+    def skip(self, path, *args):
+        emit("skip", path=path)
+
+    def success(self, path, *args):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        emit("success", path=path, size=size)
+
+    def progress(self, bytes_total, bytes_downloaded, bytes_per_second, *args):
+        emit("progress", total=bytes_total, downloaded=bytes_downloaded, rate=bytes_per_second)
+
+
+def _apply_config(config_module, data: dict, path=()):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            _apply_config(config_module, value, path + (key,))
+        else:
+            config_module.set(path, key, value)
+
+
+def _run_job(request: dict) -> int:
+    from gallery_dl import config, job
+
+    config.clear()
+    # Same as the CLI: the user's own config files first, the job's options on top
+    config.load()
+    _apply_config(config, request.get("config") or {})
+
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG if request.get("verbose") else logging.INFO)
+    download_job = job.DownloadJob(request["url"])
+    download_job.out = _EventOutput()
+    return download_job.run()
+
+
+def main():
+    global _protocol_out
+    # Keep a private handle on the real stdout for events; everything else printed goes through _EventStream
+    _protocol_out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr = _EventStream()
+
+    handler = _EventLogHandler()
+    handler.setFormatter(logging.Formatter("[%(name)s][%(levelname)s] %(message)s"))
+    logging.getLogger().addHandler(handler)
+
+    try:
+        # Importing the extractors once here is the cost every subprocess run used to pay
+        import gallery_dl.job
+        from gallery_dl import extractor
+        extractor.extractors()
+    except Exception as e:
+        emit("fatal", message=f"gallery-dl is not available: {e}")
+        return 1
+    emit("ready", pid=os.getpid())
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            code = _run_job(json.loads(line))
+        except Exception as e:
+            logging.getLogger("gallery-dl").exception(f"Job crashed: {e}")
+            code = 1
+        emit("exit", code=int(code or 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
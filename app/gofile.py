@@ -0,0 +1,324 @@
+import time
+import uuid
+import random
+import asyncio
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+
+from .database import db_config
+from .task_log import append_log
+
+logger = logging.getLogger(__name__)
+
+SERVERS_URL = "https://api.gofile.io/servers"
+SERVER_LIST_TTL = 600  # seconds a fetched server list is reused
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 0.5  # seconds between progress callbacks (the last one always fires)
+THROUGHPUT_ALPHA = 0.3  # EWMA weight of the newest upload speed sample
+FAILURE_PENALTY = 0.5  # a failed upload halves a server's score
+DEFAULT_CONCURRENCY = 3  # archives uploaded at the same time per job
+
+
+class GofileError(Exception):
+    """Custom exception for Gofile operations."""
+    pass
+
+
+def _log(status_file: Optional[Path], message: str):
+    if status_file:
+        append_log(status_file, message + "\n")
+
+
+def get_upload_concurrency() -> int:
+    """Archives of one job uploaded to gofile at the same time (WDM_GOFILE_CONCURRENCY)."""
+    try:
+        return max(1, int(db_config.get_config("WDM_GOFILE_CONCURRENCY", DEFAULT_CONCURRENCY) or DEFAULT_CONCURRENCY))
+    except (TypeError, ValueError):
+        return DEFAULT_CONCURRENCY
+
+
+class ServerCache:
+    """
+    Gofile's upload server list, cached for SERVER_LIST_TTL and ordered by the throughput
+    past uploads reached on each server (EWMA, bytes/s). Servers without history get the
+    median score of the known ones, so new servers are tried but do not jump the queue.
+    """
+
+    def __init__(self):
+        self._servers: List[str] = []
+        self._fetched_at = 0.0
+        self._scores: Dict[str, float] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self, client: httpx.AsyncClient, status_file: Optional[Path] = None) -> List[str]:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._servers or time.time() - self._fetched_at > SERVER_LIST_TTL:
+                _log(status_file, "Fetching Gofile server list...")
+                try:
+                    response = await client.get(SERVERS_URL, timeout=60)
+                    response.raise_for_status()
+                    data = response.json()
+                    if data.get("status") != "ok":
+                        raise GofileError(f"Gofile API did not return 'ok' for server list: {data}")
+                    self._servers = [server["name"] for server in data["data"]["servers"]]
+                    self._fetched_at = time.time()
+                except Exception as e:
+                    if not self._servers:
+                        raise GofileError(f"Could not fetch Gofile server list: {e}") from e
+                    # A stale list is better than none
+                    _log(status_file, f"Could not refresh Gofile server list ({e}); using the cached one.")
+        return self.ranked()
+
+    def ranked(self) -> List[str]:
+        known = sorted(self._scores[s] for s in self._servers if s in self._scores)
+        default = known[len(known) // 2] if known else 0.0
+        servers = list(self._servers)
+        random.shuffle(servers)  # random order among equal scores
+        return sorted(servers, key=lambda s: self._scores.get(s, default), reverse=True)
+
+    def record(self, server: str, throughput: Optional[float]):
+        """Feeds back an upload result: bytes/s on success, None on failure."""
+        previous = self._scores.get(server)
+        if throughput is None:
+            if previous is not None:
+                self._scores[server] = previous * FAILURE_PENALTY
+            return
+        self._scores[server] = throughput if previous is None else THROUGHPUT_ALPHA * throughput + (1 - THROUGHPUT_ALPHA) * previous
+
+    def stats(self) -> dict:
+        return {
+            "servers": len(self._servers),
+            "age": round(time.time() - self._fetched_at) if self._fetched_at else None,
+            "scores": {s: round(v) for s, v in sorted(self._scores.items(), key=lambda kv: -kv[1])},
+        }
+
+
+server_cache = ServerCache()
+
+
+def _multipart_parts(boundary: str, fields: Dict[str, str], file_name: str) -> tuple:
+    """Returns (head bytes, tail bytes) around the file content of a multipart/form-data body."""
+    head = b""
+    for name, value in fields.items():
+        head += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n").encode("utf-8")
+    safe_name = file_name.replace('"', "_")
+    head += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{safe_name}\"\r\n"
+             f"Content-Type: application/octet-stream\r\n\r\n").encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return head, tail
+
+
+async def _stream_body(head: bytes, file_path: Path, tail: bytes, file_size: int,
+                       progress: Optional[Callable[[int, int], None]]) -> AsyncIterator[bytes]:
+    """Yields the multipart body, reading the file in chunks off the event loop and reporting progress."""
+    yield head
+    sent = 0
+    last_report = 0.0
+    f = await asyncio.to_thread(open, file_path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+            sent += len(chunk)
+            now = time.monotonic()
+            if progress and (now - last_report >= PROGRESS_INTERVAL or sent >= file_size):
+                last_report = now
+                progress(sent, file_size)
+    finally:
+        await asyncio.to_thread(f.close)
+    yield tail
+
+
+class GofileUploader:
+    """
+    Uploads files to gofile.io over one pooled connection pool per job. Files are streamed as a
+    multipart body (never read into memory) and servers are tried fastest-first.
+    Call aclose() (or use it as an async context manager) when the job is done.
+    """
+
+    def __init__(self, status_file: Optional[Path] = None, api_token: Optional[str] = None, folder_id: Optional[str] = None):
+        self.status_file = status_file
+        self.api_token = api_token
+        self.folder_id = folder_id
+        # Set once a public upload created a folder, so later files can join it
+        self.guest_token: Optional[str] = None
+        self.guest_folder: Optional[str] = None
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(300, connect=30))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def _fields(self, upload_type: str) -> Dict[str, str]:
+        if upload_type == "authenticated":
+            fields = {"token": self.api_token}
+            if self.folder_id:
+                fields["folderId"] = self.folder_id
+            return fields
+        if upload_type == "guest folder":
+            return {"token": self.guest_token, "folderId": self.guest_folder}
+        return {}
+
+    async def _upload_to(self, server: str, file_path: Path, fields: Dict[str, str],
+                         progress: Optional[Callable[[int, int], None]]) -> dict:
+        boundary = uuid.uuid4().hex
+        head, tail = _multipart_parts(boundary, fields, file_path.name)
+        file_size = file_path.stat().st_size
+        headers = {
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + file_size + len(tail)),
+        }
+        started = time.monotonic()
+        response = await self.client.post(
+            f"https://{server}.gofile.io/uploadFile",
+            content=_stream_body(head, file_path, tail, file_size, progress),
+            headers=headers
+        )
+        response.raise_for_status()
+        result = response.json()
+        if result.get("status") != "ok":
+            raise GofileError(f"Gofile API returned an error: {result}")
+        server_cache.record(server, file_size / max(time.monotonic() - started, 0.001))
+        result["data"]["server"] = server
+        return result["data"]
+
+    async def _attempt(self, file_path: Path, upload_type: str, servers: List[str],
+                       progress: Optional[Callable[[int, int], None]]) -> Optional[dict]:
+        _log(self.status_file, f"Attempting {upload_type} upload of {file_path.name}...")
+        for server in servers:
+            _log(self.status_file, f"Trying {upload_type} upload of {file_path.name} via server: {server}...")
+            try:
+                data = await self._upload_to(server, file_path, self._fields(upload_type), progress)
+                _log(self.status_file, f"Gofile.io {upload_type} upload of {file_path.name} successful on server {server}! Link: {data.get('downloadPage')}")
+                return data
+            except Exception as e:
+                server_cache.record(server, None)
+                _log(self.status_file, f"An exception occurred during {upload_type} upload of {file_path.name} to {server}: {e}. Trying next server...")
+        _log(self.status_file, f"All Gofile servers failed for {upload_type} upload of {file_path.name}.")
+        return None
+
+    async def upload_file(self, file_path: Path, progress: Optional[Callable[[int, int], None]] = None,
+                          server_offset: int = 0) -> dict:
+        """
+        Uploads one file and returns gofile's response data (downloadPage, parentFolder, server, ...).
+        server_offset rotates the ranked server list, so concurrent uploads start on different servers.
+        Falls back to a public upload if the token fails.
+        """
+        servers = await server_cache.get(self.client, self.status_file)
+        if servers and server_offset:
+            shift = server_offset % len(servers)
+            servers = servers[shift:] + servers[:shift]
+        if self.guest_token and self.guest_folder:
+            upload_types = ["guest folder", "public"]
+        elif self.api_token:
+            upload_types = ["authenticated", "public"]
+        else:
+            upload_types = ["public"]
+        for i, upload_type in enumerate(upload_types):
+            if i:
+                _log(self.status_file, f"{upload_types[i - 1].capitalize()} upload failed. Falling back to {upload_type} upload.")
+            data = await self._attempt(file_path, upload_type, servers, progress)
+            if data:
+                return data
+        raise GofileError("Gofile.io upload failed completely after trying all available servers and fallback options.")
+
+    async def upload(self, file_path: Path, progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """Uploads one file and returns its download page link."""
+        return (await self.upload_file(file_path, progress))["downloadPage"]
+
+    async def upload_stream(self, file_name: str, chunks: AsyncIterator[bytes]) -> dict:
+        """
+        Uploads a body of unknown length (e.g. an archive still being compressed) as a chunked
+        multipart request to the best ranked server. A stream cannot be replayed, so there is no
+        server fallback here; the caller re-runs the whole stream on failure.
+        """
+        servers = await server_cache.get(self.client, self.status_file)
+        if not servers:
+            raise GofileError("No Gofile servers available.")
+        server = servers[0]
+        upload_type = "authenticated" if self.api_token else "public"
+        boundary = uuid.uuid4().hex
+        head, tail = _multipart_parts(boundary, self._fields(upload_type), file_name)
+
+        sent = 0
+
+        async def body() -> AsyncIterator[bytes]:
+            nonlocal sent
+            yield head
+            async for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+            yield tail
+
+        _log(self.status_file, f"Streaming {upload_type} upload of {file_name} to server {server}...")
+        started = time.monotonic()
+        try:
+            response = await self.client.post(
+                f"https://{server}.gofile.io/uploadFile",
+                content=body(),
+                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+            )
+            response.raise_for_status()
+            result = response.json()
+            if result.get("status") != "ok":
+                raise GofileError(f"Gofile API returned an error: {result}")
+        except Exception:
+            server_cache.record(server, None)
+            raise
+        server_cache.record(server, sent / max(time.monotonic() - started, 0.001))
+        result["data"]["server"] = server
+        _log(self.status_file, f"Gofile.io streamed upload of {file_name} successful on server {server}! Link: {result['data'].get('downloadPage')}")
+        return result["data"]
+
+    async def upload_many(self, file_paths: List[Path], concurrency: int = DEFAULT_CONCURRENCY,
+                          progress: Optional[Callable[[Path, int, int], None]] = None,
+                          on_done: Optional[Callable[[Path, dict], None]] = None) -> List[dict]:
+        """
+        Uploads several files into one gofile folder, up to `concurrency` at a time and spread
+        over different servers. Without a token, the first file creates a public folder and the
+        rest join it with the guest token gofile returns for it. Returns the data of every file, in order.
+        """
+        results: List[Optional[dict]] = [None] * len(file_paths)
+
+        async def upload_one(i: int):
+            path = file_paths[i]
+            file_progress = (lambda current, total: progress(path, current, total)) if progress else None
+            results[i] = await self.upload_file(path, file_progress, server_offset=i)
+            if on_done:
+                on_done(path, results[i])
+
+        start = 0
+        if file_paths and not self.api_token and not self.guest_token:
+            await upload_one(0)
+            self.guest_token = results[0].get("guestToken")
+            self.guest_folder = results[0].get("parentFolder")
+            if not self.guest_token:
+                _log(self.status_file, "Gofile did not return a guest token; remaining files get their own public folders.")
+            start = 1
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def limited(i: int):
+            async with semaphore:
+                await upload_one(i)
+
+        tasks = [asyncio.create_task(limited(i)) for i in range(start, len(file_paths))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return results
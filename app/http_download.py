@@ -0,0 +1,416 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import importlib.util
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse, unquote
+
+import httpx
+
+from .database import db_config
+from .task_log import append_log
+from .progress import parse_size
+from .retry_policy import RATE_LIMITED
+from .site_budget import site_budget
+from .disk_manager import disk_manager
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+FILE_RETRIES = 5
+RETRY_BASE_DELAY = 2  # seconds, doubled per attempt
+PART_SUFFIX = ".part"
+SEGMENTS_SUFFIX = ".segments"  # sidecar of a segmented .part file: per-segment progress for resuming
+DEFAULT_SEGMENTS = 4
+SEGMENTED_MIN_SIZE = 32 * 1024 * 1024  # smaller files are fetched as one stream
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+# HTTP/2 needs the optional h2 package; without it httpx quietly stays on HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+# Pause switches for running in-process downloads (set = running), used by the pause/resume API
+_pause_events: Dict[str, asyncio.Event] = {}
+
+
+class RateLimitedError(Exception):
+    """The server answered 429/403; the caller should back off before retrying."""
+
+
+def register_pause(task_id: str, event: asyncio.Event):
+    _pause_events[task_id] = event
+
+
+def unregister_pause(task_id: str):
+    _pause_events.pop(task_id, None)
+
+
+def pause(task_id: str) -> bool:
+    """Pauses a running in-process download; False if the task has none."""
+    event = _pause_events.get(task_id)
+    if event is None:
+        return False
+    event.clear()
+    return True
+
+
+def resume(task_id: str) -> bool:
+    event = _pause_events.get(task_id)
+    if event is None:
+        return False
+    event.set()
+    return True
+
+
+def sanitize_filename(filename):
+    if not filename:
+        return "untitled"
+    sanitized = re.sub(r'[/\\*?:\"<>|\x00]', "_", filename)
+    sanitized = re.sub(r'\s+', ' ', sanitized).strip()
+    # "." and ".." would resolve to the directory itself or its parent
+    if sanitized in ("", ".", ".."):
+        return "untitled"
+    return sanitized
+
+
+def get_segment_count() -> int:
+    """Range requests per large file (WDM_DOWNLOAD_SEGMENTS); 1 disables segmented downloads."""
+    try:
+        return max(1, int(db_config.get_config("WDM_DOWNLOAD_SEGMENTS", DEFAULT_SEGMENTS) or DEFAULT_SEGMENTS))
+    except (TypeError, ValueError):
+        return DEFAULT_SEGMENTS
+
+
+def create_client(max_connections: int = 16, headers: Optional[dict] = None, proxy: Optional[str] = None,
+                  http2: bool = True) -> httpx.AsyncClient:
+    """
+    Shared async connection pool for one download job.
+    Segmented downloads should pass http2=False: HTTP/2 multiplexes every segment onto one TCP
+    connection, which is exactly the single-stream bottleneck segmenting is meant to avoid.
+    """
+    kwargs = {}
+    if proxy:
+        kwargs["proxy"] = proxy if "://" in proxy else f"http://{proxy}"
+    return httpx.AsyncClient(
+        http2=http2 and HTTP2_AVAILABLE,
+        follow_redirects=True,
+        timeout=httpx.Timeout(60, connect=20),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        headers=headers,
+        **kwargs
+    )
+
+
+class RateLimiter:
+    """Token bucket shared by all concurrent fetches of a job (bytes per second, 0 = unlimited)."""
+
+    def __init__(self, rate: int = 0):
+        self.rate = rate
+        self._allowance = float(rate)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def consume(self, amount: int):
+        if not self.rate:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate)
+            self._last = now
+            self._allowance -= amount
+            if self._allowance < 0:
+                await asyncio.sleep(-self._allowance / self.rate)
+
+
+class HostLimiter:
+    """Caps concurrent requests per host (CDN nodes behind a redirect are limited separately)."""
+
+    def __init__(self, per_host: int = 2):
+        self.per_host = per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def get(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(str(url)).hostname or ""
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host)
+            self._semaphores[host] = semaphore
+        return semaphore
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def is_complete(path: Path, expected_size: Optional[int] = None, expected_sha256: Optional[str] = None) -> bool:
+    """True if the file exists and matches the expected size and/or hash (hashing runs in a thread)."""
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return False
+    if expected_size is not None and size != expected_size:
+        return False
+    if expected_sha256:
+        return await asyncio.to_thread(file_sha256, path) == expected_sha256.lower()
+    return expected_size is not None
+
+
+def _response_filename(response: httpx.Response) -> str:
+    """File name from Content-Disposition, else from the last path component of the final URL."""
+    disposition = response.headers.get("content-disposition", "")
+    match = re.search(r"filename\*=(?:UTF-8'')?([^;]+)", disposition, re.IGNORECASE) \
+        or re.search(r'filename="?([^";]+)"?', disposition, re.IGNORECASE)
+    if match:
+        return unquote(match.group(1).strip())
+    return unquote(Path(urlparse(str(response.url)).path).name)
+
+
+async def probe(client: httpx.AsyncClient, url: str) -> tuple:
+    """Follows redirects with a HEAD request; returns (final_url, size or None, supports_ranges, filename)."""
+    response = await client.head(url)
+    if response.status_code in (403, 429):
+        raise RateLimitedError(f"HTTP {response.status_code} for {url}")
+    if response.status_code >= 400:
+        # Some CDNs reject HEAD; fall back to learning everything from the GET
+        return url, None, False, unquote(Path(urlparse(url).path).name)
+    size = response.headers.get("content-length")
+    return (str(response.url), int(size) if size and size.isdigit() else None,
+            response.headers.get("accept-ranges", "").lower() == "bytes", _response_filename(response))
+
+
+async def _stream_into(client: httpx.AsyncClient, url: str, part_path: Path, limiter: Optional[RateLimiter],
+                       on_bytes: Optional[Callable[[int], None]], pause: Optional[asyncio.Event]):
+    """Appends the rest of the file to part_path, resuming with a Range request when possible."""
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    async with client.stream("GET", url, headers=headers) as response:
+        if response.status_code in (403, 429):
+            raise RateLimitedError(f"HTTP {response.status_code} for {url}")
+        if response.status_code == 416:
+            # Range not satisfiable: the part file already holds everything
+            return
+        response.raise_for_status()
+        mode = "ab" if offset and response.status_code == 206 else "wb"
+        f = await asyncio.to_thread(open, part_path, mode)
+        try:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                if pause is not None:
+                    await pause.wait()
+                if limiter is not None:
+                    await limiter.consume(len(chunk))
+                await asyncio.to_thread(f.write, chunk)
+                if on_bytes:
+                    on_bytes(len(chunk))
+        finally:
+            await asyncio.to_thread(f.close)
+
+
+def plan_segments(size: int, count: int) -> List[dict]:
+    """Splits [0, size) into up to `count` contiguous ranges of at least MIN_SEGMENT_SIZE."""
+    count = max(1, min(count, size // MIN_SEGMENT_SIZE))
+    step = -(-size // count)
+    return [{"start": start, "end": min(start + step, size) - 1, "done": 0} for start in range(0, size, step)]
+
+
+def _load_segment_state(state_path: Path, size: int) -> Optional[List[dict]]:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state["segments"] if state.get("size") == size else None
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_segment_state(state_path: Path, size: int, segments: List[dict]):
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump({"size": size, "segments": segments}, f)
+
+
+async def _fetch_segment(client: httpx.AsyncClient, url: str, fd: int, segment: dict, limiter: Optional[RateLimiter],
+                         on_bytes: Optional[Callable[[int], None]], pause: Optional[asyncio.Event], writes: set):
+    """
+    Fetches the rest of one segment and writes it at its offset; segment["done"] tracks progress.
+    Writes in flight are kept in `writes`: cancelling this task does not stop a worker thread.
+    """
+    remaining = segment["end"] - segment["start"] + 1 - segment["done"]
+    if remaining <= 0:
+        return
+    offset = segment["start"] + segment["done"]
+    async with client.stream("GET", url, headers={"Range": f"bytes={offset}-{segment['end']}"}) as response:
+        if response.status_code in (403, 429):
+            raise RateLimitedError(f"HTTP {response.status_code} for {url}")
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise IOError(f"server ignored the Range request (HTTP {response.status_code})")
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            if pause is not None:
+                await pause.wait()
+            chunk = chunk[:remaining]
+            if not chunk:
+                break
+            if limiter is not None:
+                await limiter.consume(len(chunk))
+            write = asyncio.ensure_future(asyncio.to_thread(os.pwrite, fd, chunk, segment["start"] + segment["done"]))
+            writes.add(write)
+            write.add_done_callback(writes.discard)
+            await asyncio.shield(write)
+            segment["done"] += len(chunk)
+            remaining -= len(chunk)
+            if on_bytes:
+                on_bytes(len(chunk))
+    if remaining > 0:
+        raise IOError(f"segment at {segment['start']} ended {remaining} bytes early")
+
+
+async def _download_segmented(client: httpx.AsyncClient, url: str, part_path: Path, size: int, segment_count: int,
+                              limiter: Optional[RateLimiter], on_bytes: Optional[Callable[[int], None]],
+                              pause: Optional[asyncio.Event]):
+    """
+    Fetches the file as parallel Range requests written at their offsets into a part file
+    preallocated (sparse) to the full size. Progress per segment is kept in a sidecar file,
+    so a retry or a later pass only fetches the missing ranges.
+    """
+    state_path = part_path.with_name(part_path.name + SEGMENTS_SUFFIX)
+    segments = _load_segment_state(state_path, size) if part_path.exists() else None
+    if segments is None:
+        segments = plan_segments(size, segment_count)
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+    fd = os.open(part_path, os.O_WRONLY)
+    writes = set()
+    tasks = [asyncio.create_task(_fetch_segment(client, url, fd, segment, limiter, on_bytes, pause, writes)) for segment in segments]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # A cancelled segment's pwrite keeps running in its thread; the descriptor (whose number
+        # may be reused once closed) must outlive it. An interrupted write is not counted as done.
+        await asyncio.gather(*list(writes), return_exceptions=True)
+        os.close(fd)
+        if all(s["done"] >= s["end"] - s["start"] + 1 for s in segments):
+            state_path.unlink(missing_ok=True)
+        else:
+            _save_segment_state(state_path, size, segments)
+
+
+async def download_file(client: httpx.AsyncClient, url: str, dest: Path, *,
+                        expected_size: Optional[int] = None, expected_sha256: Optional[str] = None,
+                        limiter: Optional[RateLimiter] = None, host_limiter: Optional[HostLimiter] = None,
+                        on_bytes: Optional[Callable[[int], None]] = None, pause: Optional[asyncio.Event] = None,
+                        on_rate_limited: Optional[Callable[[], "asyncio.Future"]] = None,
+                        segments: int = 1, segment_client: Optional[httpx.AsyncClient] = None) -> bool:
+    """
+    Downloads url to dest through a .part file, resuming across retries, and verifies size/hash
+    before the final rename. Returns False if dest was already complete (nothing fetched).
+    With segments > 1, files of at least SEGMENTED_MIN_SIZE on servers that accept Range requests
+    are fetched as that many parallel ranges (on segment_client if given).
+    """
+    dest = Path(dest)
+    if await is_complete(dest, expected_size, expected_sha256):
+        return False
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part_path = dest.with_name(dest.name + PART_SUFFIX)
+    state_path = part_path.with_name(part_path.name + SEGMENTS_SUFFIX)
+
+    last_error = None
+    for attempt in range(1, FILE_RETRIES + 1):
+        try:
+            final_url, size, ranges, _ = await probe(client, url)
+            if expected_size is None:
+                expected_size = size
+            if segments > 1 and ranges and expected_size and expected_size >= SEGMENTED_MIN_SIZE:
+                fetch = _download_segmented(segment_client or client, final_url, part_path, expected_size,
+                                            segments, limiter, on_bytes, pause)
+            else:
+                if state_path.exists():
+                    # A sparse part file from a segmented run cannot be resumed by appending
+                    part_path.unlink(missing_ok=True)
+                    state_path.unlink()
+                fetch = _stream_into(client, final_url, part_path, limiter, on_bytes, pause)
+            semaphore = host_limiter.get(final_url) if host_limiter else None
+            if semaphore:
+                async with semaphore:
+                    await fetch
+            else:
+                await fetch
+
+            actual_size = part_path.stat().st_size
+            if expected_size is not None and actual_size != expected_size:
+                if actual_size > expected_size:
+                    part_path.unlink()
+                raise IOError(f"size mismatch ({actual_size} != {expected_size})")
+            if expected_sha256 and await asyncio.to_thread(file_sha256, part_path) != expected_sha256.lower():
+                part_path.unlink()
+                state_path.unlink(missing_ok=True)
+                raise IOError("hash mismatch")
+            os.replace(part_path, dest)
+            return True
+        except RateLimitedError as e:
+            last_error = e
+            if on_rate_limited is not None:
+                await on_rate_limited()
+            else:
+                await asyncio.sleep(RETRY_BASE_DELAY * (2 ** attempt))
+        except (httpx.HTTPError, IOError) as e:
+            last_error = e
+            delay = RETRY_BASE_DELAY * (2 ** (attempt - 1))
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+    raise IOError(f"Failed to download {url} after {FILE_RETRIES} attempts: {last_error}")
+
+
+async def run_direct_download(task_id: str, url: str, download_dir: Path, status_file: Path, progress=None,
+                              proxy: Optional[str] = None, rate_limit: Optional[str] = None) -> Path:
+    """Downloads a single direct HTTP(S) file into download_dir, segmented when it is large enough."""
+    segments = get_segment_count()
+    client = create_client(max_connections=4, proxy=proxy)
+    segment_client = create_client(max_connections=segments, proxy=proxy, http2=False) if segments > 1 else None
+    pause_event = asyncio.Event()
+    pause_event.set()
+    register_pause(task_id, pause_event)
+
+    async def backoff():
+        site_budget.report(task_id, RATE_LIMITED)
+        await site_budget.wait_for_backoff(task_id, status_file)
+
+    def on_bytes(n: int):
+        if progress is not None:
+            progress.record("bytes", n)
+            progress.publish()
+
+    try:
+        _, size, ranges, filename = await probe(client, url)
+        dest = Path(download_dir) / sanitize_filename(filename or "download")
+        mode = f"{segments} segments" if segments > 1 and ranges and size and size >= SEGMENTED_MIN_SIZE else "single stream"
+        append_log(status_file, f"Downloading {url} -> {dest.name} ({size if size is not None else 'unknown'} bytes, {mode})\n")
+        if size:
+            disk_manager.expect(task_id, size, progress)
+        if progress is not None:
+            progress.current_file = dest.name
+            progress.record("active")
+        fetched = await download_file(
+            client, url, dest, expected_size=size,
+            limiter=RateLimiter(parse_size(rate_limit) if rate_limit else 0),
+            on_bytes=on_bytes, pause=pause_event, on_rate_limited=backoff,
+            segments=segments, segment_client=segment_client
+        )
+        if progress is not None:
+            progress.record("done" if fetched else "skip", (dest.name, 0) if fetched else None)
+            progress.publish(force=True)
+        append_log(status_file, f"{'Downloaded' if fetched else 'Skipped (already complete)'}: {dest.name}\n")
+        return dest
+    finally:
+        unregister_pause(task_id)
+        await client.aclose()
+        if segment_client is not None:
+            await segment_client.aclose()
@@ -9,6 +9,7 @@ LANGUAGES = {
         "downloader_label": "Downloader",
         "downloader_gallery_dl": "gallery-dl (Default)",
         "downloader_megadl": "megadl (MEGA.nz)",
+        "downloader_http": "Direct HTTP (segmented)",
         "advanced_options_title": "Advanced Options",
         "deviantart_credentials_title": "DeviantArt Credentials (Optional)",
         "deviantart_credentials_text": "Provide your own DeviantArt API credentials to avoid rate limits.",
@@ -34,6 +35,9 @@ LANGUAGES = {
         "mega_option": "MEGA",
         "remote_upload_path_label": "Remote Upload Path/Bucket",
         "remote_upload_path_placeholder": "e.g., my-bucket/archives",
+        "extra_destinations_label": "Extra Destinations (optional)",
+        "extra_destinations_placeholder": "s3:my-bucket/mirror\nopenlist:/backup",
+        "extra_destinations_text": "One service:path per line. The same files are uploaded to all destinations at once, using the credentials from Settings.",
         "webdav_settings_title": "WebDAV Settings",
         "webdav_url_label": "WebDAV URL",
         "webdav_url_placeholder": "e.g., https://your-server.com/remote.php/dav/files/username",
@@ -87,6 +91,9 @@ LANGUAGES = {
         "download_log_label": "Download Log",
         "upload_log_label": "Upload Log",
         "upload_progress_label": "Upload Progress",
+        "download_progress_label": "Download Progress",
+        "skipped_count_label": "skipped",
+        "errors_count_label": "errors",
         "upload_speed_label": "Upload Speed",
         "download_speed_label": "Download Speed",
         "files_count_label": "Files",
@@ -96,6 +103,9 @@ LANGUAGES = {
         "task_command_label": "Command:",
         "task_error_label": "Error:",
         "task_gofile_link_label": "Gofile Link:",
+        "task_gofile_links_label": "Chunk Links:",
+        "gofile_concurrency_label": "Parallel Uploads",
+        "gofile_concurrency_text": "Split archives are uploaded to gofile.io this many at a time, spread over different servers and into one folder.",
         "pause_button": "Pause",
         "resume_button": "Resume",
         "retry_button": "Retry",
@@ -153,9 +163,54 @@ LANGUAGES = {
         "sync_add_task_button": "Add New Sync Task",
         "sync_no_tasks_text": "No sync tasks configured.",
         "sync_delete_confirm": "Are you sure you want to delete this sync task?",
+        "sync_mode_label": "Sync Mode",
+        "sync_mode_interval": "Interval",
+        "sync_mode_realtime": "Real-time (watch for changes)",
         "gallery_dl_args_label": "Extra gallery-dl Arguments",
         "gallery_dl_args_placeholder": "e.g., -o \"directory=['{category}', '{title}']\"",
         "gallery_dl_args_text": "Customize folder structure or other gallery-dl settings. Use at your own risk.",
+        "gallery_dl_engine_label": "gallery-dl Engine",
+        "gallery_dl_engine_subprocess": "Command line (one process per job)",
+        "gallery_dl_engine_inprocess": "Warm worker (in-process)",
+        "gallery_dl_engine_text": "Warm workers keep gallery-dl loaded between jobs and report each file directly. Only -o options from the extra arguments are applied. Not available in the standalone binary.",
+        "download_segments_label": "Segments per Large File",
+        "download_segments_text": "Files of 32 MB or more from the kemono engine and direct HTTP downloads are fetched as this many parallel Range requests. 1 disables segmenting.",
+        "stream_upload_label": "Streamed Archive Upload",
+        "stream_upload_off": "Off (write the archive, then upload)",
+        "stream_upload_on": "On (compress straight into the upload)",
+        "stream_upload_text": "Single-volume archives are piped from tar | zstd into the upload (rclone rcat, Openlist or gofile.io) without being written to disk first. Only used for jobs with one destination; a failed upload restarts from the beginning.",
+        "archive_engine_label": "Archive Builder",
+        "archive_engine_shell": "tar | zstd",
+        "archive_engine_python": "Python (seekable frames + file index)",
+        "archive_engine_text": "The Python builder compresses volumes in parallel worker processes as independent zstd frames and uploads a .index.json next to each archive, so single files can later be read from the remote archive with Range requests. The archives stay regular .tar.zst files.",
+        "stall_timeout_label": "Stall Timeout (seconds)",
+        "stall_action_label": "On Stall",
+        "stall_action_kill": "Kill and retry",
+        "stall_action_flag": "Flag only",
+        "site_max_jobs_label": "Max Concurrent Jobs per Site",
+        "site_max_jobs_placeholder": "e.g., 2 (empty or 0 = unlimited)",
+        "site_bandwidth_label": "Bandwidth per Site",
+        "site_bandwidth_placeholder": "e.g., 4M (empty = unlimited)",
+        "site_budgets_json_label": "Per-site Overrides (JSON)",
+        "site_budget_text": "Downloads from the same site (kemono, pixiv, twitter, ...) share these limits: extra jobs wait for a free slot, the bandwidth is split across the site's active downloads, and a 429/403 from the site pauses all of its jobs.",
+        "global_download_limit_label": "Total Download Bandwidth",
+        "global_upload_limit_label": "Total Upload Bandwidth",
+        "bandwidth_schedule_label": "Bandwidth Schedule",
+        "bandwidth_schedule_text": "Totals are shared by all running jobs; running rclone uploads are re-balanced live. One HH:MM,DOWN,UP entry per line applies from that time until the next entry and overrides the totals above (off = unlimited).",
+        "stall_timeout_text": "A download or upload with no I/O, log output or new files for this long is treated as stalled. The timeout grows with the slowest gap seen in the task. 0 disables detection.",
+        "retention_policy_label": "Keep Downloads After a Job",
+        "retention_none": "Nothing",
+        "retention_manifest": "File list only",
+        "retention_hardlink": "Files (hardlinks)",
+        "retention_failed": "Files of failed jobs only",
+        "retention_hours_label": "Keep for (hours)",
+        "retention_max_gb_label": "Retention Budget (GB)",
+        "task_log_max_label": "Task Log Size Limit (MB)",
+        "task_log_max_text": "A task log larger than this keeps its first and last lines around an \"omitted\" marker. 0 = no limit. Application logs rotate at WDM_LOG_MAX_MB (default 50) and keep WDM_LOG_BACKUPS (default 5) compressed segments; both are environment variables.",
+        "disk_min_free_label": "Minimum Free Disk Space (GB)",
+        "disk_job_reserve_label": "Space Reserved per New Job (GB)",
+        "disk_admission_text": "New jobs wait while the free space, minus what running jobs are still expected to write, would drop below the minimum. A job reserves the given amount until its real size is known from the server or the finished download. Leftovers of crashed jobs are cleaned up in the background.",
+        "retention_text": "Kept files are hardlinks of the download, so keeping them costs no extra writes. A background janitor removes them after the given time and deletes the oldest first when the budget is exceeded; a download larger than the budget keeps its file list only.",
         "verification_settings_section": "Login Verification (Captcha)",
         "verification_type_label": "Verification Method",
         "verification_none": "None",
@@ -232,6 +287,7 @@ LANGUAGES = {
         "downloader_label": "下载器",
         "downloader_gallery_dl": "gallery-dl (默认)",
         "downloader_megadl": "megadl (MEGA.nz)",
+        "downloader_http": "HTTP 直链 (分段并行)",
         "advanced_options_title": "高级选项",
         "deviantart_credentials_title": "DeviantArt 凭证 (可选)",
         "deviantart_credentials_text": "提供您自己的 DeviantArt API 凭证以避免速率限制。",
@@ -260,6 +316,9 @@ LANGUAGES = {
         "mega_option": "MEGA",
         "remote_upload_path_label": "远程上传路径/存储桶",
         "remote_upload_path_placeholder": "例如：my-bucket/archives",
+        "extra_destinations_label": "额外上传目标 (可选)",
+        "extra_destinations_placeholder": "s3:my-bucket/mirror\nopenlist:/backup",
+        "extra_destinations_text": "每行一个 服务:路径。同一份文件会同时上传到所有目标，使用设置页中的凭据。",
         "webdav_settings_title": "WebDAV 设置",
         "webdav_url_label": "WebDAV URL",
         "webdav_url_placeholder": "例如：https://your-server.com/remote.php/dav/files/username",
@@ -313,6 +372,9 @@ LANGUAGES = {
         "download_log_label": "下载日志",
         "upload_log_label": "上传日志",
         "upload_progress_label": "上传进度",
+        "download_progress_label": "下载进度",
+        "skipped_count_label": "已跳过",
+        "errors_count_label": "错误",
         "upload_speed_label": "上行速率",
         "download_speed_label": "下行速率",
         "files_count_label": "文件数",
@@ -322,6 +384,9 @@ LANGUAGES = {
         "task_command_label": "命令:",
         "task_error_label": "错误:",
         "task_gofile_link_label": "Gofile 链接:",
+        "task_gofile_links_label": "分卷链接:",
+        "gofile_concurrency_label": "并行上传数",
+        "gofile_concurrency_text": "分卷压缩包会以此数量同时上传到 gofile.io，分散到不同服务器并放入同一文件夹。",
         "pause_button": "暂停",
         "resume_button": "继续",
         "retry_button": "重试",
@@ -361,9 +426,54 @@ LANGUAGES = {
         "sync_add_task_button": "添加新同步任务",
         "sync_no_tasks_text": "暂未配置任何同步任务。",
         "sync_delete_confirm": "您确定要删除此同步任务吗？",
+        "sync_mode_label": "同步模式",
+        "sync_mode_interval": "定时",
+        "sync_mode_realtime": "实时（监听文件变化）",
         "gallery_dl_args_label": "gallery-dl 自定义参数",
         "gallery_dl_args_placeholder": "例如：-o \"directory=['{category}', '{title}']\"",
         "gallery_dl_args_text": "自定义下载目录结构或其他配置。请确保参数格式正确。",
+        "gallery_dl_engine_label": "gallery-dl 引擎",
+        "gallery_dl_engine_subprocess": "命令行 (每个任务一个进程)",
+        "gallery_dl_engine_inprocess": "常驻工作进程 (进程内)",
+        "gallery_dl_engine_text": "常驻工作进程在任务之间保持 gallery-dl 已加载，并直接上报每个文件。自定义参数中仅 -o 选项生效。独立二进制版本不可用。",
+        "download_segments_label": "大文件分段数",
+        "download_segments_text": "kemono 引擎和 HTTP 直链下载中 32 MB 及以上的文件会拆分为相应数量的并行 Range 请求。设为 1 则不分段。",
+        "stream_upload_label": "流式压缩上传",
+        "stream_upload_off": "关闭（先写出压缩包再上传）",
+        "stream_upload_on": "开启（边压缩边上传）",
+        "stream_upload_text": "单卷压缩包由 tar | zstd 直接管道传入上传（rclone rcat、Openlist 或 gofile.io），不先写入磁盘。仅用于单一上传目标的任务；上传失败时会从头重新开始。",
+        "archive_engine_label": "压缩包构建方式",
+        "archive_engine_shell": "tar | zstd",
+        "archive_engine_python": "Python（可寻址帧 + 文件索引）",
+        "archive_engine_text": "Python 构建器在并行的工作进程中将分卷压缩为独立的 zstd 帧，并在每个压缩包旁上传 .index.json，之后可通过 Range 请求从远程压缩包中读取单个文件。压缩包仍是标准的 .tar.zst 文件。",
+        "stall_timeout_label": "卡死超时 (秒)",
+        "stall_action_label": "卡死时",
+        "stall_action_kill": "终止并重试",
+        "stall_action_flag": "仅标记",
+        "site_max_jobs_label": "每个站点最大并发任务数",
+        "site_max_jobs_placeholder": "例如：2 (留空或 0 为不限制)",
+        "site_bandwidth_label": "每个站点带宽",
+        "site_bandwidth_placeholder": "例如：4M (留空为不限速)",
+        "site_budgets_json_label": "站点单独配置 (JSON)",
+        "site_budget_text": "同一站点 (kemono、pixiv、twitter 等) 的下载共享这些限制：超出的任务排队等待空位，带宽在该站点正在下载的任务间平分，站点返回 429/403 时暂停其全部任务。",
+        "global_download_limit_label": "总下载带宽",
+        "global_upload_limit_label": "总上传带宽",
+        "bandwidth_schedule_label": "带宽时间表",
+        "bandwidth_schedule_text": "总带宽由所有运行中的任务共享，正在进行的 rclone 上传会实时重新分配。每行一条 HH:MM,下载,上传，从该时间生效直到下一条，并覆盖上面的总带宽 (off 表示不限速)。",
+        "stall_timeout_text": "下载或上传在此时长内没有任何 I/O、日志输出或新文件时视为卡死。超时会根据任务中出现过的最长停顿自动放宽。0 表示关闭检测。",
+        "retention_policy_label": "任务结束后保留下载",
+        "retention_none": "不保留",
+        "retention_manifest": "仅保留文件清单",
+        "retention_hardlink": "保留文件（硬链接）",
+        "retention_failed": "仅保留失败任务的文件",
+        "retention_hours_label": "保留时长（小时）",
+        "retention_max_gb_label": "保留空间上限 (GB)",
+        "task_log_max_label": "任务日志大小上限 (MB)",
+        "task_log_max_text": "超过此大小的任务日志只保留开头和结尾部分，中间以“已省略”标记代替。0 表示不限制。应用日志按 WDM_LOG_MAX_MB（默认 50）轮转，并保留 WDM_LOG_BACKUPS（默认 5）个压缩分段，这两项通过环境变量设置。",
+        "disk_min_free_label": "最低剩余磁盘空间 (GB)",
+        "disk_job_reserve_label": "每个新任务预留空间 (GB)",
+        "disk_admission_text": "当剩余空间减去运行中任务预计还要写入的量低于最低值时，新任务会排队等待。任务在从服务器或下载结果得知实际大小之前按此值预留空间。崩溃任务残留的文件会在后台自动清理。",
+        "retention_text": "保留的文件是下载文件的硬链接，不会产生额外写入。后台清理任务会在到期后删除它们，超出空间上限时先删除最旧的；大于上限的下载只保留文件清单。",
         "verification_settings_section": "登录验证 (验证码)",
         "verification_type_label": "验证方式",
         "verification_none": "无",
@@ -0,0 +1,142 @@
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+from .site_budget import SITE_ALIASES
+
+logger = logging.getLogger(__name__)
+
+# Submitted options that change what gets downloaded (or how it is packaged)
+CONTENT_OPTION_KEYS = (
+    "downloader", "enable_compression", "split_compression", "split_size",
+    "kemono_posts", "kemono_revisions", "kemono_path_template",
+    "pixiv_ugoira", "twitter_retweets", "twitter_replies",
+    "cookies", "kemono_username", "deviantart_client_id",
+)
+# Query parameters that never change the content behind a URL
+IGNORED_QUERY_PREFIXES = ("utm_", "ref", "fbclid", "gclid")
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL for deduplication: lower-case scheme and host, no 'www.',
+    mirror domains folded onto one name (kemono.su == kemono.cr), no fragment,
+    no trailing slash, tracking parameters dropped and the rest of the query sorted.
+    """
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    alias = SITE_ALIASES.get(host)
+    if alias:
+        host = alias
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                   if not k.lower().startswith(IGNORED_QUERY_PREFIXES))
+    path = parsed.path.rstrip("/") or "/"
+    return f"{(parsed.scheme or 'https').lower()}://{host}{path}" + (f"?{urlencode(query)}" if query else "")
+
+
+def job_key(url: str, params: dict) -> str:
+    options = {key: str(params.get(key) or "") for key in CONTENT_OPTION_KEYS}
+    raw = json.dumps({"url": normalize_url(url), "options": options}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def destination_key(service: str, upload_path: Optional[str], params: dict) -> str:
+    """Identifies an upload target: service, path, any per-job credentials and extra destinations."""
+    credentials = {k: str(v) for k, v in params.items() if k.startswith(f"{service}_") and v}
+    extra = sorted(line.strip() for line in (params.get("extra_destinations") or "").splitlines() if line.strip())
+    raw = json.dumps({"service": service, "path": (upload_path or "").strip("/"), "credentials": credentials, "extra": extra}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Subscriber:
+    """A later identical submission that receives the primary job's download."""
+
+    def __init__(self, task_id: str, service: str, upload_path: Optional[str], params: dict):
+        self.task_id = task_id
+        self.service = service
+        self.upload_path = upload_path
+        self.params = params
+        self.destination = destination_key(service, upload_path, params)
+
+
+class InflightJobs:
+    """
+    Registry of queued/running download jobs by content key. A submission whose key is
+    already in flight attaches to that job as a subscriber instead of downloading again.
+    Subscribers are accepted until the primary starts uploading (close()).
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+        self._keys: Dict[str, str] = {}  # primary task id -> key
+
+    def register(self, task_id: str, url: str, service: str, upload_path: Optional[str], params: dict) -> Optional[str]:
+        """
+        Returns the primary task id if an identical job is in flight (task_id is then recorded as
+        its subscriber); otherwise registers task_id as a new primary and returns None.
+        """
+        key = job_key(url, params)
+        job = self._jobs.get(key)
+        if job is not None and job["open"]:
+            job["subscribers"].append(Subscriber(task_id, service, upload_path, params))
+            logger.info(f"[Dedup] Task {task_id} attached to in-flight job {job['task_id']}")
+            return job["task_id"]
+        self._jobs[key] = {
+            "task_id": task_id,
+            "destination": destination_key(service, upload_path, params),
+            "subscribers": [],
+            "open": True,
+        }
+        self._keys[task_id] = key
+        return None
+
+    def _job(self, task_id: str) -> Optional[dict]:
+        key = self._keys.get(task_id)
+        return self._jobs.get(key) if key else None
+
+    def destination(self, task_id: str) -> Optional[str]:
+        job = self._job(task_id)
+        return job["destination"] if job else None
+
+    def close(self, task_id: str) -> List[Subscriber]:
+        """Stops accepting subscribers for a job and hands over the ones attached so far."""
+        job = self._job(task_id)
+        if job is None:
+            return []
+        job["open"] = False
+        subscribers, job["subscribers"] = job["subscribers"], []
+        return subscribers
+
+    def close_if_idle(self, task_id: str) -> bool:
+        """
+        Stops accepting subscribers if none attached yet and returns True; False if some are waiting
+        (they need the finished archives, so the job cannot consume its download in one pass).
+        """
+        job = self._job(task_id)
+        if job is None:
+            return True
+        if job["subscribers"]:
+            return False
+        job["open"] = False
+        return True
+
+    def finish(self, task_id: str) -> List[Subscriber]:
+        """Forgets a finished job; returns subscribers that were never handed over."""
+        subscribers = self.close(task_id)
+        key = self._keys.pop(task_id, None)
+        if key and self._jobs.get(key, {}).get("task_id") == task_id:
+            del self._jobs[key]
+        return subscribers
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._jobs),
+            "subscribers": sum(len(job["subscribers"]) for job in self._jobs.values()),
+        }
+
+
+inflight_jobs = InflightJobs()
@@ -0,0 +1,227 @@
+import re
+import asyncio
+import logging
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from .task_log import append_log
+from .retry_policy import RATE_LIMITED
+from .site_budget import site_budget
+from .http_download import (
+    create_client, download_file, sanitize_filename, get_segment_count, register_pause, unregister_pause,
+    RateLimiter, HostLimiter, RateLimitedError
+)
+from .progress import parse_size
+
+logger = logging.getLogger(__name__)
+
+# --- Kemono Constants & Helpers ---
+SITE_BASE_URL = "https://kemono.cr"
+API_BASE_URL = "https://kemono.cr/api/v1"
+
+POSTS_PAGE_SIZE = 50  # the API pages creator posts by this offset step
+FILE_CONCURRENCY = 4  # files fetched in parallel per job
+PER_HOST_LIMIT = 2  # concurrent requests per CDN node
+API_RETRIES = 5
+
+_CREATOR_URL_RE = re.compile(r'/(?P<service>[\w-]+)/user/(?P<user>[\w.-]+)(?:/post/(?P<post>[\w-]+))?')
+# Data paths are content-addressed: /ab/cd/<sha256>.<ext>
+_HASH_PATH_RE = re.compile(r'/([0-9a-f]{64})(?:\.[^/]*)?$')
+
+def parse_kemono_url(url: str) -> dict:
+    """Splits a kemono/coomer URL into site base, API base, service, creator and optional post id."""
+    parsed = urlparse(url)
+    match = _CREATOR_URL_RE.search(parsed.path)
+    if not match:
+        raise ValueError(f"Not a kemono creator or post URL: {url}")
+    site_base = f"{parsed.scheme or 'https'}://{parsed.netloc}" if parsed.netloc else SITE_BASE_URL
+    return {
+        "site_base": site_base,
+        "api_base": f"{site_base}/api/v1",
+        "service": match.group("service"),
+        "user": match.group("user"),
+        "post": match.group("post"),
+    }
+
+
+class KemonoEngine:
+    """
+    Native replacement for the kemono-dl subprocess: crawls the kemono API page by page and
+    fetches post files concurrently over one HTTP/2 connection pool, with per-host limits,
+    resumable .part downloads and skipping of files that already match the API's hash.
+    Large attachments are split into parallel Range requests on a separate HTTP/1.1 pool.
+    Files land in {service}/{creator_name}/{post_title}/{filename}, like the kemono-dl layout.
+    """
+
+    def __init__(self, task_id: str, url: str, download_dir: Path, status_file: Path, progress=None,
+                 cookies: Optional[str] = None, username: Optional[str] = None, password: Optional[str] = None,
+                 proxy: Optional[str] = None, rate_limit: Optional[str] = None):
+        self.task_id = task_id
+        self.url = url
+        self.download_dir = Path(download_dir)
+        self.status_file = status_file
+        self.progress = progress
+        self.username = username
+        self.password = password
+        self.target = parse_kemono_url(url)
+        headers = {"Accept": "text/css"}  # the API refuses the default Accept header to deter scrapers
+        if cookies:
+            headers["Cookie"] = cookies
+        self.client = create_client(max_connections=FILE_CONCURRENCY * PER_HOST_LIMIT, headers=headers, proxy=proxy)
+        self.segments = get_segment_count()
+        self.segment_client = None
+        if self.segments > 1:
+            self.segment_client = create_client(max_connections=FILE_CONCURRENCY * self.segments, headers=headers,
+                                                proxy=proxy, http2=False)
+        self.limiter = RateLimiter(parse_size(rate_limit) if rate_limit else 0)
+        self.host_limiter = HostLimiter(PER_HOST_LIMIT)
+        self.pause_event = asyncio.Event()
+        self.pause_event.set()
+        self.failed_files = 0
+
+    def _log(self, message: str):
+        append_log(self.status_file, message + "\n")
+
+    def _record(self, kind: str, value=None):
+        if self.progress is not None:
+            self.progress.record(kind, value)
+            self.progress.publish()
+
+    async def _backoff(self):
+        site_budget.report(self.task_id, RATE_LIMITED)
+        await site_budget.wait_for_backoff(self.task_id, self.status_file)
+
+    async def _api_get(self, path: str, params: Optional[dict] = None):
+        url = f"{self.target['api_base']}{path}"
+        for attempt in range(1, API_RETRIES + 1):
+            await self.pause_event.wait()
+            try:
+                response = await self.client.get(url, params=params)
+                if response.status_code in (403, 429):
+                    raise RateLimitedError(f"HTTP {response.status_code}")
+                if response.status_code == 404:
+                    return None
+                response.raise_for_status()
+                return response.json()
+            except RateLimitedError:
+                self._log(f"API rate limited at {path}, backing off...")
+                await self._backoff()
+            except (httpx.HTTPError, ValueError) as e:
+                if attempt == API_RETRIES:
+                    raise
+                self._log(f"API request {path} failed ({e}), retrying...")
+                await asyncio.sleep(2 ** attempt)
+        raise RuntimeError(f"API request {path} kept being rate limited")
+
+    async def _login(self):
+        try:
+            response = await self.client.post(f"{self.target['api_base']}/authentication/login",
+                                              json={"username": self.username, "password": self.password})
+            response.raise_for_status()
+            self._log("Logged in to kemono.")
+        except httpx.HTTPError as e:
+            self._log(f"Kemono login failed ({e}); continuing anonymously.")
+
+    async def _creator_name(self) -> str:
+        service, user = self.target["service"], self.target["user"]
+        profile = await self._api_get(f"/{service}/user/{user}/profile")
+        return sanitize_filename((profile or {}).get("name") or user)
+
+    async def iter_posts(self) -> AsyncIterator[dict]:
+        """Yields the target post, or every post of the creator following the API's offset pagination."""
+        service, user, post_id = self.target["service"], self.target["user"], self.target["post"]
+        if post_id:
+            data = await self._api_get(f"/{service}/user/{user}/post/{post_id}")
+            if data:
+                yield data.get("post", data) if isinstance(data, dict) else data
+            return
+        offset = 0
+        while True:
+            page = await self._api_get(f"/{service}/user/{user}/posts", params={"o": offset})
+            if not page:
+                return
+            for post in page:
+                yield post
+            if len(page) < POSTS_PAGE_SIZE:
+                return
+            offset += POSTS_PAGE_SIZE
+
+    def _post_files(self, post: dict) -> List[Tuple[dict, str]]:
+        """The post's files with their local names, unique within the post."""
+        files = []
+        seen = set()
+        names = set()
+        for item in [post.get("file")] + list(post.get("attachments") or []):
+            if not item or not item.get("path") or item["path"] in seen:
+                continue
+            seen.add(item["path"])
+            name = sanitize_filename(item.get("name") or Path(item["path"]).name)
+            # Two different files under one name would share a destination and .part file; number
+            # the later ones by position, which the API keeps stable, so every pass names them alike
+            while name in names:
+                name = f"{len(files)}_{name}"
+            names.add(name)
+            files.append((item, name))
+        return files
+
+    async def _fetch(self, item: dict, name: str, post_dir: Path, semaphore: asyncio.Semaphore):
+        dest = post_dir / name
+        hash_match = _HASH_PATH_RE.search(item["path"])
+        url = f"{self.target['site_base']}/data{item['path']}"
+        async with semaphore:
+            if self.progress is not None:
+                # Files run in parallel, so "start" (which implies the previous file finished) is not used
+                self.progress.current_file = name
+            self._record("active")
+            try:
+                fetched = await download_file(
+                    self.client, url, dest,
+                    expected_sha256=hash_match.group(1) if hash_match else None,
+                    limiter=self.limiter, host_limiter=self.host_limiter,
+                    on_bytes=lambda n: self._record("bytes", n),
+                    pause=self.pause_event, on_rate_limited=self._backoff,
+                    segments=self.segments, segment_client=self.segment_client
+                )
+            except Exception as e:
+                self.failed_files += 1
+                self._log(f"ERROR: Failed to download {name}: {e}")
+                self._record("error")
+                return
+        if fetched:
+            self._log(f"Downloaded: {dest.relative_to(self.download_dir)}")
+            self._record("done", (name, 0))
+        else:
+            self._log(f"Skipped (already complete): {dest.relative_to(self.download_dir)}")
+            self._record("skip")
+
+    async def run(self) -> int:
+        """Downloads everything; returns the number of files that failed."""
+        register_pause(self.task_id, self.pause_event)
+        pending = set()
+        try:
+            if self.username and self.password:
+                await self._login()
+            creator_dir = self.download_dir / self.target["service"] / await self._creator_name()
+            semaphore = asyncio.Semaphore(FILE_CONCURRENCY)
+            async for post in self.iter_posts():
+                title = sanitize_filename(post.get("title") or str(post.get("id")))
+                self._record("post", title)
+                post_dir = creator_dir / title
+                for item, name in self._post_files(post):
+                    pending.add(asyncio.create_task(self._fetch(item, name, post_dir, semaphore)))
+                # Keep the crawl only a little ahead of the downloads
+                if len(pending) > FILE_CONCURRENCY * 8:
+                    _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if pending:
+                await asyncio.gather(*pending)
+            return self.failed_files
+        finally:
+            for task in pending:
+                task.cancel()
+            unregister_pause(self.task_id)
+            await self.client.aclose()
+            if self.segment_client is not None:
+                await self.segment_client.aclose()
@@ -1,16 +1,21 @@
-
+"""
 独立的日志端点应用，运行在端口8901。
 提供调试日志访问功能，即使主应用崩溃也能工作。
 通过请求头 'X-Log-Access-Key' 进行认证。
+日志以流的形式分块输出（支持 tail / since / Range 以及 zstd / gzip 压缩），不会整体读入内存。
+"""
 
 import os
 import sys
+import asyncio
 from pathlib import Path
+from typing import Optional
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import PlainTextResponse
 import uvicorn
 import subprocess
 from .config import PROJECT_ROOT
+from .log_stream import file_response, logs_response
 
 # 配置
 LOG_PORT = 8901
@@ -25,26 +30,9 @@ LOG_FILES = [
 
 app = FastAPI(title="Web-DL-Manager Log Endpoint")
 
-def get_log_content(log_file: str) -> str:
-    """读取日志文件内容"""
-    try:
-        log_path = PROJECT_ROOT / log_file
-        if log_path.exists():
-            return log_path.read_text(encoding='utf-8', errors='ignore')
-        else:
-            return f"Log file not found: {log_file}"
-    except Exception as e:
-        return f"Error reading log file {log_file}: {str(e)}"
-
-def get_all_logs() -> str:
-    """获取所有日志文件的内容"""
-    result = []
-    for log_file in LOG_FILES:
-        content = get_log_content(log_file)
-        result.append(f"=== {log_file} ===")
-        result.append(content)
-        result.append("\n")
-    return "\n".join(result)
+def get_log_path(log_file: str) -> Path:
+    """日志文件的绝对路径（相对于项目根目录）"""
+    return PROJECT_ROOT / log_file
 
 @app.get("/")
 async def root():
@@ -58,6 +46,12 @@ async def root():
             "/logs": "Get all logs (requires X-Log-Access-Key header)",
             "/logs/{filename}": "Get specific log file (requires X-Log-Access-Key header)",
             "/health": "Health check"
+        },
+        "parameters": {
+            "tail": "Only the last N lines",
+            "since": "Only entries logged since a Unix timestamp or ISO date/time",
+            "Range": "Byte range of a single log (header)",
+            "Accept-Encoding": "zstd or gzip compresses the response (header)"
         }
     }
 
@@ -67,7 +61,7 @@ async def health_check():
     return {"status": "healthy", "service": "log_endpoint"}
 
 @app.get("/logs")
-async def get_logs(request: Request, access_key: str = None):
+async def get_logs(request: Request, access_key: str = None, tail: Optional[int] = None, since: Optional[str] = None):
     """获取所有日志内容，需要认证"""
     # 优先从URL参数获取密钥，如果没有则从请求头获取
     if access_key is None:
@@ -76,10 +70,10 @@ async def get_logs(request: Request, access_key: str = None):
     if access_key != LOG_ACCESS_KEY:
         raise HTTPException(status_code=403, detail="Invalid access key")
     
-    return PlainTextResponse(content=get_all_logs())
+    return logs_response([(log_file, get_log_path(log_file)) for log_file in LOG_FILES], request, tail=tail, since=since)
 
-@app.get("/logs/{filename}")
-async def get_log_file(filename: str, request: Request, access_key: str = None):
+@app.get("/logs/{filename:path}")
+async def get_log_file(filename: str, request: Request, access_key: str = None, tail: Optional[int] = None, since: Optional[str] = None):
     """获取特定日志文件内容，需要认证"""
     # 优先从URL参数获取密钥，如果没有则从请求头获取
     if access_key is None:
@@ -92,7 +86,11 @@ async def get_log_file(filename: str, request: Request, access_key: str = None):
     if filename not in LOG_FILES:
         raise HTTPException(status_code=404, detail="Log file not found")
     
-    return PlainTextResponse(content=get_log_content(filename))
+    log_path = get_log_path(filename)
+    if not log_path.exists():
+        return PlainTextResponse(content=f"Log file not found: {filename}")
+    # tail/since seek in the file, which is blocking I/O
+    return await asyncio.to_thread(file_response, log_path, request, tail=tail, since=since)
 
 def start_tunnel_if_needed():
     """启动内网穿透连接到日志端点（8901端口）"""
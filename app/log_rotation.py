@@ -0,0 +1,142 @@
+import os
+import re
+import gzip
+import shutil
+import logging
+import logging.handlers
+from pathlib import Path
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Application logs (main.log, camouflage.log, app.log) are configured before the database is up,
+# so their limits come from the environment
+DEFAULT_LOG_MAX_MB = 50
+DEFAULT_LOG_BACKUPS = 5
+DEFAULT_TASK_LOG_MAX_MB = 20
+# Share of a capped task log kept from its start; the rest of the cap is kept from its end
+TASK_LOG_HEAD_SHARE = 0.25
+# A trimmed log shrinks to this share of the cap, so it is not rewritten again on every flush
+TASK_LOG_TRIM_TO = 0.75
+TRIM_MARKER = "... [{omitted} bytes of log omitted] ...\n"
+_MARKER_RE = re.compile(rb"(?:^|(?<=\n))\.\.\. \[(\d+) bytes of log omitted\] \.\.\.\n")
+
+
+def _env_int(key: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(key, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def compressed_suffix() -> str:
+    return ".zst" if zstandard is not None else ".gz"
+
+
+def _namer(name: str) -> str:
+    return name + compressed_suffix()
+
+
+def _rotator(source: str, dest: str):
+    """Compresses the finished segment into dest and removes it (zstd, or gzip without zstandard)."""
+    try:
+        with open(source, "rb") as src, open(dest, "wb") as dst:
+            if zstandard is not None:
+                zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+            else:
+                with gzip.GzipFile(fileobj=dst, mode="wb") as gz:
+                    shutil.copyfileobj(src, gz)
+        os.remove(source)
+    except OSError:
+        # Never lose the segment: keep it uncompressed under the rotated name
+        os.replace(source, dest[:-len(compressed_suffix())])
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler whose old segments are compressed: main.log, main.log.1.zst, main.log.2.zst...
+    Sizes default to WDM_LOG_MAX_MB per segment and WDM_LOG_BACKUPS compressed segments.
+    """
+
+    def __init__(self, filename, max_mb: Optional[int] = None, backups: Optional[int] = None, encoding: str = "utf-8", **kwargs):
+        max_mb = _env_int("WDM_LOG_MAX_MB", DEFAULT_LOG_MAX_MB) if max_mb is None else max_mb
+        backups = _env_int("WDM_LOG_BACKUPS", DEFAULT_LOG_BACKUPS) if backups is None else backups
+        super().__init__(filename, mode="a", maxBytes=max_mb * 1024 * 1024, backupCount=backups, encoding=encoding, **kwargs)
+        self.namer = _namer
+        self.rotator = _rotator
+
+
+def rotating_handler_config(filename: str) -> dict:
+    """dictConfig entry for a compressing rotating file handler (uvicorn's log_config)."""
+    return {
+        "()": CompressingRotatingFileHandler,
+        "formatter": "default",
+        "level": "DEBUG",
+        "filename": filename,
+    }
+
+
+def rotated_segments(path: Path) -> list:
+    """Compressed segments of a log, oldest first."""
+    path = Path(path)
+    segments = []
+    for segment in path.parent.glob(f"{path.name}.*"):
+        number = segment.name[len(path.name) + 1:].split(".")[0]
+        if number.isdigit():
+            segments.append((int(number), segment))
+    return [segment for _, segment in sorted(segments, reverse=True)]
+
+
+def get_task_log_cap() -> int:
+    """Per-task log size cap in bytes (WDM_TASK_LOG_MAX_MB, 0 = unlimited)."""
+    from .database import db_config
+    try:
+        max_mb = float(db_config.get_config("WDM_TASK_LOG_MAX_MB", DEFAULT_TASK_LOG_MAX_MB) or DEFAULT_TASK_LOG_MAX_MB)
+    except (TypeError, ValueError):
+        max_mb = DEFAULT_TASK_LOG_MAX_MB
+    return int(max(0.0, max_mb) * 1024 * 1024)
+
+
+def trim_log(path: Path, max_bytes: int) -> int:
+    """
+    Shrinks a log that grew past max_bytes in place to TASK_LOG_TRIM_TO of it, keeping its first
+    lines (how the job started) and its last lines (how it is going) around a marker. The file is
+    rewritten on the same inode, so subprocesses appending to it keep working. Byte offsets taken
+    before a trim no longer point at the same text (and may lie past the new end); readers must
+    clamp them. Returns the bytes omitted so far (0 if untouched).
+    """
+    keep = int(max_bytes * TASK_LOG_TRIM_TO)
+    head_bytes = int(keep * TASK_LOG_HEAD_SHARE)
+    tail_bytes = keep - head_bytes
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size <= max_bytes:
+            return 0
+        f.seek(0)
+        start = f.read(head_bytes + 128)
+        # A marker from an earlier trim ends the head that trim kept
+        found = _MARKER_RE.search(start)
+        if found and found.start() <= head_bytes:
+            head = start[:found.start()]
+            omitted_before = int(found.group(1))
+            old_marker = found.end() - found.start()
+        else:
+            cut = start.rfind(b"\n", 0, head_bytes)
+            head = start[:cut + 1] if cut != -1 else start[:head_bytes]
+            omitted_before = old_marker = 0
+        f.seek(size - tail_bytes)
+        tail = f.read()
+        cut = tail.find(b"\n")
+        if cut != -1:
+            tail = tail[cut + 1:]
+        omitted = omitted_before + size - len(head) - old_marker - len(tail)
+        f.seek(len(head))
+        f.write(TRIM_MARKER.format(omitted=omitted).encode("utf-8"))
+        f.write(tail)
+        f.truncate()
+    return omitted
@@ -0,0 +1,255 @@
+import re
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+TEXT_MEDIA_TYPE = "text/plain; charset=utf-8"
+# How far past an offset to look for a timestamped line while bisecting for since=
+SINCE_SCAN_LIMIT = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# logging's default asctime: "2024-05-01 12:00:00,123 - ..."
+_TIMESTAMP_RE = re.compile(rb"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range `Range: bytes=a-b` header into an inclusive (start, end) within size.
+    Returns None for no (or an unsupported multi-range) header; raises RangeNotSatisfiable.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def iter_file(path: Path, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Reads bytes start..end (inclusive) of a file in chunks; a log may grow meanwhile, so the end is fixed up front."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def tail_offset(path: Path, lines: int) -> int:
+    """Offset where the last `lines` lines of the file start, found by reading backwards from EOF."""
+    with open(path, "rb") as f:
+        position = f.seek(0, 2)
+        if lines <= 0:
+            return position
+        # A trailing newline ends the last line, it does not start another one
+        f.seek(max(0, position - 1))
+        if f.read(1) == b"\n":
+            position -= 1
+        remaining = lines
+        while position > 0:
+            step = min(CHUNK_SIZE, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step)
+            index = len(block)
+            while True:
+                index = block.rfind(b"\n", 0, index)
+                if index == -1:
+                    break
+                remaining -= 1
+                if remaining == 0:
+                    return position + index + 1
+        return 0
+
+
+def parse_since(value: Optional[str]) -> Optional[datetime]:
+    """since= as a Unix timestamp or an ISO date/time (local time, like the log timestamps)."""
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid since value: {value}")
+
+
+def _next_timestamp(f, offset: int) -> Tuple[int, Optional[datetime]]:
+    """Start and time of the first timestamped line beginning at or after offset."""
+    f.seek(offset)
+    if offset:
+        f.readline()  # the rest of the line offset points into
+    scanned = 0
+    while scanned < SINCE_SCAN_LIMIT:
+        position = f.tell()
+        line = f.readline()
+        if not line:
+            return position, None
+        match = _TIMESTAMP_RE.match(line)
+        if match:
+            try:
+                return position, datetime.strptime(match.group(1).decode(), "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                pass
+        scanned += len(line)
+    return f.tell(), None
+
+
+def since_offset(path: Path, since: datetime) -> int:
+    """
+    Offset of the first entry logged at or after since. Log lines are in time order, so this is a
+    binary search over byte offsets (a few reads) rather than a scan; untimestamped lines
+    (tracebacks) stay with the entry above them.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            _, timestamp = _next_timestamp(f, middle)
+            if timestamp is None or timestamp >= since:
+                high = middle
+            else:
+                low = middle + 1
+        position, timestamp = _next_timestamp(f, low)
+        if timestamp is None:
+            # No timestamps at all: nothing to filter on
+            return 0 if low == 0 else size
+        return position
+
+
+def log_start(path: Path, tail: Optional[int] = None, since: Optional[datetime] = None) -> int:
+    """Where to start serving a log for tail=/since= (both may be given: the last N lines since)."""
+    start = 0
+    if since is not None:
+        start = since_offset(path, since)
+    if tail is not None:
+        start = max(start, tail_offset(path, tail))
+    return start
+
+
+def choose_encoding(request: Request) -> Optional[str]:
+    """zstd or gzip if the client accepts it (zstd only with the zstandard package), else None."""
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                pass
+        if name:
+            accepted[name.lower()] = quality
+    if zstandard is not None and accepted.get("zstd", 0) > 0:
+        return "zstd"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def encode_chunks(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Compresses a byte stream on the fly, flushing per chunk so a slow log still arrives promptly."""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        flush_block = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        flush_block = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + flush_block()
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _streaming(chunks: Iterable[bytes], request: Request, media_type: str, headers: dict, status_code: int = 200) -> StreamingResponse:
+    encoding = choose_encoding(request)
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    if encoding:
+        headers.pop("Content-Length", None)
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(encode_chunks(chunks, encoding), status_code=status_code, media_type=media_type, headers=headers)
+
+
+def file_response(path: Path, request: Request, media_type: str = TEXT_MEDIA_TYPE,
+                  tail: Optional[int] = None, since: Optional[str] = None) -> Response:
+    """
+    Streams a (log) file without reading it into memory: the last `tail` lines and/or the entries
+    since a time, or a byte Range of it. Compressed with zstd/gzip when the client accepts it,
+    except for Range responses (their offsets refer to the plain file).
+    """
+    size = Path(path).stat().st_size
+    headers = {"Accept-Ranges": "bytes"}
+    since_time = parse_since(since)
+    if tail is not None or since_time is not None:
+        start = log_start(path, tail, since_time)
+        headers["Content-Length"] = str(size - start)
+        return _streaming(iter_file(path, start, size - 1), request, media_type, headers)
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return _streaming(iter_file(path, 0, size - 1), request, media_type, headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(iter_file(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+
+def _iter_logs(logs: List[Tuple[str, Path]], tail: Optional[int], since: Optional[datetime]) -> Iterator[bytes]:
+    for name, path in logs:
+        yield f"=== {name} ===\n".encode("utf-8")
+        try:
+            if not path.exists():
+                yield f"Log file not found: {name}\n".encode("utf-8")
+            else:
+                size = path.stat().st_size
+                yield from iter_file(path, log_start(path, tail, since), size - 1)
+        except OSError as e:
+            yield f"Error reading log file {name}: {e}\n".encode("utf-8")
+        yield b"\n\n"
+
+
+def logs_response(logs: List[Tuple[str, Path]], request: Request, tail: Optional[int] = None,
+                  since: Optional[str] = None) -> StreamingResponse:
+    """Streams several logs one after another, each under a "=== name ===" header."""
+    return _streaming(_iter_logs(logs, tail, parse_since(since)), request, TEXT_MEDIA_TYPE, {})
@@ -26,12 +26,18 @@ from starlette.middleware.sessions import SessionMiddleware
 from .database import init_db, User, db_config
 from . import redis_client  # Initialize Redis client
 from .logging_handler import MySQLLogHandler, cleanup_old_logs, update_log_handlers
+from .log_rotation import CompressingRotatingFileHandler, rotating_handler_config
 from .utils import restore_gallery_dl_config, backup_gallery_dl_config
-from .config import BASE_DIR, APP_USERNAME, APP_PASSWORD, PROJECT_ROOT
+from .config import BASE_DIR, APP_USERNAME, APP_PASSWORD, PROJECT_ROOT, PROXY_POOL_FILE
 from .auth import get_password_hash
 from .templating import templates
 from .i18n import get_lang
-from .tasks import unified_periodic_sync
+from .sync import unified_periodic_sync
+from .proxy_pool import proxy_pool
+from .gdl_engine import worker_pool as gdl_worker_pool
+from . import archive_builder
+from .retention import retention_janitor
+from .disk_manager import disk_janitor
 
 # Import routers
 from .routers import camouflage, main_ui, api, terminal
@@ -60,7 +66,7 @@ async def lifespan(app: FastAPI):
     logs_dir.mkdir(exist_ok=True)
     
     # Add file handler for startup logs, regardless of DEBUG_MODE
-    file_handler = logging.FileHandler(logs_dir / "app.log", encoding="utf-8")
+    file_handler = CompressingRotatingFileHandler(logs_dir / "app.log")
     file_handler.setLevel(logging.DEBUG)
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     file_handler.setFormatter(formatter)
@@ -82,6 +88,11 @@ async def lifespan(app: FastAPI):
     # Start periodic background tasks
     cleanup_task = asyncio.create_task(periodic_log_cleanup())
     sync_task = asyncio.create_task(unified_periodic_sync())
+    retention_task = asyncio.create_task(retention_janitor())
+    disk_task = asyncio.create_task(disk_janitor())
+    # Keep the proxy pool warm if auto_proxy has been used before
+    if PROXY_POOL_FILE.exists():
+        proxy_pool.start()
     
     yield
     
@@ -91,6 +102,11 @@ async def lifespan(app: FastAPI):
     
     cleanup_task.cancel()
     sync_task.cancel()
+    retention_task.cancel()
+    disk_task.cancel()
+    await proxy_pool.stop()
+    await gdl_worker_pool.shutdown()
+    archive_builder.shutdown()
 
 async def periodic_log_cleanup():
     while True:
@@ -165,14 +181,8 @@ def run_camouflage_app():
             },
         },
         "handlers": {
-            "file": {
-                "class": "logging.FileHandler",
-                "formatter": "default",
-                "level": "DEBUG",
-                "filename": str(logs_dir / "camouflage.log"),
-                "mode": "a",
-                "encoding": "utf-8",
-            }
+            # Rotated by size; old segments are kept compressed (camouflage.log.1.zst, ...)
+            "file": rotating_handler_config(str(logs_dir / "camouflage.log")),
         },
         "root": {
             "level": "DEBUG",
@@ -211,14 +221,8 @@ def run_main_app():
             },
         },
         "handlers": {
-            "file": {
-                "class": "logging.FileHandler",
-                "formatter": "default",
-                "level": "DEBUG",
-                "filename": str(logs_dir / "main.log"),
-                "mode": "a",
-                "encoding": "utf-8",
-            }
+            # Rotated by size; old segments are kept compressed (main.log.1.zst, ...)
+            "file": rotating_handler_config(str(logs_dir / "main.log")),
         },
         "root": {
             "level": "DEBUG",
@@ -0,0 +1,87 @@
+import os
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (path relative to the root with "/" separators, size in bytes, mtime)
+ManifestEntry = Tuple[str, int, float]
+
+
+def scan_tree(root: Path) -> List[ManifestEntry]:
+    """Regular files under root from one os.scandir walk (no per-file Path objects or extra stat calls)."""
+    entries: List[ManifestEntry] = []
+    stack = [("", str(root))]
+    while stack:
+        rel_dir, path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((rel, entry.path))
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            entries.append((rel, st.st_size, st.st_mtime))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.warning(f"[Manifest] Could not scan {path}: {e}")
+    entries.sort()
+    return entries
+
+
+class Manifest:
+    """The files of one download directory, walked once and shared by counting, split planning, uploads and cleanup."""
+
+    def __init__(self, root: Path, entries: List[ManifestEntry]):
+        self.root = Path(root)
+        self.entries = entries
+        self.scanned_at = time.time()
+        self.size = sum(size for _, size, _ in entries)
+
+    @property
+    def count(self) -> int:
+        return len(self.entries)
+
+    def paths(self) -> List[str]:
+        return [path for path, _, _ in self.entries]
+
+    def directories(self) -> List[str]:
+        """Every directory that holds files (and their parents), parents first."""
+        directories = set()
+        for path, _, _ in self.entries:
+            parent = os.path.dirname(path)
+            while parent and parent not in directories:
+                directories.add(parent)
+                parent = os.path.dirname(parent)
+        return sorted(directories)
+
+    def summary(self) -> dict:
+        return {"count": self.count, "size": self.size, "scanned_at": self.scanned_at}
+
+
+# Manifests of finished downloads by directory; dropped when the job cleans up
+_manifests: Dict[str, Manifest] = {}
+
+
+def scan_manifest(root: Path) -> Manifest:
+    """Walks root and caches the result; call once the download is complete."""
+    manifest = Manifest(root, scan_tree(Path(root)) if Path(root).is_dir() else [])
+    _manifests[str(root)] = manifest
+    return manifest
+
+
+def get_manifest(root: Path) -> Manifest:
+    """The cached manifest of root, or a fresh (uncached) walk if the download has none yet."""
+    manifest = _manifests.get(str(root))
+    if manifest is not None:
+        return manifest
+    return Manifest(root, scan_tree(Path(root)) if Path(root).is_dir() else [])
+
+
+def forget_manifest(root: Path):
+    _manifests.pop(str(root), None)
@@ -4,6 +4,8 @@ import urllib.parse
 import time
 from pathlib import Path
 
+from .task_log import append_log
+
 class OpenlistError(Exception):
     """Custom exception for Openlist operations."""
     pass
@@ -11,8 +13,7 @@ class OpenlistError(Exception):
 def _log(status_file: Path, message: str):
     """Appends a message to the status log file if provided."""
     if status_file:
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write(message + "\n")
+        append_log(status_file, message + "\n")
 
 def login(base_url: str, username: str, password: str, status_file: Path = None) -> str:
     """
@@ -184,6 +185,37 @@ def upload_file(base_url: str, token: str, local_file: Path, remote_dir: str, st
     # Return the path even if upload failed after 50 attempts, so that other files can continue uploading
     return full_path
 
+def upload_stream(base_url: str, token: str, chunks, remote_path: str, status_file: Path = None) -> str:
+    """
+    Uploads a body of unknown length (an iterator of bytes) to remote_path with a chunked PUT to /api/fs/put.
+    Unlike upload_file there are no retries: the iterator cannot be rewound.
+    """
+    _log(status_file, f"Starting streamed upload to '{remote_path}'...")
+    url = base_url.rstrip('/') + '/api/fs/put'
+    headers = {
+        'Authorization': token,
+        'File-Path': urllib.parse.quote(remote_path),
+        'Content-Type': 'application/octet-stream',
+        'As-Task': 'false'
+    }
+    try:
+        # A generator body makes requests send Transfer-Encoding: chunked
+        resp = requests.put(url, data=chunks, headers=headers, timeout=300)
+        resp.raise_for_status()
+        resp_json = resp.json()
+    except requests.RequestException as e:
+        _log(status_file, f"Streamed upload to '{remote_path}' failed: {e}")
+        raise OpenlistError(f"Upload request failed: {e}")
+    except ValueError:
+        _log(status_file, f"Streamed upload to '{remote_path}' returned invalid JSON: {resp.text}")
+        raise OpenlistError(f"Upload response was not valid JSON: {resp.text}")
+    if resp_json.get('code') != 200:
+        message = resp_json.get('message', 'Unknown error')
+        _log(status_file, f"Streamed upload to '{remote_path}' failed: {message}")
+        raise OpenlistError(f"Upload API returned an error: {message}")
+    _log(status_file, f"Successfully streamed '{remote_path}'.")
+    return remote_path
+
 def verify_upload(base_url: str, token: str, remote_path: str, status_file: Path = None) -> bool:
     """
     Verifies if a file was uploaded successfully.
@@ -0,0 +1,190 @@
+import re
+import time
+import codecs
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from .utils import update_task_status
+from .task_log import append_log
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between task status rewrites triggered by downloader output
+PROGRESS_UPDATE_INTERVAL = 1.0
+READ_CHUNK_SIZE = 64 * 1024
+
+_SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(value: str) -> int:
+    """Parses sizes like '12.5 MB', '800KiB' or '1024' into bytes."""
+    match = re.match(r'^\s*([\d.]+)\s*([KMGT]?)(?:i?B)?\s*$', value or "", re.IGNORECASE)
+    if not match:
+        return 0
+    try:
+        return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+    except ValueError:
+        return 0
+
+
+# --- Output Parsers ---
+# A parser maps one output line to (event, value) or None.
+# Events: "post" (post title), "start" (file name), "done" ((file name, size)), "bytes" (int), "skip", "error".
+
+_GDL_LOG_RE = re.compile(r'^\[(?P<logger>[\w.-]+)\]\[(?P<level>debug|info|warning|error|critical)\]', re.IGNORECASE)
+_GDL_SKIP_PREFIX = "# "
+
+
+def make_gallery_dl_parser(base_dir: Path) -> Callable[[str], Optional[Tuple[str, object]]]:
+    """
+    Returns a parser for gallery-dl output. In pipe mode gallery-dl prints the path of every
+    finished file to stdout and prefixes skipped files with '# '; log records look like
+    '[extractor][level] message'.
+    """
+    base_prefix = str(base_dir)
+
+    def parse_gallery_dl_line(line: str) -> Optional[Tuple[str, object]]:
+        if line.startswith(_GDL_SKIP_PREFIX):
+            return ("skip", None)
+        match = _GDL_LOG_RE.match(line)
+        if match:
+            if match.group("level").lower() in ("error", "critical"):
+                return ("error", None)
+            return None
+        if line.startswith(base_prefix):
+            path = Path(line.strip())
+            try:
+                size = path.stat().st_size
+            except OSError:
+                size = 0
+            return ("done", (path.name, size))
+        return None
+
+    return parse_gallery_dl_line
+
+
+class DownloadProgress:
+    """Structured download counters for a task, published to the task status at a throttled rate."""
+
+    def __init__(self, task_id: str, parser: Optional[Callable[[str], Optional[Tuple[str, object]]]] = None, interval: float = PROGRESS_UPDATE_INTERVAL):
+        self.task_id = task_id
+        self.parser = parser
+        self.interval = interval
+        self.files_downloaded = 0
+        self.bytes_downloaded = 0
+        self.skipped = 0
+        self.errors = 0
+        self.current_post = None
+        self.current_file = None
+        self.started_at = time.time()
+        self.last_activity = self.started_at
+        self._last_publish = 0
+        self._last_rate_time = self.started_at
+        self._last_rate_bytes = 0
+        self._last_rate_files = 0
+        self.rate = 0.0
+        self.files_rate = 0.0
+        self._pending_done = False
+
+    def feed(self, line: str):
+        """Parses one output line and updates the counters."""
+        if self.parser is None:
+            return
+        event = self.parser(line)
+        if event:
+            self.record(*event)
+
+    def record(self, kind: str, value=None):
+        """Updates the counters from one event; any event (even an unknown kind) counts as activity."""
+        self.last_activity = time.time()
+        if kind == "post":
+            self.current_post = value
+        elif kind == "start":
+            # A new file starting implies the previous one (if any) finished
+            if self._pending_done:
+                self.files_downloaded += 1
+            self.current_file = value
+            self._pending_done = True
+        elif kind == "done":
+            name, size = value
+            self.files_downloaded += 1
+            self.bytes_downloaded += size
+            self.current_file = name
+            self._pending_done = False
+        elif kind == "bytes":
+            self.bytes_downloaded += value
+        elif kind == "skip":
+            self.skipped += 1
+            self._pending_done = False
+        elif kind == "error":
+            self.errors += 1
+            self._pending_done = False
+
+    def snapshot(self) -> dict:
+        return {
+            "files_downloaded": self.files_downloaded,
+            "bytes_downloaded": self.bytes_downloaded,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "current_post": self.current_post,
+            "current_file": self.current_file,
+            "rate": round(self.rate, 1),
+            "files_per_second": round(self.files_rate, 2),
+            "elapsed": int(time.time() - self.started_at),
+            "last_activity": self.last_activity,
+        }
+
+    def publish(self, force: bool = False):
+        """Writes the counters to the task status, at most once per interval unless forced."""
+        now = time.time()
+        if not force and now - self._last_publish < self.interval:
+            return
+        elapsed = now - self._last_rate_time
+        if elapsed > 0:
+            self.rate = (self.bytes_downloaded - self._last_rate_bytes) / elapsed
+            self.files_rate = (self.files_downloaded - self._last_rate_files) / elapsed
+        self._last_rate_time = now
+        self._last_rate_bytes = self.bytes_downloaded
+        self._last_rate_files = self.files_downloaded
+        self._last_publish = now
+
+        if force and self._pending_done:
+            self.files_downloaded += 1
+            self._pending_done = False
+
+        update_task_status(self.task_id, {
+            "progress_count": f"{self.files_downloaded} files",
+            "download_stats": self.snapshot()
+        })
+
+
+async def stream_process_output(stream: asyncio.StreamReader, log_path: Path, progress: Optional[DownloadProgress] = None):
+    """
+    Reads subprocess output in large chunks, appends each chunk to the task log in one write,
+    and feeds complete lines (split on \\n or \\r) to the progress tracker.
+    """
+    remainder = ""
+    # Incremental decoding keeps multi-byte characters intact across chunk boundaries
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        text = decoder.decode(chunk)
+        append_log(log_path, text)
+        if progress is None:
+            continue
+
+        lines = re.split(r'[\r\n]', remainder + text)
+        remainder = lines.pop()
+        for line in lines:
+            if line:
+                progress.feed(line)
+        progress.publish()
+
+    if progress is not None:
+        if remainder:
+            progress.feed(remainder)
+        progress.publish(force=True)
@@ -0,0 +1,257 @@
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from .config import PROXY_POOL_FILE
+from .task_log import append_log
+
+logger = logging.getLogger(__name__)
+
+PROXY_LIST_URL = "https://raw.githubusercontent.com/TheSpeedX/PROXY-List/master/http.txt"
+PROXY_TEST_URL = "https://www.google.com"
+PROXY_TEST_TIMEOUT = 5  # seconds
+
+LIST_REFRESH_INTERVAL = 3600  # re-download the public list at most this often
+CHECK_INTERVAL = 120  # seconds between background health-check rounds
+CHECK_CONCURRENCY = 64  # simultaneous probes; replaces the old 3000-client burst
+CANDIDATES_PER_ROUND = 256  # untested proxies probed per round while the pool is short
+TARGET_HEALTHY = 20  # keep probing new candidates until this many proxies are healthy
+MAX_TRACKED = 500  # scored proxies kept between rounds (and on disk)
+SAVE_INTERVAL = 300
+
+# Success/failure counts halve over this period, so old results matter less
+DECAY_HALF_LIFE = 3600  # seconds
+LATENCY_EWMA_ALPHA = 0.3
+MIN_HEALTHY_SCORE = 0.5
+# How long a job waits for the first healthy proxy when the pool is still empty
+DEMAND_WAIT_TIMEOUT = 120
+
+
+class ProxyPool:
+    """
+    Long-lived pool of public HTTP proxies. A background loop probes known and new proxies
+    with bounded concurrency; each proxy gets a score from its decayed success rate and
+    smoothed latency, so jobs can be handed a good proxy without probing anything themselves.
+    """
+
+    def __init__(self, state_file: Path = PROXY_POOL_FILE):
+        self.state_file = Path(state_file)
+        self._entries: Dict[str, dict] = {}
+        self._candidates: List[str] = []
+        self._list_fetched_at = 0.0
+        self._last_saved = 0.0
+        self._task: Optional[asyncio.Task] = None
+        # Created in start() so they belong to the running event loop
+        self._wakeup: Optional[asyncio.Event] = None
+        self._healthy_event: Optional[asyncio.Event] = None
+        self._loaded = False
+
+    # --- Scoring ---
+
+    def _decay(self, entry: dict, now: float):
+        elapsed = now - entry.get("updated_at", now)
+        if elapsed > 0:
+            factor = math.pow(0.5, elapsed / DECAY_HALF_LIFE)
+            entry["successes"] *= factor
+            entry["failures"] *= factor
+        entry["updated_at"] = now
+
+    def _score(self, entry: dict) -> float:
+        total = entry["successes"] + entry["failures"]
+        latency = entry.get("latency")
+        if total <= 0 or latency is None:
+            # Never answered a probe
+            return 0.0
+        # Laplace smoothing: one lucky probe does not outrank a long good record
+        success_rate = (entry["successes"] + 1) / (total + 2)
+        return round(success_rate * 10 / (1 + latency), 4)
+
+    def record(self, proxy: str, success: bool, latency: Optional[float] = None):
+        """Records a probe or real-job result for a proxy."""
+        now = time.time()
+        entry = self._entries.get(proxy)
+        if entry is None:
+            entry = {"successes": 0.0, "failures": 0.0, "latency": None, "updated_at": now}
+            self._entries[proxy] = entry
+        self._decay(entry, now)
+        if success:
+            entry["successes"] += 1
+            if latency is not None:
+                previous = entry.get("latency")
+                entry["latency"] = latency if previous is None else (
+                    LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * previous)
+        else:
+            entry["failures"] += 1
+        entry["last_checked"] = now
+        entry["score"] = self._score(entry)
+        if success and entry["score"] >= MIN_HEALTHY_SCORE and self._healthy_event:
+            self._healthy_event.set()
+
+    def ranked(self) -> List[str]:
+        """Healthy proxies, best first."""
+        healthy = [(e["score"], p) for p, e in self._entries.items() if e.get("score", 0) >= MIN_HEALTHY_SCORE]
+        return [p for _, p in sorted(healthy, reverse=True)]
+
+    def stats(self) -> dict:
+        ranked = self.ranked()
+        return {
+            "tracked": len(self._entries),
+            "healthy": len(ranked),
+            "candidates": len(self._candidates),
+            "best": ranked[:3],
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    # --- Persistence ---
+
+    def _load(self):
+        self._loaded = True
+        try:
+            data = json.loads(self.state_file.read_text(encoding="utf-8"))
+            self._entries = {p: e for p, e in data.get("entries", {}).items() if "successes" in e}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"[ProxyPool] Failed to load saved pool: {e}")
+
+    def _save(self):
+        data = {"saved_at": time.time(), "entries": self._entries}
+        tmp_path = self.state_file.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        tmp_path.replace(self.state_file)
+
+    def _prune(self):
+        # Proxies that keep failing are forgotten; they may come back as fresh candidates later
+        for proxy, entry in list(self._entries.items()):
+            if entry["failures"] >= 3 and entry.get("score", 0) < MIN_HEALTHY_SCORE:
+                del self._entries[proxy]
+        if len(self._entries) <= MAX_TRACKED:
+            return
+        ordered = sorted(self._entries.items(), key=lambda item: item[1].get("score", 0), reverse=True)
+        self._entries = dict(ordered[:MAX_TRACKED])
+
+    # --- Health checks ---
+
+    async def _fetch_list(self):
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.get(PROXY_LIST_URL)
+            response.raise_for_status()
+        proxies = {line.strip() for line in response.text.splitlines() if line.strip()}
+        self._candidates = list(proxies - set(self._entries))
+        random.shuffle(self._candidates)
+        self._list_fetched_at = time.time()
+        logger.info(f"[ProxyPool] Loaded {len(proxies)} proxies from public list")
+
+    async def _probe(self, proxy: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                async with httpx.AsyncClient(proxy=f"http://{proxy}", timeout=PROXY_TEST_TIMEOUT) as client:
+                    response = await client.get(PROXY_TEST_URL)
+                    response.raise_for_status()
+            except Exception:
+                self.record(proxy, False)
+                return
+            self.record(proxy, True, time.monotonic() - started)
+
+    async def check_round(self):
+        """Re-probes tracked proxies and, while the pool is short, a batch of new candidates."""
+        if time.time() - self._list_fetched_at > LIST_REFRESH_INTERVAL or not (self._candidates or self._entries):
+            try:
+                await self._fetch_list()
+            except Exception as e:
+                logger.warning(f"[ProxyPool] Failed to fetch proxy list: {e}")
+
+        to_check = list(self._entries)
+        if len(self.ranked()) < TARGET_HEALTHY:
+            batch, self._candidates = self._candidates[:CANDIDATES_PER_ROUND], self._candidates[CANDIDATES_PER_ROUND:]
+            to_check.extend(batch)
+
+        if to_check:
+            semaphore = asyncio.Semaphore(CHECK_CONCURRENCY)
+            await asyncio.gather(*(self._probe(p, semaphore) for p in to_check))
+        self._prune()
+
+        if time.time() - self._last_saved > SAVE_INTERVAL:
+            try:
+                await asyncio.to_thread(self._save)
+                self._last_saved = time.time()
+            except OSError as e:
+                logger.warning(f"[ProxyPool] Failed to save pool: {e}")
+
+    async def _run(self):
+        while True:
+            # Cleared before the round, so a job asking for a proxy mid-round triggers another one right after
+            self._wakeup.clear()
+            try:
+                await self.check_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[ProxyPool] Health check round failed: {e}")
+            # A short pool checks again sooner so waiting jobs are not stuck for a full interval
+            interval = CHECK_INTERVAL if len(self.ranked()) >= TARGET_HEALTHY else CHECK_INTERVAL / 4
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- Public API ---
+
+    def start(self):
+        """Starts the background health checker (idempotent)."""
+        if not self._loaded:
+            self._load()
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._healthy_event = asyncio.Event()
+            if self.ranked():
+                self._healthy_event.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._entries:
+            try:
+                await asyncio.to_thread(self._save)
+            except OSError as e:
+                logger.warning(f"[ProxyPool] Failed to save pool: {e}")
+
+    async def get_proxy(self, status_file: Optional[Path] = None, exclude=()) -> Optional[str]:
+        """
+        Returns a healthy proxy right away, picking among the best few so concurrent jobs
+        spread out. If the pool is still empty, waits up to DEMAND_WAIT_TIMEOUT for the
+        checker to find one, and returns None rather than blocking forever.
+        """
+        self.start()
+        ranked = [p for p in self.ranked() if p not in exclude]
+        if not ranked:
+            append_log(status_file, "Proxy pool is empty, waiting for the health checker...\n")
+            self._healthy_event.clear()
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._healthy_event.wait(), timeout=DEMAND_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            ranked = [p for p in self.ranked() if p not in exclude]
+        if not ranked:
+            append_log(status_file, f"No working proxy found within {DEMAND_WAIT_TIMEOUT}s; continuing without proxy.\n")
+            return None
+        proxy = random.choice(ranked[:3])
+        entry = self._entries[proxy]
+        append_log(status_file, f"Using pooled proxy: {proxy} (score {entry['score']}, latency {entry['latency']:.2f}s)\n")
+        return proxy
+
+
+proxy_pool = ProxyPool()
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from .database import db_config
+from .config import RETAINED_DIR
+from .manifest import Manifest
+
+logger = logging.getLogger(__name__)
+
+# WDM_RETENTION_POLICY values
+KEEP_NOTHING = "none"
+KEEP_MANIFEST = "manifest"
+KEEP_HARDLINKS = "hardlink"
+KEEP_FAILED = "failed"
+POLICIES = (KEEP_NOTHING, KEEP_MANIFEST, KEEP_HARDLINKS, KEEP_FAILED)
+
+DEFAULT_HOURS = 24
+DEFAULT_BUDGET_GB = 10
+JANITOR_INTERVAL = 600  # seconds
+META_FILE = "retention.json"
+MANIFEST_FILE = "manifest.jsonl"
+
+
+def get_retention_settings() -> tuple:
+    """Returns (policy, hours, budget_bytes)."""
+    policy = str(db_config.get_config("WDM_RETENTION_POLICY", KEEP_NOTHING) or KEEP_NOTHING).lower()
+    if policy not in POLICIES:
+        policy = KEEP_NOTHING
+    try:
+        hours = float(db_config.get_config("WDM_RETENTION_HOURS", DEFAULT_HOURS) or DEFAULT_HOURS)
+    except (TypeError, ValueError):
+        hours = DEFAULT_HOURS
+    try:
+        budget_gb = float(db_config.get_config("WDM_RETENTION_MAX_GB", DEFAULT_BUDGET_GB) or DEFAULT_BUDGET_GB)
+    except (TypeError, ValueError):
+        budget_gb = DEFAULT_BUDGET_GB
+    return policy, hours, int(budget_gb * 1024 ** 3)
+
+
+def _link_or_copy(source: Path, target: Path) -> bool:
+    """Hardlinks source to target; falls back to a copy across filesystems. Returns True if it was a link."""
+    try:
+        os.link(source, target)
+        return True
+    except OSError:
+        shutil.copy2(source, target)
+        return False
+
+
+def retain_download(task_id: str, download_dir: Path, manifest: Optional[Manifest], failed: bool) -> Optional[dict]:
+    """
+    Applies the retention policy to a finished job's download before it is deleted. Files are kept
+    as hardlinks (no data is copied) under RETAINED_DIR/<task_id>/files, next to a manifest and a
+    small metadata file; the janitor expires them after WDM_RETENTION_HOURS and keeps the total
+    within WDM_RETENTION_MAX_GB. Returns the metadata, or None if nothing was kept.
+    """
+    policy, hours, budget = get_retention_settings()
+    if policy == KEEP_NOTHING or manifest is None:
+        return None
+    if policy == KEEP_FAILED and not failed:
+        return None
+    keep_files = policy in (KEEP_HARDLINKS, KEEP_FAILED)
+    if keep_files and budget and manifest.size > budget:
+        logger.info(f"[Retention] Download of {task_id} ({manifest.size} bytes) exceeds the retention budget; keeping its manifest only.")
+        keep_files = False
+
+    task_dir = RETAINED_DIR / task_id
+    if task_dir.exists():
+        shutil.rmtree(task_dir, ignore_errors=True)
+    task_dir.mkdir(parents=True, exist_ok=True)
+    with open(task_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        for path, size, mtime in manifest.entries:
+            f.write(json.dumps({"path": path, "size": size, "mtime": mtime}, ensure_ascii=False) + "\n")
+
+    copied = 0
+    if keep_files:
+        files_dir = task_dir / "files"
+        for path, size, _ in manifest.entries:
+            target = files_dir / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                if not _link_or_copy(download_dir / path, target):
+                    copied += size
+            except OSError as e:
+                logger.warning(f"[Retention] Could not keep {path} of {task_id}: {e}")
+        if copied:
+            logger.info(f"[Retention] {task_id}: download is on another filesystem, {copied} bytes were copied instead of linked.")
+
+    meta = {
+        "task_id": task_id,
+        "policy": policy,
+        "failed": failed,
+        "files_kept": keep_files,
+        "count": manifest.count,
+        "size": manifest.size if keep_files else 0,
+        "retained_at": time.time(),
+        "expires_at": time.time() + hours * 3600,
+        "path": str(task_dir),
+    }
+    with open(task_dir / META_FILE, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def discard_retained(task_id: str):
+    shutil.rmtree(RETAINED_DIR / task_id, ignore_errors=True)
+
+
+def _retained_entries() -> List[dict]:
+    entries = []
+    if not RETAINED_DIR.exists():
+        return entries
+    for task_dir in RETAINED_DIR.iterdir():
+        try:
+            with open(task_dir / META_FILE, "r", encoding="utf-8") as f:
+                entries.append(json.load(f))
+        except (OSError, ValueError):
+            # Half-written (crash during retention): meaningless, drop it
+            shutil.rmtree(task_dir, ignore_errors=True)
+    return entries
+
+
+def enforce_retention() -> dict:
+    """Removes expired retained downloads, then the oldest ones until the total fits the budget."""
+    _, _, budget = get_retention_settings()
+    now = time.time()
+    removed = 0
+    kept = []
+    for entry in _retained_entries():
+        if entry.get("expires_at", 0) <= now:
+            discard_retained(entry["task_id"])
+            removed += 1
+        else:
+            kept.append(entry)
+    total = sum(entry.get("size", 0) for entry in kept)
+    if budget:
+        for entry in sorted(kept, key=lambda e: e.get("retained_at", 0)):
+            if total <= budget:
+                break
+            discard_retained(entry["task_id"])
+            total -= entry.get("size", 0)
+            removed += 1
+    if removed:
+        logger.info(f"[Retention] Janitor removed {removed} retained download(s); {total} bytes retained.")
+    return {"removed": removed, "retained_bytes": total}
+
+
+async def retention_janitor():
+    """Background loop enforcing the retention policy."""
+    while True:
+        try:
+            await asyncio.to_thread(enforce_retention)
+        except Exception as e:
+            logger.error(f"[Retention] Janitor run failed: {e}")
+        await asyncio.sleep(JANITOR_INTERVAL)
@@ -0,0 +1,130 @@
+import re
+import shlex
+import random
+from typing import Optional
+
+# Failure classes
+TRANSIENT = "transient"
+RATE_LIMITED = "rate_limited"
+AUTH = "auth"
+PERMANENT = "permanent"
+
+# Per-class retry budget (total attempts, including the first) and exponential backoff bounds in seconds
+RETRY_POLICIES = {
+    TRANSIENT: {"max_attempts": 3, "base_delay": 5, "max_delay": 60},
+    RATE_LIMITED: {"max_attempts": 5, "base_delay": 60, "max_delay": 900},
+    AUTH: {"max_attempts": 1, "base_delay": 0, "max_delay": 0},
+    PERMANENT: {"max_attempts": 1, "base_delay": 0, "max_delay": 0},
+}
+
+# How much of the attempt's output is inspected when classifying a failure
+OUTPUT_TAIL_BYTES = 16 * 1024
+
+_RATE_LIMIT_RE = re.compile(r'\b429\b|Too Many Requests|rate.?limit|quota exceeded|slow down', re.IGNORECASE)
+# The download sites behind DDoS protection answer floods with 403. Storage backends (S3, B2,
+# WebDAV) mean a bad key or missing permission by it, which must fail fast as an auth error.
+_FORBIDDEN_RE = re.compile(r'\b403\b|Forbidden', re.IGNORECASE)
+DOWNLOAD_TOOLS = ("gallery-dl", "megadl")
+_AUTH_RE = re.compile(r'\b401\b|Unauthorized|AuthenticationError|AuthorizationError|login required|'
+                      r'invalid (?:username|password|credentials|token)', re.IGNORECASE)
+
+# gallery-dl exit codes are bit flags (see gallery_dl/exception.py)
+_GDL_UNSPECIFIED = 1
+_GDL_USAGE = 2
+_GDL_HTTP = 4
+_GDL_NOT_FOUND = 8
+_GDL_AUTH = 16
+_GDL_FORMAT = 32
+_GDL_NO_EXTRACTOR = 64
+_GDL_OS = 128
+
+# rclone exit codes (https://rclone.org/docs/#exit-code)
+_RCLONE_EXIT_CODES = {
+    2: PERMANENT,    # syntax or usage error
+    3: PERMANENT,    # directory not found
+    4: PERMANENT,    # file not found
+    5: TRANSIENT,    # temporary error
+    6: TRANSIENT,    # less serious errors
+    7: PERMANENT,    # fatal error (e.g. account suspended)
+    8: RATE_LIMITED,  # transfer limit exceeded
+}
+
+
+def get_tool(command: str) -> str:
+    """Returns the program a shell command runs, e.g. 'gallery-dl', 'rclone' or 'tar'."""
+    try:
+        first = shlex.split(command)[0]
+    except (ValueError, IndexError):
+        first = command.split(" ", 1)[0] if command else ""
+    return first.rsplit("/", 1)[-1]
+
+
+def _classify_gallery_dl(returncode: int) -> str:
+    if returncode & _GDL_AUTH:
+        return AUTH
+    if returncode & (_GDL_USAGE | _GDL_NO_EXTRACTOR):
+        return PERMANENT
+    if returncode & (_GDL_UNSPECIFIED | _GDL_HTTP | _GDL_OS):
+        return TRANSIENT
+    # Only "not found" / "format" errors: retrying will not change the result
+    return PERMANENT
+
+
+def classify_failure(tool: str, returncode: int, output: str = "", stalled: bool = False, site_limited: bool = False) -> str:
+    """
+    Maps a failed command (tool, exit code, tail of its output) to a failure class.
+    site_limited: the command downloads from a site under a site budget, so a 403 means rate limiting.
+    """
+    if stalled or returncode is None or returncode < 0:
+        # Killed by a signal (stall watchdog, OOM killer, ...)
+        return TRANSIENT
+
+    if tool == "gallery-dl":
+        category = _classify_gallery_dl(returncode)
+    elif tool == "rclone":
+        category = _RCLONE_EXIT_CODES.get(returncode, TRANSIENT)
+    else:
+        category = TRANSIENT
+
+    # The output can refine a generic failure, but never downgrade a permanent one
+    if category == TRANSIENT and output:
+        if _RATE_LIMIT_RE.search(output):
+            return RATE_LIMITED
+        if _FORBIDDEN_RE.search(output):
+            return RATE_LIMITED if tool in DOWNLOAD_TOOLS or site_limited else AUTH
+        if _AUTH_RE.search(output):
+            return AUTH
+    return category
+
+
+def should_retry(category: str, attempt: int) -> bool:
+    """True if another attempt is allowed after `attempt` (1-based) failed with this class."""
+    return attempt < RETRY_POLICIES[category]["max_attempts"]
+
+
+def get_retry_delay(category: str, attempt: int) -> float:
+    """Exponential backoff with jitter: a random delay between half and all of base * 2^(attempt-1), capped."""
+    policy = RETRY_POLICIES[category]
+    delay = min(policy["max_delay"], policy["base_delay"] * (2 ** (attempt - 1)))
+    return random.uniform(delay / 2, delay)
+
+
+def max_attempts() -> int:
+    """Upper bound on attempts for any failure class."""
+    return max(policy["max_attempts"] for policy in RETRY_POLICIES.values())
+
+
+def read_output_tail(path, start: int = 0) -> Optional[str]:
+    """
+    Reads up to OUTPUT_TAIL_BYTES from the end of a log file, not before offset `start`.
+    A capped task log may have been trimmed below `start` meanwhile (offsets reset after a trim);
+    then the tail is read regardless.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, 2)
+            end = f.tell()
+            f.seek(max(start, end - OUTPUT_TAIL_BYTES) if start <= end else max(0, end - OUTPUT_TAIL_BYTES))
+            return f.read().decode("utf-8", errors="ignore")
+    except OSError:
+        return None
@@ -4,7 +4,6 @@ import uuid
 import json
 import signal
 import asyncio
-import subprocess
 import httpx
 from pathlib import Path
 from typing import Optional
@@ -18,7 +17,17 @@ from ..auth import get_current_user
 from ..database import User
 from ..config import BASE_DIR, STATUS_DIR, PROJECT_ROOT
 from ..tasks import process_download_job
-from ..utils import get_task_status_path, update_task_status, get_net_speed
+from ..watchdog import stall_metrics
+from ..proxy_pool import proxy_pool
+from ..site_budget import site_budget
+from ..disk_manager import disk_manager
+from ..bandwidth import bandwidth_controller
+from ..job_dedup import inflight_jobs
+from ..gofile import server_cache as gofile_server_cache
+from ..retention import discard_retained
+from ..log_stream import file_response, logs_response
+from .. import http_download
+from ..utils import get_task_status_path, update_task_status, get_net_speed, run_blocking, single_flight, run_subprocess_output
 
 
 router = APIRouter(
@@ -27,16 +36,34 @@ router = APIRouter(
 )
 
 # --- App Management ---
+# Upper bounds for blocking updater operations (seconds)
+UPDATE_TIMEOUT = 900
+UPDATE_CHECK_TIMEOUT = 30
+DEPENDENCY_UPDATE_TIMEOUT = 900
+PAGE_LIBRARY_UPDATE_TIMEOUT = 300
+
+def _timeout_response(operation: str, timeout: int) -> JSONResponse:
+    return JSONResponse(
+        content={"status": "error", "message": f"{operation} did not finish within {timeout} seconds. It may still be running in the background."},
+        status_code=504
+    )
+
 @router.post("/update")
 async def update_app(background_tasks: BackgroundTasks):
-    result = updater.run_update()
+    try:
+        result = await run_blocking("updater.run_update", updater.run_update, timeout=UPDATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return _timeout_response("Update", UPDATE_TIMEOUT)
     if result.get("status") == "success" and result.get("updated"):
         background_tasks.add_task(updater.restart_application)
     return JSONResponse(content=result)
 
 @router.get("/version")
 async def get_version():
-    sha = updater.get_local_commit_sha()
+    try:
+        sha = await run_blocking("updater.get_local_commit_sha", updater.get_local_commit_sha, timeout=10)
+    except asyncio.TimeoutError:
+        sha = None
     version = sha[:7] if sha else "N/A"
     return {"version": version}
 
@@ -82,22 +109,34 @@ async def get_changelog():
 
 @router.get("/updates/check")
 async def check_updates():
-    result = updater.check_for_updates()
+    try:
+        result = await run_blocking("updater.check_for_updates", updater.check_for_updates, timeout=UPDATE_CHECK_TIMEOUT)
+    except asyncio.TimeoutError:
+        return _timeout_response("Update check", UPDATE_CHECK_TIMEOUT)
     return JSONResponse(content=result)
 
 @router.get("/updates/info")
 async def get_update_info():
-    result = updater.get_update_info()
+    try:
+        result = await run_blocking("updater.get_update_info", updater.get_update_info, timeout=UPDATE_CHECK_TIMEOUT)
+    except asyncio.TimeoutError:
+        return _timeout_response("Update info", UPDATE_CHECK_TIMEOUT)
     return JSONResponse(content=result)
 
 @router.post("/updates/dependencies")
 async def update_dependencies_api():
-    result = updater.update_dependencies()
+    try:
+        result = await run_blocking("updater.update_dependencies", updater.update_dependencies, timeout=DEPENDENCY_UPDATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return _timeout_response("Dependency update", DEPENDENCY_UPDATE_TIMEOUT)
     return JSONResponse(content=result)
 
 @router.post("/updates/pages")
 async def update_page_library_api():
-    result = updater.update_page_library()
+    try:
+        result = await run_blocking("updater.update_page_library", updater.update_page_library, timeout=PAGE_LIBRARY_UPDATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return _timeout_response("Page library update", PAGE_LIBRARY_UPDATE_TIMEOUT)
     return JSONResponse(content=result)
 
 @router.post("/database/cleanup")
@@ -148,8 +187,15 @@ async def create_download_job(
     # Split URLs by newline and filter empty ones
     urls = [u.strip() for u in url.splitlines() if u.strip()]
     
+    attached = 0
     for single_url in urls:
         task_id = str(uuid.uuid4())
+        # An identical URL with the same options already queued or running: receive its download instead
+        primary_id = inflight_jobs.register(task_id, single_url, upload_service, upload_path, dict(params))
+        if primary_id:
+            update_task_status(task_id, {"id": task_id, "status": "queued", "original_params": dict(params), "created_by": current_user.username, "url": single_url, "subscribed_to": primary_id})
+            attached += 1
+            continue
         update_task_status(task_id, {"id": task_id, "status": "queued", "original_params": dict(params), "created_by": current_user.username, "url": single_url})
         
         asyncio.create_task(process_download_job(
@@ -163,7 +209,10 @@ async def create_download_job(
             twitter_retweets=(twitter_retweets == "true"),
             twitter_replies=(twitter_replies == "true")
         ))
-    return JSONResponse(content={"status": "success", "message": f"Started {len(urls)} task(s).", "task_count": len(urls)})
+    message = f"Started {len(urls) - attached} task(s)."
+    if attached:
+        message += f" {attached} identical task(s) attached to jobs already in progress."
+    return JSONResponse(content={"status": "success", "message": message, "task_count": len(urls), "attached_count": attached})
 
 @router.post("/retry/{task_id}", response_class=RedirectResponse)
 async def retry_task(task_id: str, current_user: User = Depends(get_current_user)):
@@ -194,7 +243,12 @@ async def pause_task(task_id: str):
     with open(status_path, "r") as f: task_data = json.load(f)
     
     pgid = task_data.get("pgid")
-    if not pgid: raise HTTPException(status_code=400, detail="Task is not running or cannot be paused.")
+    if not pgid:
+        # In-process downloads (kemono engine, direct HTTP) are paused through their own switch
+        if http_download.pause(task_id):
+            update_task_status(task_id, {"status": "paused", "previous_status": task_data.get("status", "running")})
+            return RedirectResponse("/tasks", status_code=303)
+        raise HTTPException(status_code=400, detail="Task is not running or cannot be paused.")
     
     try:
         os.killpg(pgid, signal.SIGSTOP)
@@ -212,7 +266,11 @@ async def resume_task(task_id: str):
     with open(status_path, "r") as f: task_data = json.load(f)
 
     pgid = task_data.get("pgid")
-    if not pgid: raise HTTPException(status_code=400, detail="Task is not paused or cannot be resumed.")
+    if not pgid:
+        if http_download.resume(task_id):
+            update_task_status(task_id, {"status": task_data.get("previous_status", "running"), "previous_status": None})
+            return RedirectResponse("/tasks", status_code=303)
+        raise HTTPException(status_code=400, detail="Task is not paused or cannot be resumed.")
 
     try:
         os.killpg(pgid, signal.SIGCONT)
@@ -243,6 +301,10 @@ async def delete_task(task_id: str):
     if oauth_log_path.exists(): # Also clean up potential oauth logs
         oauth_log_path.unlink()
         deleted = True
+    split_plan_path = STATUS_DIR / f"{task_id}_split_plan.jsonl"
+    if split_plan_path.exists():
+        split_plan_path.unlink()
+    discard_retained(task_id)
 
     if not deleted:
         raise HTTPException(status_code=404, detail="Task not found.")
@@ -274,7 +336,8 @@ async def get_status_json(task_id: str):
             
     # Parse rclone progress from upload_log if possible
     progress_data = status_data.get("upload_stats", {})
-    if upload_log and "Transferred:" in upload_log:
+    # With several destinations the upload log interleaves them; their stats come from rclone rc instead
+    if upload_log and "Transferred:" in upload_log and not progress_data.get("destinations"):
         import re
         # Look for the last Transferred: ... line
         transferred_matches = re.findall(r"Transferred:\s+([\d.]+)\s*(\w+)\s*/\s*([\d.]+)\s*(\w+),\s*(\d+)%", upload_log)
@@ -307,13 +370,13 @@ async def get_status_json(task_id: str):
     })
 
 @router.get("/status/{task_id}/raw")
-async def get_status_raw(task_id: str):
+async def get_status_raw(task_id: str, request: Request, tail: Optional[int] = None):
     status_file = STATUS_DIR / f"{task_id}.log"
     if not status_file.exists():
         raise HTTPException(status_code=404, detail="Job log not found.")
-    with open(status_file, "r") as f:
-        content = f.read()
-    return Response(content=content, media_type="text/plain")
+    # Streamed in chunks; a Range header fetches just the new part of a growing log. A capped log
+    # is trimmed in place, which resets offsets: a 416 (Content-Range: bytes */size) means start over
+    return await asyncio.to_thread(file_response, status_file, request, tail=tail)
 
 @router.post("/cleanup-logs")
 async def cleanup_logs_api():
@@ -334,18 +397,27 @@ async def clear_cache_api():
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
 
 # --- Server Info ---
-def get_dependency_versions():
+# Tool versions rarely change, so they are cached instead of forking two processes per status poll
+_versions_cache = {"versions": None, "last_fetch": 0}
+VERSIONS_CACHE_TTL = 3600
+
+async def _fetch_dependency_versions():
     versions = {"python": __import__("sys").version.split(" ")[0], "gallery-dl": "N/A", "rclone": "N/A"}
-    try:
-        result = subprocess.run(['gallery-dl', '--version'], capture_output=True, text=True)
-        if result.returncode == 0: versions['gallery-dl'] = result.stdout.strip().split(" ")[-1]
-    except Exception: pass
-    try:
-        result = subprocess.run(['rclone', 'version'], capture_output=True, text=True)
-        if result.returncode == 0: versions['rclone'] = result.stdout.strip().split("\n")[0].split(" ")[-1]
-    except Exception: pass
+    gallery_dl_out, rclone_out = await asyncio.gather(
+        run_subprocess_output('gallery-dl', '--version', timeout=10),
+        run_subprocess_output('rclone', 'version', timeout=10)
+    )
+    if gallery_dl_out and gallery_dl_out.strip(): versions['gallery-dl'] = gallery_dl_out.strip().split(" ")[-1]
+    if rclone_out and rclone_out.strip(): versions['rclone'] = rclone_out.strip().split("\n")[0].split(" ")[-1]
+    _versions_cache["versions"] = versions
+    _versions_cache["last_fetch"] = asyncio.get_event_loop().time()
     return versions
 
+async def get_dependency_versions():
+    if _versions_cache["versions"] and asyncio.get_event_loop().time() - _versions_cache["last_fetch"] < VERSIONS_CACHE_TTL:
+        return _versions_cache["versions"]
+    return await single_flight("dependency_versions", _fetch_dependency_versions, timeout=30)
+
 def get_system_uptime():
     import psutil
     delta = __import__("datetime").datetime.now() - __import__("datetime").datetime.fromtimestamp(psutil.boot_time())
@@ -371,11 +443,17 @@ async def get_server_status():
     except FileNotFoundError:
         disk_info = {"total": 0, "used": 0, "free": 0, "percent": 0}
 
+    # cpu_percent(interval=1) sleeps for a second, so it must not run on the event loop
+    cpu_usage, versions = await asyncio.gather(
+        run_blocking("cpu_percent", psutil.cpu_percent, interval=1, timeout=5),
+        get_dependency_versions()
+    )
+
     return JSONResponse(content={
-        "system": {"uptime": get_system_uptime(), "platform": f"{platform.system()} {platform.release()}", "cpu_usage": psutil.cpu_percent(interval=1)},
+        "system": {"uptime": get_system_uptime(), "platform": f"{platform.system()} {platform.release()}", "cpu_usage": cpu_usage},
         "memory": {"total": (mem := psutil.virtual_memory()).total, "used": mem.used, "percent": mem.percent},
         "disk": disk_info,
-        "application": {"active_tasks": status.get_active_tasks_count(), "versions": get_dependency_versions()}
+        "application": {"active_tasks": status.get_active_tasks(), "versions": versions, "stall_metrics": stall_metrics, "proxy_pool": proxy_pool.stats(), "site_budgets": site_budget.stats(), "bandwidth": bandwidth_controller.stats(), "dedup": inflight_jobs.stats(), "gofile_servers": gofile_server_cache.stats(), "disk": disk_manager.stats()}
     })
 
 # --- Session Management ---
@@ -401,28 +479,9 @@ LOG_FILES = [
     "logs/startup2.log",
 ]
 
-def get_log_content(log_file: str) -> str:
-    """读取日志文件内容"""
-    try:
-        # 使用项目根目录路径
-        project_root = Path(__file__).resolve().parent.parent.parent
-        log_path = project_root / log_file
-        if log_path.exists():
-            return log_path.read_text(encoding='utf-8', errors='ignore')
-        else:
-            return f"Log file not found: {log_file}"
-    except Exception as e:
-        return f"Error reading log file {log_file}: {str(e)}"
-
-def get_all_logs() -> str:
-    """获取所有日志文件的内容"""
-    result = []
-    for log_file in LOG_FILES:
-        content = get_log_content(log_file)
-        result.append(f"=== {log_file} ===")
-        result.append(content)
-        result.append("\n")
-    return "\n".join(result)
+def get_log_path(log_file: str) -> Path:
+    """日志文件的绝对路径（相对于项目根目录）"""
+    return PROJECT_ROOT / log_file
 
 @router.get("/logs/health")
 async def log_health_check():
@@ -440,12 +499,18 @@ async def log_info():
             "/api/logs/info": "This info",
             "/api/logs/all": "Get all logs (requires X-Log-Access-Key header)",
             "/api/logs/{filename}": "Get specific log file (requires X-Log-Access-Key header)"
+        },
+        "parameters": {
+            "tail": "Only the last N lines",
+            "since": "Only entries logged since a Unix timestamp or ISO date/time",
+            "Range": "Byte range of a single log (header)",
+            "Accept-Encoding": "zstd or gzip compresses the response (header)"
         }
     }
 
 @router.get("/logs/all")
-async def get_all_logs_api(request: Request, access_key: str = None):
-    """获取所有日志内容，需要认证"""
+async def get_all_logs_api(request: Request, access_key: str = None, tail: Optional[int] = None, since: Optional[str] = None):
+    """获取所有日志内容（流式输出），需要认证"""
     # 优先从URL参数获取密钥，如果没有则从请求头获取
     if access_key is None:
         access_key = request.headers.get("X-Log-Access-Key")
@@ -453,12 +518,11 @@ async def get_all_logs_api(request: Request, access_key: str = None):
     if access_key != LOG_ACCESS_KEY:
         raise HTTPException(status_code=403, detail="Invalid access key")
     
-    from fastapi.responses import PlainTextResponse
-    return PlainTextResponse(content=get_all_logs())
+    return logs_response([(log_file, get_log_path(log_file)) for log_file in LOG_FILES], request, tail=tail, since=since)
 
-@router.get("/logs/{filename}")
-async def get_log_file_api(filename: str, request: Request, access_key: str = None):
-    """获取特定日志文件内容，需要认证"""
+@router.get("/logs/{filename:path}")
+async def get_log_file_api(filename: str, request: Request, access_key: str = None, tail: Optional[int] = None, since: Optional[str] = None):
+    """获取特定日志文件内容（流式输出，支持 Range / tail / since），需要认证"""
     # 优先从URL参数获取密钥，如果没有则从请求头获取
     if access_key is None:
         access_key = request.headers.get("X-Log-Access-Key")
@@ -470,5 +534,9 @@ async def get_log_file_api(filename: str, request: Request, access_key: str = No
     if filename not in LOG_FILES:
         raise HTTPException(status_code=404, detail="Log file not found")
     
-    from fastapi.responses import PlainTextResponse
-    return PlainTextResponse(content=get_log_content(filename))
+    log_path = get_log_path(filename)
+    if not log_path.exists():
+        from fastapi.responses import PlainTextResponse
+        return PlainTextResponse(content=f"Log file not found: {filename}")
+    # tail/since seek in the file, which is blocking I/O
+    return await asyncio.to_thread(file_response, log_path, request, tail=tail, since=since)
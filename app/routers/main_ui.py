@@ -101,7 +101,7 @@ async def settings_page(request: Request, current_user: User = Depends(get_curre
     # Fetch current configuration from database
     config_keys = [
         "TUNNEL_TOKEN", 
-        "WDM_GOFILE_TOKEN", "WDM_GOFILE_FOLDER_ID",
+        "WDM_GOFILE_TOKEN", "WDM_GOFILE_FOLDER_ID", "WDM_GOFILE_CONCURRENCY",
         "WDM_OPENLIST_URL", "WDM_OPENLIST_USER", "WDM_OPENLIST_PASS",
         "WDM_WEBDAV_URL", "WDM_WEBDAV_USER", "WDM_WEBDAV_PASS",
         "WDM_S3_PROVIDER", "WDM_S3_ACCESS_KEY_ID", "WDM_S3_SECRET_ACCESS_KEY", "WDM_S3_REGION", "WDM_S3_ENDPOINT",
@@ -110,8 +110,13 @@ async def settings_page(request: Request, current_user: User = Depends(get_curre
         "WDM_SYNC_TASKS_JSON",
         "WDM_VERIFICATION_TYPE", "WDM_VERIFICATION_SITE_KEY", "WDM_VERIFICATION_SECRET_KEY", "WDM_VERIFICATION_ID",
         "WDM_VERIFICATION_GEETEST_DEMO_TYPE",
-        "WDM_GALLERY_DL_ARGS",
+        "WDM_GALLERY_DL_ARGS", "WDM_GALLERY_DL_ENGINE", "WDM_DOWNLOAD_SEGMENTS", "WDM_STREAM_UPLOAD", "WDM_ARCHIVE_ENGINE",
         "WDM_KEMONO_USERNAME", "WDM_KEMONO_PASSWORD",
+        "WDM_STALL_TIMEOUT", "WDM_STALL_ACTION",
+        "WDM_SITE_MAX_JOBS", "WDM_SITE_BANDWIDTH", "WDM_SITE_BUDGETS_JSON",
+        "WDM_GLOBAL_DOWNLOAD_LIMIT", "WDM_GLOBAL_UPLOAD_LIMIT", "WDM_BANDWIDTH_SCHEDULE",
+        "WDM_RETENTION_POLICY", "WDM_RETENTION_HOURS", "WDM_RETENTION_MAX_GB",
+        "WDM_DISK_MIN_FREE_GB", "WDM_DISK_JOB_RESERVE_GB", "WDM_TASK_LOG_MAX_MB",
         "AVATAR_URL", "login_domain", "PRIVATE_MODE", "DEBUG_MODE", "GITHUB_TOKEN",
         "REDIS_URL", "TERMINAL_ENABLED"
     ]
@@ -141,7 +146,7 @@ async def save_settings(
     
     config_keys = [
         "TUNNEL_TOKEN", 
-        "WDM_GOFILE_TOKEN", "WDM_GOFILE_FOLDER_ID",
+        "WDM_GOFILE_TOKEN", "WDM_GOFILE_FOLDER_ID", "WDM_GOFILE_CONCURRENCY",
         "WDM_OPENLIST_URL", "WDM_OPENLIST_USER", "WDM_OPENLIST_PASS",
         "WDM_WEBDAV_URL", "WDM_WEBDAV_USER", "WDM_WEBDAV_PASS",
         "WDM_S3_PROVIDER", "WDM_S3_ACCESS_KEY_ID", "WDM_S3_SECRET_ACCESS_KEY", "WDM_S3_REGION", "WDM_S3_ENDPOINT",
@@ -150,8 +155,13 @@ async def save_settings(
         "WDM_SYNC_TASKS_JSON",
         "WDM_VERIFICATION_TYPE", "WDM_VERIFICATION_SITE_KEY", "WDM_VERIFICATION_SECRET_KEY", "WDM_VERIFICATION_ID",
         "WDM_VERIFICATION_GEETEST_DEMO_TYPE",
-        "WDM_GALLERY_DL_ARGS",
+        "WDM_GALLERY_DL_ARGS", "WDM_GALLERY_DL_ENGINE", "WDM_DOWNLOAD_SEGMENTS", "WDM_STREAM_UPLOAD", "WDM_ARCHIVE_ENGINE",
         "WDM_KEMONO_USERNAME", "WDM_KEMONO_PASSWORD",
+        "WDM_STALL_TIMEOUT", "WDM_STALL_ACTION",
+        "WDM_SITE_MAX_JOBS", "WDM_SITE_BANDWIDTH", "WDM_SITE_BUDGETS_JSON",
+        "WDM_GLOBAL_DOWNLOAD_LIMIT", "WDM_GLOBAL_UPLOAD_LIMIT", "WDM_BANDWIDTH_SCHEDULE",
+        "WDM_RETENTION_POLICY", "WDM_RETENTION_HOURS", "WDM_RETENTION_MAX_GB",
+        "WDM_DISK_MIN_FREE_GB", "WDM_DISK_JOB_RESERVE_GB", "WDM_TASK_LOG_MAX_MB",
         "AVATAR_URL", "login_domain", "PRIVATE_MODE", "DEBUG_MODE", "GITHUB_TOKEN",
         "REDIS_URL", "TERMINAL_ENABLED"
     ]
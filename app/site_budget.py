@@ -0,0 +1,186 @@
+import json
+import time
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from .database import db_config
+from .progress import parse_size
+from .retry_policy import RATE_LIMITED
+from .task_log import append_log
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SITE_MAX_JOBS = 0  # 0 = no per-site cap; jobs are only bounded by the global task limit
+# Site-wide backoff after a 429/403: doubles per consecutive signal, capped
+BACKOFF_BASE = 30  # seconds
+BACKOFF_MAX = 900  # seconds
+
+# Hosts that belong to the same site (and share its rate limits)
+SITE_ALIASES = {
+    "kemono.cr": "kemono", "kemono.su": "kemono", "kemono.party": "kemono",
+    "coomer.st": "coomer", "coomer.su": "coomer", "coomer.party": "coomer",
+    "pixiv.net": "pixiv", "pximg.net": "pixiv",
+    "twitter.com": "twitter", "x.com": "twitter", "twimg.com": "twitter",
+    "mega.nz": "mega", "mega.io": "mega",
+}
+
+
+def get_site(url: str) -> str:
+    """Maps a URL to the site whose budget it draws from, e.g. 'https://kemono.su/...' -> 'kemono'."""
+    host = (urlparse(url).hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    parts = host.split(".")
+    for i in range(len(parts) - 1):
+        alias = SITE_ALIASES.get(".".join(parts[i:]))
+        if alias:
+            return alias
+    # Fall back to the last two labels (registrable domain for most sites)
+    return ".".join(parts[-2:]) if host else "unknown"
+
+
+def _get_site_settings(site: str) -> dict:
+    """Returns {"max_jobs": int or 0, "bandwidth": bytes/s or 0} (0 = unlimited) from the defaults and per-site overrides."""
+    try:
+        max_jobs = int(db_config.get_config("WDM_SITE_MAX_JOBS", DEFAULT_SITE_MAX_JOBS) or DEFAULT_SITE_MAX_JOBS)
+    except (TypeError, ValueError):
+        max_jobs = DEFAULT_SITE_MAX_JOBS
+    bandwidth = db_config.get_config("WDM_SITE_BANDWIDTH", "") or ""
+
+    try:
+        overrides = json.loads(db_config.get_config("WDM_SITE_BUDGETS_JSON", "{}") or "{}")
+    except ValueError as e:
+        logger.error(f"[SiteBudget] Failed to parse site budgets JSON: {e}")
+        overrides = {}
+    override = overrides.get(site) or {}
+    if override.get("max_jobs") is not None:
+        try:
+            max_jobs = int(override["max_jobs"])
+        except (TypeError, ValueError):
+            pass
+    if override.get("bandwidth") is not None:
+        bandwidth = str(override["bandwidth"])
+
+    return {"max_jobs": max(0, max_jobs), "bandwidth": parse_size(bandwidth)}
+
+
+class SiteLease:
+    """A job's claim on one of its site's download slots."""
+
+    def __init__(self, site: str, task_id: str, budget: "SiteBudgetManager"):
+        self.site = site
+        self.task_id = task_id
+        self._budget = budget
+        self.downloading = False
+
+    def rate_limit(self, requested: Optional[str] = None) -> Optional[str]:
+        """
+        Marks the job as downloading and returns the rate limit to pass to the downloader:
+        the site bandwidth split evenly across its downloading jobs, or the job's own limit
+        if that is lower. The share is fixed when the command starts.
+        """
+        self.downloading = True
+        site_bandwidth = _get_site_settings(self.site)["bandwidth"]
+        if not site_bandwidth:
+            return requested
+        active = sum(1 for lease in self._budget.leases(self.site) if lease.downloading)
+        share = site_bandwidth // max(1, active)
+        if requested and 0 < parse_size(requested) <= share:
+            return requested
+        return str(share)
+
+
+class SiteBudgetManager:
+    """
+    Caps concurrent downloads per site and applies a shared backoff when a site starts
+    answering 429/403, so parallel jobs stop burning retries against the same host.
+    """
+
+    def __init__(self):
+        self._leases: Dict[str, SiteLease] = {}
+        self._backoff_until: Dict[str, float] = {}
+        self._backoff_level: Dict[str, int] = {}
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def get_lease(self, task_id: str) -> Optional[SiteLease]:
+        return self._leases.get(task_id)
+
+    def leases(self, site: str):
+        return [lease for lease in self._leases.values() if lease.site == site]
+
+    async def acquire(self, task_id: str, url: str, status_file: Optional[Path] = None) -> SiteLease:
+        """Waits for a free slot on the URL's site and returns the lease."""
+        site = get_site(url)
+        condition = self._get_condition()
+        announced = False
+        async with condition:
+            while 0 < _get_site_settings(site)["max_jobs"] <= len(self.leases(site)):
+                if not announced:
+                    logger.info(f"[SiteBudget] Task {task_id} waiting for a free download slot on {site}")
+                    append_log(status_file, f"Waiting for a free download slot on {site}...\n")
+                    announced = True
+                # Settings may change while waiting, so re-check periodically as well
+                try:
+                    await asyncio.wait_for(condition.wait(), timeout=30)
+                except asyncio.TimeoutError:
+                    pass
+            lease = SiteLease(site, task_id, self)
+            self._leases[task_id] = lease
+        await self.wait_for_backoff(task_id, status_file)
+        return lease
+
+    async def release(self, task_id: str):
+        """Frees the task's slot (no-op if it holds none)."""
+        if self._leases.pop(task_id, None) is None:
+            return
+        condition = self._get_condition()
+        async with condition:
+            condition.notify_all()
+
+    async def wait_for_backoff(self, task_id: str, status_file: Optional[Path] = None):
+        """Sleeps until the site-wide backoff for the task's site (if any) has passed."""
+        lease = self._leases.get(task_id)
+        if lease is None:
+            return
+        remaining = self._backoff_until.get(lease.site, 0) - time.time()
+        if remaining > 0:
+            append_log(status_file, f"{lease.site} is rate limiting; backing off for {int(remaining)}s...\n")
+            await asyncio.sleep(remaining)
+
+    def report(self, task_id: str, category: Optional[str]):
+        """Feeds a command outcome for the task's site: a rate-limit failure extends the shared backoff."""
+        lease = self._leases.get(task_id)
+        if lease is None:
+            return
+        site = lease.site
+        if category == RATE_LIMITED:
+            level = self._backoff_level.get(site, 0)
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** level))
+            self._backoff_level[site] = level + 1
+            self._backoff_until[site] = max(self._backoff_until.get(site, 0), time.time() + delay)
+            logger.warning(f"[SiteBudget] {site} is rate limiting; pausing its jobs for {delay}s")
+        elif category is None and self._backoff_level.get(site):
+            self._backoff_level[site] -= 1
+
+    def stats(self) -> dict:
+        now = time.time()
+        sites = {}
+        for lease in self._leases.values():
+            info = sites.setdefault(lease.site, {"jobs": 0, "downloading": 0, "backoff_seconds": 0})
+            info["jobs"] += 1
+            info["downloading"] += int(lease.downloading)
+        for site, until in self._backoff_until.items():
+            if until > now:
+                sites.setdefault(site, {"jobs": 0, "downloading": 0, "backoff_seconds": 0})["backoff_seconds"] = int(until - now)
+        return sites
+
+
+site_budget = SiteBudgetManager()
@@ -0,0 +1,73 @@
+import os
+import math
+from typing import Dict, List, Tuple
+
+# (path relative to the download directory, size in bytes)
+FileEntry = Tuple[str, int]
+
+
+def _group_by_directory(files: List[FileEntry]) -> Dict[str, List[FileEntry]]:
+    groups: Dict[str, List[FileEntry]] = {}
+    for entry in files:
+        groups.setdefault(os.path.dirname(entry[0]), []).append(entry)
+    return groups
+
+
+def _items(files: List[FileEntry], max_size: int) -> List[List[FileEntry]]:
+    """Packing units: whole directories where they fit in one volume, single files otherwise."""
+    items = []
+    for directory_files in _group_by_directory(files).values():
+        if sum(size for _, size in directory_files) <= max_size:
+            items.append(directory_files)
+        else:
+            items.extend([entry] for entry in directory_files)
+    return items
+
+
+def _first_fit_decreasing(sizes: List[int], max_size: int) -> int:
+    """Number of volumes first-fit-decreasing needs for these item sizes."""
+    volumes: List[int] = []
+    for size in sorted(sizes, reverse=True):
+        for i, used in enumerate(volumes):
+            if used + size <= max_size:
+                volumes[i] += size
+                break
+        else:
+            volumes.append(size)
+    return len(volumes)
+
+
+def plan_volumes(files: List[FileEntry], max_size: int) -> List[List[FileEntry]]:
+    """
+    Splits files into volumes of at most max_size bytes (a single larger file gets a volume of
+    its own). Files of one directory (usually one post) stay in one volume when the directory
+    fits. The volume count comes from first-fit-decreasing; items are then placed largest first
+    into the least-filled volume they fit in, so volumes come out about the same size instead of
+    full ones followed by a small remainder. Volumes are ordered by their first path.
+    """
+    if not files:
+        return []
+    items = _items(files, max_size)
+    sized = [(sum(size for _, size in item), item) for item in items]
+    # A file larger than a volume always gets a volume of its own
+    volumes: List[List[FileEntry]] = [item for size, item in sized if size > max_size]
+    sized = [(size, item) for size, item in sized if size <= max_size]
+    sizes = [size for size, _ in sized]
+    count = max(_first_fit_decreasing(sizes, max_size), math.ceil(sum(sizes) / max_size)) if sizes else 0
+
+    bins: List[List[FileEntry]] = [[] for _ in range(count)]
+    used = [0] * count
+    for size, item in sorted(sized, key=lambda pair: -pair[0]):
+        candidates = [i for i in range(len(bins)) if used[i] + size <= max_size]
+        if not candidates:
+            bins.append([])
+            used.append(0)
+            candidates = [len(bins) - 1]
+        target = min(candidates, key=lambda i: used[i])
+        bins[target].extend(item)
+        used[target] += size
+
+    volumes += bins
+    volumes = [sorted(volume) for volume in volumes if volume]
+    volumes.sort(key=lambda volume: volume[0][0])
+    return volumes
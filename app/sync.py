@@ -0,0 +1,226 @@
+import os
+import asyncio
+import base64
+import json
+import tempfile
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from .database import db_config
+from .config import GALLERY_DL_CONFIG_DIR, CONFIG_BACKUP_REMOTE_PATH
+from .utils import _run_rclone_command
+
+try:
+    from watchfiles import awatch
+except ImportError:
+    awatch = None
+
+logger = logging.getLogger(__name__)
+
+SYNC_TICK_SECONDS = 30
+# Bursts of file events (e.g. gallery-dl writing a whole post) are grouped into one rclone run
+REALTIME_DEBOUNCE_MS = 3000
+
+# Per-task locks so a scheduled run and a real-time push never overlap for the same task
+_task_locks: Dict[str, asyncio.Lock] = {}
+# Running file watchers, keyed by task name
+_watchers: Dict[str, asyncio.Task] = {}
+_watcher_targets: Dict[str, tuple] = {}
+
+
+def _is_enabled(task: dict) -> bool:
+    return str(task.get("enabled", "false")).lower() == "true"
+
+
+def _is_realtime(task: dict) -> bool:
+    return str(task.get("mode", "interval")).lower() == "realtime"
+
+
+def load_sync_tasks() -> List[dict]:
+    """Returns the system sync task plus all custom tasks from WDM_SYNC_TASKS_JSON."""
+    tasks_json = db_config.get_config("WDM_SYNC_TASKS_JSON", "[]")
+    try:
+        custom_tasks = json.loads(tasks_json or "[]")
+    except Exception as e:
+        logger.error(f"[Sync] Failed to parse sync tasks JSON: {e}")
+        custom_tasks = []
+
+    system_task = {
+        "name": "System: Gallery-dl Config",
+        "local_path": str(GALLERY_DL_CONFIG_DIR),
+        "remote_path": CONFIG_BACKUP_REMOTE_PATH,
+        "interval": 10,  # Minutes
+        "enabled": True,
+        "is_system": True
+    }
+    return [system_task] + custom_tasks
+
+
+def _get_task_lock(task_name: str) -> asyncio.Lock:
+    lock = _task_locks.get(task_name)
+    if lock is None:
+        lock = asyncio.Lock()
+        _task_locks[task_name] = lock
+    return lock
+
+
+async def run_sync_task(task: dict, rclone_base64: str, changed_paths: Optional[Set[str]] = None) -> bool:
+    """
+    Runs one rclone copy for a sync task under its lock.
+    If changed_paths is given, only those files (relative to local_path) are pushed.
+    """
+    task_name = task.get("name", "Unnamed Task")
+    local_path = task.get("local_path")
+    remote_path = task.get("remote_path")
+
+    async with _get_task_lock(task_name):
+        if not os.path.exists(local_path):
+            logger.warning(f"[Sync] Local path not found for {task_name}: {local_path}")
+            return False
+
+        tmp_config_path = None
+        files_from_path = None
+        try:
+            rclone_config_content = base64.b64decode(rclone_base64).decode('utf-8')
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.conf', delete=False) as tmp_file:
+                tmp_config_path = tmp_file.name
+                tmp_file.write(rclone_config_content)
+
+            rclone_cmd = (f"rclone copy \"{local_path}\" \"{remote_path}\" "
+                          f"--config \"{tmp_config_path}\" "
+                          f"--log-level=INFO")
+
+            if changed_paths is not None:
+                with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as list_file:
+                    files_from_path = list_file.name
+                    for rel_path in sorted(changed_paths):
+                        list_file.write(f"{rel_path}\n")
+                rclone_cmd += f" --files-from \"{files_from_path}\" --no-traverse"
+                logger.info(f"[Sync] Pushing {len(changed_paths)} changed file(s) for {task_name} -> {remote_path}")
+            else:
+                logger.info(f"[Sync] Running task: {task_name} ({local_path} -> {remote_path})")
+
+            success = await _run_rclone_command(rclone_cmd)
+            if success:
+                logger.info(f"[Sync] Success: {task_name}")
+            else:
+                logger.error(f"[Sync] Failed: {task_name} (Rclone error)")
+            return success
+        except Exception as e:
+            logger.error(f"[Sync] Error in {task_name}: {e}")
+            return False
+        finally:
+            for path in (tmp_config_path, files_from_path):
+                if path and os.path.exists(path):
+                    os.unlink(path)
+
+
+async def _watch_sync_task(task: dict):
+    """Watches a task's local_path and pushes changed files after each debounced burst."""
+    task_name = task.get("name", "Unnamed Task")
+    local_root = Path(task["local_path"]).resolve()
+    logger.info(f"[Sync] Real-time watcher started for {task_name}: {local_root}")
+
+    try:
+        async for changes in awatch(local_root, debounce=REALTIME_DEBOUNCE_MS, recursive=True):
+            changed_paths = set()
+            for _, changed in changes:
+                changed_path = Path(changed)
+                # Deletions are not propagated (rclone copy semantics); directories are covered by their files
+                if not changed_path.is_file():
+                    continue
+                try:
+                    changed_paths.add(changed_path.relative_to(local_root).as_posix())
+                except ValueError:
+                    continue
+
+            if not changed_paths:
+                continue
+
+            rclone_base64 = db_config.get_config("WDM_CONFIG_BACKUP_RCLONE_BASE64")
+            if not rclone_base64:
+                continue
+            await run_sync_task(task, rclone_base64, changed_paths)
+    except asyncio.CancelledError:
+        logger.info(f"[Sync] Real-time watcher stopped for {task_name}")
+        raise
+    except Exception as e:
+        logger.error(f"[Sync] Real-time watcher for {task_name} crashed: {e}")
+    finally:
+        if _watchers.get(task_name) is asyncio.current_task():
+            _watchers.pop(task_name, None)
+            _watcher_targets.pop(task_name, None)
+
+
+def _reconcile_watchers(tasks: List[dict], rclone_configured: bool):
+    """Starts watchers for new real-time tasks and stops those that were removed or changed."""
+    wanted = {}
+    if rclone_configured and awatch is not None:
+        for task in tasks:
+            if not (_is_enabled(task) and _is_realtime(task)):
+                continue
+            local_path = task.get("local_path")
+            if not local_path or not task.get("remote_path") or not os.path.isdir(local_path):
+                continue
+            wanted[task.get("name", "Unnamed Task")] = task
+    elif awatch is None and any(_is_realtime(t) and _is_enabled(t) for t in tasks):
+        logger.warning("[Sync] watchfiles is not installed; real-time tasks fall back to interval mode.")
+
+    for task_name in list(_watchers):
+        task = wanted.get(task_name)
+        if task is None or _watcher_targets.get(task_name) != (task["local_path"], task["remote_path"]):
+            _watchers.pop(task_name).cancel()
+            _watcher_targets.pop(task_name, None)
+
+    for task_name, task in wanted.items():
+        if task_name not in _watchers:
+            _watcher_targets[task_name] = (task["local_path"], task["remote_path"])
+            _watchers[task_name] = asyncio.create_task(_watch_sync_task(task))
+
+
+async def unified_periodic_sync():
+    """Periodically syncs multiple tasks (including gallery-dl) to remote storage via rclone."""
+    # Store last run times for each task to manage intervals
+    # Key: task identifier, Value: timestamp
+    last_run_times = {}
+    running: Dict[str, asyncio.Task] = {}
+
+    async def _run_scheduled(task: dict, rclone_base64: str, started_at: float):
+        task_name = task.get("name", "Unnamed Task")
+        try:
+            if await run_sync_task(task, rclone_base64):
+                last_run_times[task_name] = started_at
+        finally:
+            running.pop(task_name, None)
+
+    try:
+        while True:
+            all_tasks = load_sync_tasks()
+            rclone_base64 = db_config.get_config("WDM_CONFIG_BACKUP_RCLONE_BASE64")
+
+            _reconcile_watchers(all_tasks, bool(rclone_base64))
+
+            if rclone_base64:
+                current_time = time.time()
+
+                for task in all_tasks:
+                    task_name = task.get("name", "Unnamed Task")
+                    if not _is_enabled(task) or not task.get("local_path") or not task.get("remote_path"):
+                        continue
+
+                    # Real-time tasks still get a periodic full pass to catch anything the watcher missed
+                    interval_sec = int(task.get("interval", 60)) * 60
+                    last_run = last_run_times.get(task_name, 0)
+
+                    if current_time - last_run >= interval_sec and task_name not in running:
+                        running[task_name] = asyncio.create_task(_run_scheduled(task, rclone_base64, current_time))
+
+            # Sleep for a short while before checking again
+            await asyncio.sleep(SYNC_TICK_SECONDS)
+    finally:
+        for watcher in list(_watchers.values()):
+            watcher.cancel()
+        for sync in list(running.values()):
+            sync.cancel()
@@ -0,0 +1,177 @@
+import os
+import asyncio
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+from .config import STATUS_DIR
+from .log_rotation import get_task_log_cap, trim_log
+
+logger = logging.getLogger(__name__)
+
+# Buffered writes are flushed at most this often, or immediately once the buffer grows past the limit
+FLUSH_INTERVAL = 1.0  # seconds
+MAX_BUFFER_BYTES = 64 * 1024
+
+_task_logs: Dict[Path, "TaskLog"] = {}
+
+
+class TaskLog:
+    """
+    Buffered append-only writer for a task's status/upload log.
+    Keeps one file handle open for the life of the task and writes from a worker thread,
+    so the event loop never blocks on open/write/close. write() is safe to call from threads.
+    """
+
+    def __init__(self, path: Path, loop: asyncio.AbstractEventLoop, truncate: bool = False):
+        self.path = Path(path)
+        self._loop = loop
+        self._handle = None
+        self._truncate_pending = truncate
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._flush_scheduled = False
+        self._max_bytes = None  # WDM_TASK_LOG_MAX_MB, read on the first write
+
+    def write(self, text: str):
+        """Queues text for the log file. Returns immediately."""
+        with self._buffer_lock:
+            self._buffer.append(text)
+            self._buffered_bytes += len(text)
+            flush_now = self._buffered_bytes >= MAX_BUFFER_BYTES
+            if self._flush_scheduled and not flush_now:
+                return
+            self._flush_scheduled = True
+        delay = 0 if flush_now else FLUSH_INTERVAL
+        try:
+            self._loop.call_soon_threadsafe(self._schedule_flush, delay)
+        except RuntimeError:
+            # Event loop already closed (shutdown); write synchronously so nothing is lost
+            self._write_out(self._drain())
+
+    def flush_soon(self):
+        """Requests an immediate flush, e.g. on a task state transition."""
+        with self._buffer_lock:
+            if not self._buffer and not self._truncate_pending:
+                return
+            self._flush_scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._schedule_flush, 0)
+        except RuntimeError:
+            pass
+
+    def _schedule_flush(self, delay: float):
+        async def _delayed_flush():
+            if delay:
+                await asyncio.sleep(delay)
+            await self.flush()
+        self._loop.create_task(_delayed_flush())
+
+    def _drain(self) -> str:
+        with self._buffer_lock:
+            data = "".join(self._buffer)
+            self._buffer.clear()
+            self._buffered_bytes = 0
+            self._flush_scheduled = False
+        return data
+
+    def _write_out(self, data: str):
+        if self._truncate_pending:
+            if self._handle:
+                self._handle.close()
+                self._handle = None
+            open(self.path, "w", encoding="utf-8").close()
+            self._truncate_pending = False
+        if not data:
+            return
+        if self._handle is None:
+            # Append mode, so output written by subprocesses into the same file is never overwritten
+            self._handle = open(self.path, "a", encoding="utf-8")
+        self._handle.write(data)
+        self._handle.flush()
+        if self._max_bytes is None:
+            self._max_bytes = get_task_log_cap()
+        # fstat, not tell(): subprocesses append to the same file
+        if self._max_bytes and os.fstat(self._handle.fileno()).st_size > self._max_bytes:
+            trim_log(self.path, self._max_bytes)
+
+    async def flush(self):
+        """Writes all buffered text to disk."""
+        async with self._flush_lock:
+            data = self._drain()
+            if data or self._truncate_pending:
+                try:
+                    await asyncio.to_thread(self._write_out, data)
+                except OSError as e:
+                    logger.error(f"Failed to write task log {self.path}: {e}")
+
+    async def close(self):
+        """Flushes remaining text and releases the file handle."""
+        await self.flush()
+        if _task_logs.get(self.path) is self:
+            _task_logs.pop(self.path, None)
+        if self._handle:
+            handle, self._handle = self._handle, None
+            await asyncio.to_thread(handle.close)
+
+
+def open_task_log(path: Path, truncate: bool = False) -> TaskLog:
+    """
+    Returns the shared writer for a log file, creating it if needed.
+    With truncate=True the file is emptied before the next write (replaces open(path, "w")).
+    Must be called from the event loop thread.
+    """
+    path = Path(path)
+    task_log = _task_logs.get(path)
+    if task_log is None:
+        task_log = TaskLog(path, asyncio.get_running_loop(), truncate=truncate)
+        _task_logs[path] = task_log
+    elif truncate:
+        task_log._drain()
+        task_log._truncate_pending = True
+    return task_log
+
+
+def append_log(path: Optional[Path], text: str):
+    """
+    Appends text to a log file through its buffered writer.
+    Falls back to a direct append when called from a thread with no writer registered.
+    """
+    if not path:
+        return
+    path = Path(path)
+    task_log = _task_logs.get(path)
+    if task_log is None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(text)
+            return
+        task_log = open_task_log(path)
+    task_log.write(text)
+
+
+async def flush_log(path: Optional[Path]):
+    """Flushes pending text for a log file, e.g. before a subprocess writes into it directly."""
+    task_log = _task_logs.get(Path(path)) if path else None
+    if task_log:
+        await task_log.flush()
+
+
+async def close_log(path: Optional[Path]):
+    """Flushes and closes the writer for a log file, if one is open."""
+    task_log = _task_logs.get(Path(path)) if path else None
+    if task_log:
+        await task_log.close()
+
+
+def flush_task_logs_soon(task_id: str):
+    """Schedules an immediate flush of a task's status and upload logs (used on status changes)."""
+    for path in (STATUS_DIR / f"{task_id}.log", STATUS_DIR / f"{task_id}_upload.log"):
+        task_log = _task_logs.get(path)
+        if task_log:
+            task_log.flush_soon()
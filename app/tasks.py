@@ -5,22 +5,42 @@ import shutil
 import random
 import time
 import logging
+import hashlib
+import shlex
 from pathlib import Path
 import json
-import tempfile
+from typing import Optional
 
 from . import openlist
 from .database import db_config
 from .config import DOWNLOADS_DIR, ARCHIVES_DIR, STATUS_DIR
 from .utils import (
     get_working_proxy,
-    upload_to_gofile,
     create_rclone_config,
     generate_archive_name,
     update_task_status,
+    update_upload_stats,
+    get_task_status_path,
     convert_rate_limit_to_kbps,
-    count_files_in_dir,
 )
+from .task_log import append_log, open_task_log, flush_log, close_log
+from .watchdog import ProcessWatchdog
+from .proxy_pool import proxy_pool
+from .site_budget import site_budget
+from .bandwidth import bandwidth_controller, DOWN, UP
+from .gdl_engine import use_inprocess_engine, parse_extra_options, merge_config, run_gallery_dl_inprocess
+from .retry_policy import TRANSIENT, AUTH, get_tool, classify_failure, should_retry, get_retry_delay, max_attempts, read_output_tail
+from .progress import DownloadProgress, make_gallery_dl_parser, stream_process_output
+from .kemono import KemonoEngine
+from .http_download import run_direct_download
+from .job_dedup import inflight_jobs
+from .gofile import GofileUploader, get_upload_concurrency
+from .archive_stream import ArchiveStream, use_stream_upload, STREAM_ATTEMPTS
+from .archive_builder import use_python_builder, build_archive_async, index_path_for
+from .split_planner import plan_volumes
+from .manifest import scan_manifest, get_manifest, forget_manifest
+from .retention import retain_download
+from .disk_manager import disk_manager
 
 # 获取logger
 logger = logging.getLogger(__name__)
@@ -31,115 +51,21 @@ debug_enabled = os.getenv("DEBUG_MODE", "false").lower() == "true"
 # 全局并发控制：同时最多运行2个任务
 task_semaphore = asyncio.Semaphore(2)
 
-def create_netscape_cookies(cookies_str: str) -> str:
-    """Converts a standard cookie string to a Netscape format cookie file."""
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-        f.write("# Netscape HTTP Cookie File\n")
-        f.write("# http://curl.haxx.se/rfc/cookie_spec.html\n")
-        f.write("# This is a generated file!  Do not edit.\n\n")
-        
-        for cookie in cookies_str.split(';'):
-            if '=' in cookie:
-                name, value = cookie.strip().split('=', 1)
-                # domains for kemono/coomer
-                f.write(f".kemono.cr\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n")
-                f.write(f".kemono.su\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n")
-                f.write(f".coomer.st\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n")
-                f.write(f".coomer.su\tTRUE\t/\tFALSE\t0\t{name}\t{value}\n")
-        return f.name
-
-
-async def unified_periodic_sync():
-    """Periodically syncs multiple tasks (including gallery-dl) to remote storage via rclone."""
-    from .utils import _run_rclone_command, GALLERY_DL_CONFIG_DIR, CONFIG_BACKUP_REMOTE_PATH
-    import base64
-    import tempfile
-    import json
-    
-    # Store last run times for each task to manage intervals
-    # Key: task identifier, Value: timestamp
-    last_run_times = {}
+# Full passes of the native kemono engine before a job with failed files gives up
+KEMONO_PASSES = 2
 
-    while True:
-        # 1. Load Custom Tasks from JSON
-        tasks_json = db_config.get_config("WDM_SYNC_TASKS_JSON", "[]")
-        try:
-            custom_tasks = json.loads(tasks_json)
-        except Exception as e:
-            logger.error(f"[Sync] Failed to parse sync tasks JSON: {e}")
-            custom_tasks = []
-
-        # 2. Add System Task (Gallery-dl Config)
-        system_task = {
-            "name": "System: Gallery-dl Config",
-            "local_path": str(GALLERY_DL_CONFIG_DIR),
-            "remote_path": CONFIG_BACKUP_REMOTE_PATH,
-            "interval": 10, # Minutes
-            "enabled": True,
-            "is_system": True
-        }
-        
-        # Merge all tasks
-        all_tasks = [system_task] + custom_tasks
-        rclone_base64 = db_config.get_config("WDM_CONFIG_BACKUP_RCLONE_BASE64")
-        
-        if rclone_base64:
-            current_time = time.time()
-            
-            for task in all_tasks:
-                task_name = task.get("name", "Unnamed Task")
-                enabled = str(task.get("enabled", "false")).lower() == "true"
-                local_path = task.get("local_path")
-                remote_path = task.get("remote_path")
-                interval_min = task.get("interval", 60)
-                
-                if not enabled or not local_path or not remote_path:
-                    continue
-                
-                # Check interval
-                interval_sec = int(interval_min) * 60
-                last_run = last_run_times.get(task_name, 0)
-                
-                if current_time - last_run >= interval_sec:
-                    if os.path.exists(local_path):
-                        logger.info(f"[Sync] Running task: {task_name} ({local_path} -> {remote_path})")
-                        try:
-                            rclone_config_content = base64.b64decode(rclone_base64).decode('utf-8')
-                            with tempfile.NamedTemporaryFile(mode='w', suffix='.conf', delete=False) as tmp_file:
-                                tmp_config_path = tmp_file.name
-                                tmp_file.write(rclone_config_content)
-                            
-                            try:
-                                rclone_cmd = (f"rclone copy \"{local_path}\" \"{remote_path}\" "
-                                              f"--config \"{tmp_config_path}\" "
-                                              f"--log-level=INFO")
-                                success = await _run_rclone_command(rclone_cmd)
-                                if success:
-                                    logger.info(f"[Sync] Success: {task_name}")
-                                    last_run_times[task_name] = current_time
-                                else:
-                                    logger.error(f"[Sync] Failed: {task_name} (Rclone error)")
-                            finally:
-                                if os.path.exists(tmp_config_path):
-                                    os.unlink(tmp_config_path)
-                        except Exception as e:
-                            logger.error(f"[Sync] Error in {task_name}: {e}")
-                    else:
-                        logger.warning(f"[Sync] Local path not found for {task_name}: {local_path}")
-
-        # Sleep for a short while before checking again
-        await asyncio.sleep(30) # Tick every 30 seconds
-
-
-
-
-async def run_command(command: str, command_to_log: str, status_file: Path, task_id: str):
+async def run_command(command: str, command_to_log: str, status_file: Path, task_id: str, progress: Optional[DownloadProgress] = None, watch_log: bool = True):
     """
     Runs a shell command asynchronously with auto-retry and improved error logging.
     The actual command output is captured and logged for debugging.
+    Failures are classified per tool and exit code (see retry_policy) to decide whether and
+    how long to wait before retrying; auth and permanent errors fail immediately.
+    If a progress tracker is given, output is piped through it instead of going straight to the log file.
+    A stall watchdog kills the command if it stops making progress; set watch_log=False for tools
+    (like rclone -P) that keep printing even when nothing is transferred.
     """
-    max_retries = 3
-    retry_delays = [5, 10, 15]  # seconds
+    tool = get_tool(command)
+    attempt_limit = max_attempts()
     
     last_exception = None
     
@@ -147,17 +73,43 @@ async def run_command(command: str, command_to_log: str, status_file: Path, task
     env = os.environ.copy()
     env["PYTHONUNBUFFERED"] = "1"
     
-    for attempt in range(max_retries):
+    attempt = 0
+    while True:
+        attempt += 1
+        stalled = False
+        if attempt > 1:
+            # Another job may have hit the site's rate limit while this one was waiting
+            await site_budget.wait_for_backoff(task_id, status_file)
         try:
-            with open(status_file, "a", encoding="utf-8") as log_file:
-                log_file.write(f"\n[Attempt {attempt + 1}/{max_retries}] Executing command: {command_to_log}\n")
+            append_log(status_file, f"\n[Attempt {attempt}] Executing command: {command_to_log}\n")
+            # Remember where this attempt's output starts so failures are classified on it alone
+            await flush_log(status_file)
+            try:
+                output_start = os.path.getsize(status_file)
+            except OSError:
+                output_start = 0
+
+            if progress is not None:
                 process = await asyncio.create_subprocess_shell(
                     command,
-                    stdout=log_file,
-                    stderr=log_file,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
                     preexec_fn=os.setsid,
                     env=env
                 )
+            else:
+                # The subprocess writes straight into the log file
+                log_file = await asyncio.to_thread(open, status_file, "a", encoding="utf-8")
+                try:
+                    process = await asyncio.create_subprocess_shell(
+                        command,
+                        stdout=log_file,
+                        stderr=log_file,
+                        preexec_fn=os.setsid,
+                        env=env
+                    )
+                finally:
+                    log_file.close()
 
             try:
                 pgid = os.getpgid(process.pid)
@@ -165,82 +117,156 @@ async def run_command(command: str, command_to_log: str, status_file: Path, task
             except ProcessLookupError:
                 pass
 
-            await process.wait()
+            watchdog = ProcessWatchdog(task_id, process, status_file, progress=progress, watch_log=watch_log).start()
+            try:
+                if progress is not None:
+                    await stream_process_output(process.stdout, status_file, progress)
+                await process.wait()
+            finally:
+                watchdog.stop()
             update_task_status(task_id, {"pgid": None})
 
             if process.returncode == 0:
-                with open(status_file, "a") as f:
-                    f.write(f"\n[Attempt {attempt + 1}] Task finished successfully.\n")
+                append_log(status_file, f"\n[Attempt {attempt}] Task finished successfully.\n")
+                # A stall flagged on this or an earlier attempt is over
+                update_task_status(task_id, {"stall": None})
+                site_budget.report(task_id, None)
                 return
+
+            stalled = watchdog.stalled
+            await flush_log(status_file)
+            output = await asyncio.to_thread(read_output_tail, status_file, output_start)
+            # Jobs hold their site lease only while downloading, so uploads never count a 403 as rate limiting
+            category = classify_failure(tool, process.returncode, output or "", stalled=stalled,
+                                        site_limited=site_budget.get_lease(task_id) is not None)
+            site_budget.report(task_id, category)
+
+            # Log detailed error information
+            append_log(status_file, f"\n--- TASK FAILED (Attempt {attempt}, Exit Code: {process.returncode}, Class: {category}) ---\n")
+            if debug_enabled:
+                append_log(status_file, f"Debug mode enabled - error details are in the log above.\n")
+            else:
+                append_log(status_file, f"Error details are available in the log above.\n")
+            
+            # Store the exception for final raise
+            if watchdog.killed:
+                last_exception = RuntimeError("Command stalled without progress and was killed.")
+            elif stalled:
+                last_exception = RuntimeError(f"Command failed with exit code {process.returncode} after stalling without progress.")
+            elif category == AUTH:
+                last_exception = RuntimeError(f"Command failed with exit code {process.returncode} (authentication error, check credentials).")
             else:
-                # Log detailed error information
-                with open(status_file, "a") as f:
-                    f.write(f"\n--- TASK FAILED (Attempt {attempt + 1}/{max_retries}, Exit Code: {process.returncode}) ---\n")
-                    if debug_enabled:
-                        f.write(f"Debug mode enabled - error details are in the log above.\n")
-                    else:
-                        f.write(f"Error details are available in the log above.\n")
-                
-                # Store the exception for final raise
                 last_exception = RuntimeError(f"Command failed with exit code {process.returncode}.")
-                
-                # If this was the last attempt, break and raise
-                if attempt == max_retries - 1:
-                    break
-                    
-                # Wait before retry
-                retry_delay = retry_delays[attempt]
-                with open(status_file, "a") as f:
-                    f.write(f"Waiting {retry_delay} seconds before retry...\n")
-                await asyncio.sleep(retry_delay)
-                
-                with open(status_file, "a") as f:
-                    f.write(f"Retrying command...\n")
                     
         except Exception as e:
-            with open(status_file, "a") as f:
-                f.write(f"\n--- EXCEPTION DURING COMMAND EXECUTION (Attempt {attempt + 1}/{max_retries}) ---\n")
-                f.write(f"Exception: {str(e)}\n")
-                if debug_enabled:
-                    import traceback
-                    f.write(f"Traceback:\n{traceback.format_exc()}\n")
+            append_log(status_file, f"\n--- EXCEPTION DURING COMMAND EXECUTION (Attempt {attempt}) ---\n")
+            append_log(status_file, f"Exception: {str(e)}\n")
+            if debug_enabled:
+                import traceback
+                append_log(status_file, f"Traceback:\n{traceback.format_exc()}\n")
             
             last_exception = e
-            
-            # If this was the last attempt, break and raise
-            if attempt == max_retries - 1:
-                break
-                
-            # Wait before retry
-            retry_delay = retry_delays[attempt]
-            await asyncio.sleep(retry_delay)
+            category = TRANSIENT
+
+        if attempt >= attempt_limit or not should_retry(category, attempt):
+            break
+
+        # Wait before retry
+        retry_delay = get_retry_delay(category, attempt)
+        update_task_status(task_id, {"retry": {"attempt": attempt, "class": category, "delay": round(retry_delay)}})
+        append_log(status_file, f"Waiting {retry_delay:.0f} seconds before retry ({category})...\n")
+        await asyncio.sleep(retry_delay)
+        append_log(status_file, f"Retrying command...\n")
     
     # If we get here, all retries failed
     if last_exception:
-        with open(status_file, "a") as f:
-            f.write(f"\n--- ALL RETRY ATTEMPTS FAILED ---\n")
-            f.write(f"Final error: {str(last_exception)}\n")
+        append_log(status_file, f"\n--- ALL RETRY ATTEMPTS FAILED ---\n")
+        append_log(status_file, f"Final error: {str(last_exception)}\n")
         raise last_exception
 
 
-async def upload_uncompressed(task_id: str, service: str, upload_path: str, params: dict, status_file: Path):
-    """Uploads the uncompressed files to the remote storage with progress tracking."""
+# Full attempts per destination when a job uploads to several destinations at once
+DESTINATION_ATTEMPTS = 2
+RCLONE_PROGRESS_INTERVAL = 5  # matches the bandwidth controller's rc polling
+
+
+def parse_destinations(service: str, upload_path: str, params: dict) -> list:
+    """
+    The job's upload destinations: the main service/path first, then one per line of the
+    optional extra_destinations field ("service:path", e.g. "s3:bucket/mirror").
+    Extra destinations use the credentials from the settings page.
+    """
+    destinations = [{"service": service, "upload_path": upload_path}]
+    for line in (params.get("extra_destinations") or "").splitlines():
+        extra_service, _, extra_path = line.strip().partition(":")
+        extra_service = extra_service.strip().lower()
+        if not extra_service:
+            continue
+        if extra_service not in ("webdav", "s3", "b2", "gofile", "openlist"):
+            raise ValueError(f"Unknown upload service in extra destinations: {extra_service}")
+        destination = {"service": extra_service, "upload_path": extra_path.strip()}
+        if destination not in destinations:
+            destinations.append(destination)
+    for destination in destinations:
+        destination["label"] = f"{destination['service']}:{destination['upload_path'] or ''}"
+    return destinations
+
+
+def rclone_config_id(task_id: str, destination: Optional[str]) -> str:
+    """Concurrent rclone uploads of one task need their own config files."""
+    if destination is None:
+        return task_id
+    return f"{task_id}_{hashlib.sha1(destination.encode('utf-8')).hexdigest()[:8]}"
+
+
+async def run_rclone_upload(upload_cmd: str, log_file: Path, task_id: str, transfer, destination: Optional[str] = None, whole_upload: bool = False):
+    """
+    Runs an rclone upload. For a destination of a multi-destination job, its progress comes from
+    rclone's rc stats (the shared upload log interleaves all destinations, so it cannot be parsed).
+    whole_upload: the command transfers the entire upload, so its byte progress is the overall percent.
+    """
+    if destination is None:
+        await run_command(upload_cmd, transfer.mask(upload_cmd), log_file, task_id, watch_log=False)
+        return
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(RCLONE_PROGRESS_INTERVAL)
+            rc_stats = transfer.rc_stats or {}
+            total = rc_stats.get("totalBytes") or 0
+            if not total:
+                continue
+            percent = int(rc_stats.get("bytes", 0) * 100 / total)
+            update_upload_stats(task_id, {"percent": percent} if whole_upload else {"file_percent": percent}, destination)
+
+    reporter = asyncio.create_task(report_progress())
+    try:
+        await run_command(upload_cmd, transfer.mask(upload_cmd), log_file, task_id, watch_log=False)
+    finally:
+        reporter.cancel()
+
+
+async def upload_uncompressed(task_id: str, service: str, upload_path: str, params: dict, status_file: Path, source_dir: Optional[Path] = None, destination: Optional[str] = None):
+    """
+    Uploads the uncompressed files to the remote storage with progress tracking.
+    source_dir defaults to the task's own download directory (subscribers upload the primary's).
+    With a destination label, progress goes to that destination's entry in upload_stats.
+    Raises on failure.
+    """
     if service == "gofile":
-        with open(status_file, "a") as f:
-            f.write("\nUncompressed upload is not supported for gofile.io.\n")
+        append_log(status_file, "\nUncompressed upload is not supported for gofile.io.\n")
         return
     
-    task_download_dir = DOWNLOADS_DIR / task_id
-    stats = count_files_in_dir(task_download_dir)
-    update_task_status(task_id, {
-        "upload_stats": {
-            "total_files": stats["count"],
-            "total_size": stats["size"],
-            "uploaded_files": 0,
-            "uploaded_size": 0,
-            "percent": 0
-        }
-    })
+    task_download_dir = source_dir or DOWNLOADS_DIR / task_id
+    manifest = await asyncio.to_thread(get_manifest, task_download_dir)
+    stats = {"count": manifest.count, "size": manifest.size}
+    update_upload_stats(task_id, {
+        "total_files": stats["count"],
+        "total_size": stats["size"],
+        "uploaded_files": 0,
+        "uploaded_size": 0,
+        "percent": 0
+    }, destination)
 
     if service == "openlist":
             try:
@@ -251,8 +277,7 @@ async def upload_uncompressed(task_id: str, service: str, upload_path: str, para
                 if not all([openlist_url, openlist_user, openlist_pass, upload_path]):
                     raise openlist.OpenlistError(f"Openlist configuration missing.")
     
-                with open(status_file, "a") as f:
-                    f.write(f"\n--- Starting Openlist Upload (Uncompressed) ---")
+                append_log(status_file, f"\n--- Starting Openlist Upload (Uncompressed) ---")
                 
                 token = await asyncio.to_thread(openlist.login, openlist_url, openlist_user, openlist_pass, status_file)
                 
@@ -270,83 +295,70 @@ async def upload_uncompressed(task_id: str, service: str, upload_path: str, para
                         size /= 1024.0
                     return f"{size:.2f} PB"
 
-                async def upload_dir_contents(local_dir: Path, remote_dir: str):
-                    nonlocal uploaded_count, total_uploaded_size, last_update_time
-                    for item in local_dir.iterdir():
-                        if item.is_dir():
-                            remote_item_path = f"{remote_dir}/{item.name}"
-                            await asyncio.to_thread(openlist.create_directory, openlist_url, token, remote_item_path, status_file)
-                            await upload_dir_contents(item, remote_item_path)
-                        else:
-                            file_size = item.stat().st_size
-                            def progress_handler(current, total):
-                                nonlocal last_update_time
-                                now = time.time()
-                                if now - last_update_time < 0.5 and current < total:
-                                    return
-                                last_update_time = now
-                                
-                                # Total progress calculation
-                                current_total_uploaded = total_uploaded_size + current
-                                total_percent = int((current_total_uploaded / stats["size"]) * 100) if stats["size"] > 0 else 0
-                                file_percent = int((current / total) * 100) if total > 0 else 0
-                                
-                                update_task_status(task_id, {
-                                    "upload_stats": {
-                                        "total_files": stats["count"],
-                                        "total_size": stats["size"],
-                                        "uploaded_files": uploaded_count,
-                                        "percent": total_percent,
-                                        "file_percent": file_percent,
-                                        "current_file": item.name,
-                                        "transferred": format_size(current_total_uploaded),
-                                        "total": format_size(stats["size"])
-                                    }
-                                })
-
-                            await asyncio.to_thread(openlist.upload_file, openlist_url, token, item, remote_dir, status_file, progress_handler)
-                            
-                            uploaded_count += 1
-                            total_uploaded_size += file_size
-                            
-                            # Final update for this file
-                            percent = int((uploaded_count / stats["count"]) * 100) if stats["count"] > 0 else 100
-                            # Also update total size based percent for consistency
-                            total_percent_size = int((total_uploaded_size / stats["size"]) * 100) if stats["size"] > 0 else 100
-                            
-                            update_task_status(task_id, {
-                                "upload_stats": {
-                                    "total_files": stats["count"],
-                                    "total_size": stats["size"],
-                                    "uploaded_files": uploaded_count,
-                                    "percent": total_percent_size,
-                                    "file_percent": 100,
-                                    "current_file": item.name,
-                                    "transferred": format_size(total_uploaded_size),
-                                    "total": format_size(stats["size"])
-                                }
-                            })
-    
-                await upload_dir_contents(task_download_dir, remote_task_dir)
+                # Directories first (parents before children), then every file from the manifest
+                for directory in manifest.directories():
+                    await asyncio.to_thread(openlist.create_directory, openlist_url, token, f"{remote_task_dir}/{directory}", status_file)
+
+                for rel_path, file_size, _ in manifest.entries:
+                    item = task_download_dir / rel_path
+                    parent = os.path.dirname(rel_path)
+                    remote_dir = f"{remote_task_dir}/{parent}" if parent else remote_task_dir
+
+                    def progress_handler(current, total):
+                        nonlocal last_update_time
+                        now = time.time()
+                        if now - last_update_time < 0.5 and current < total:
+                            return
+                        last_update_time = now
+
+                        # Total progress calculation
+                        current_total_uploaded = total_uploaded_size + current
+                        total_percent = int((current_total_uploaded / stats["size"]) * 100) if stats["size"] > 0 else 0
+                        file_percent = int((current / total) * 100) if total > 0 else 0
+
+                        update_upload_stats(task_id, {
+                            "total_files": stats["count"],
+                            "total_size": stats["size"],
+                            "uploaded_files": uploaded_count,
+                            "percent": total_percent,
+                            "file_percent": file_percent,
+                            "current_file": item.name,
+                            "transferred": format_size(current_total_uploaded),
+                            "total": format_size(stats["size"])
+                        }, destination)
+
+                    await asyncio.to_thread(openlist.upload_file, openlist_url, token, item, remote_dir, status_file, progress_handler)
+
+                    uploaded_count += 1
+                    total_uploaded_size += file_size
+
+                    # Final update for this file
+                    total_percent_size = int((total_uploaded_size / stats["size"]) * 100) if stats["size"] > 0 else 100
+
+                    update_upload_stats(task_id, {
+                        "total_files": stats["count"],
+                        "total_size": stats["size"],
+                        "uploaded_files": uploaded_count,
+                        "percent": total_percent_size,
+                        "file_percent": 100,
+                        "current_file": item.name,
+                        "transferred": format_size(total_uploaded_size),
+                        "total": format_size(stats["size"])
+                    }, destination)
     
-                update_task_status(task_id, {"status": "completed"})
-                with open(status_file, "a") as f:
-                    f.write("\nOpenlist upload completed successfully.\n")
+                append_log(status_file, "\nOpenlist upload completed successfully.\n")
     
             except openlist.OpenlistError as e:
                 error_message = f"Openlist upload failed: {e}"
-                with open(status_file, "a") as f:
-                    f.write(f"\n--- UPLOAD FAILED ---\n{error_message}\n")
-                update_task_status(task_id, {"status": "failed", "error": error_message})
+                append_log(status_file, f"\n--- UPLOAD FAILED ---\n{error_message}\n")
+                raise RuntimeError(error_message) from e
             return
     
-    rclone_config_path = create_rclone_config(task_id, service, params)
+    rclone_config_path = create_rclone_config(rclone_config_id(task_id, destination), service, params)
     if not rclone_config_path:
         error_message = f"Failed to create rclone configuration for {service}."
-        with open(status_file, "a") as f:
-            f.write(f"\n--- UPLOAD FAILED ---\n{error_message}\n")
-        update_task_status(task_id, {"status": "failed", "error": error_message})
-        return
+        append_log(status_file, f"\n--- UPLOAD FAILED ---\n{error_message}\n")
+        raise RuntimeError(error_message)
 
     remote_full_path = f"remote:{upload_path}"
         
@@ -354,74 +366,521 @@ async def upload_uncompressed(task_id: str, service: str, upload_path: str, para
         f"rclone copy --config \"{rclone_config_path}\" \"{task_download_dir}\" \"{remote_full_path}\" "
         f"-P --stats 1s --log-level=INFO --retries 5"
     )
-    if params.get("upload_rate_limit"):
-        upload_cmd += f" --bwlimit {params['upload_rate_limit']}"
-    await run_command(upload_cmd, upload_cmd, status_file, task_id)
+    try:
+        with bandwidth_controller.track(task_id, UP, params.get("upload_rate_limit")) as transfer:
+            upload_cmd += transfer.rclone_flags()
+            await run_rclone_upload(upload_cmd, status_file, task_id, transfer, destination, whole_upload=True)
+    finally:
+        if os.path.exists(rclone_config_path):
+            os.remove(rclone_config_path)
 
 
 async def compress_in_chunks(task_id: str, source_dir: Path, archive_name_base: str, max_size: int, status_file: Path) -> list[Path]:
-    """Compresses files in chunks of a given size in a memory-efficient way."""
+    """
+    Compresses the download into volumes of at most max_size. The split is planned up front
+    (see split_planner: directories kept together, balanced volume sizes) and published as the
+    task's split_plan before compression starts; the full volume -> files mapping is written to
+    STATUS_DIR/{task_id}_split_plan.jsonl. With the Python archive builder, volumes are compressed
+    in its process pool in parallel and each gets a sidecar index, returned right after its archive.
+    """
+    manifest = await asyncio.to_thread(get_manifest, source_dir)
+    files = [(path, size) for path, size, _ in manifest.entries]
+    volumes = await asyncio.to_thread(plan_volumes, files, max_size)
+    plan = [{
+        "volume": number,
+        "archive": f"{archive_name_base}_{number}.tar.zst",
+        "files": len(volume),
+        "size": sum(size for _, size in volume),
+        "status": "planned",
+    } for number, volume in enumerate(volumes, 1)]
+    # .jsonl, one volume per line: the task list treats every *.json in STATUS_DIR as a task
+    plan_file = STATUS_DIR / f"{task_id}_split_plan.jsonl"
+    with open(plan_file, "w", encoding="utf-8") as f:
+        for entry, volume in zip(plan, volumes):
+            f.write(json.dumps({"archive": entry["archive"], "files": [path for path, _ in volume]}, ensure_ascii=False) + "\n")
+    update_task_status(task_id, {"split_plan": plan, "split_plan_file": str(plan_file)})
+    sizes_mb = ", ".join(f"{entry['size'] / 1024 / 1024:.0f}" for entry in plan)
+    append_log(status_file, f"\nSplit plan: {len(files)} files into {len(plan)} volume(s) of {sizes_mb} MB\n")
+
+    def mark(number: int, status: str):
+        plan[number - 1]["status"] = status
+        update_task_status(task_id, {"split_plan": plan})
+
     archive_paths = []
-    files_to_compress = []
-    current_size = 0
-    chunk_number = 1
     temp_file_list_path = None
+    python_builder = use_python_builder()
+    builds = []
+    started = set()  # builds a pool worker has taken up; those cannot be interrupted
 
-    async def _compress_chunk(chunk_num, file_list_path):
-        archive_path = ARCHIVES_DIR / f"{archive_name_base}_{chunk_num}.tar.zst"
-        with open(status_file, "a") as f:
-            f.write(f"\nCompressing chunk {chunk_num} to {archive_path.name}...\n")
-        
-        compress_cmd = f"tar -cf - -C \"{source_dir}\" --files-from=\"{file_list_path}\" | zstd -o \"{archive_path}\""
-        await run_command(compress_cmd, compress_cmd, status_file, task_id)
-        archive_paths.append(archive_path)
-        if os.path.exists(file_list_path):
-            os.remove(file_list_path)
+    async def _build(number: int, archive_path: Path, rel_paths: list):
+        def on_start():
+            started.add(number)
+            append_log(status_file, f"\nCompressing chunk {number} to {archive_path.name}...\n")
+            mark(number, "compressing")
 
-    try:
-        for item in source_dir.rglob("*"):
-            if item.is_file():
-                file_size = item.stat().st_size
-                
-                if current_size + file_size > max_size and files_to_compress:
-                    temp_file_list_path = STATUS_DIR / f"{task_id}_chunk_{chunk_number}.txt"
-                    with open(temp_file_list_path, 'w', encoding='utf-8') as f:
-                        for file_path in files_to_compress:
-                            f.write(f"{file_path.relative_to(source_dir)}\n")
-                    
-                    await _compress_chunk(chunk_number, temp_file_list_path)
-                    
-                    files_to_compress = []
-                    current_size = 0
-                    chunk_number += 1
-                
-                files_to_compress.append(item)
-                current_size += file_size
+        result = await build_archive_async(source_dir, rel_paths, archive_path, on_start=on_start)
+        mark(number, "compressed")
+        append_log(status_file, f"Built {archive_path.name}: {result['members']} files, {result['size']} bytes (index: {Path(result['index']).name})\n")
 
-        if files_to_compress:
-            temp_file_list_path = STATUS_DIR / f"{task_id}_chunk_{chunk_number}.txt"
+    try:
+        for entry, volume in zip(plan, volumes):
+            number = entry["volume"]
+            archive_path = ARCHIVES_DIR / entry["archive"]
+            if python_builder:
+                # Marked compressing once a pool worker picks it up (MAX_WORKERS at a time)
+                builds.append((number, asyncio.ensure_future(_build(number, archive_path, [path for path, _ in volume]))))
+                archive_paths.extend([archive_path, index_path_for(archive_path)])
+                continue
+
+            append_log(status_file, f"\nCompressing chunk {number} to {archive_path.name}...\n")
+            mark(number, "compressing")
+            temp_file_list_path = STATUS_DIR / f"{task_id}_chunk_{number}.txt"
             with open(temp_file_list_path, 'w', encoding='utf-8') as f:
-                for file_path in files_to_compress:
-                    f.write(f"{file_path.relative_to(source_dir)}\n")
-            
-            await _compress_chunk(chunk_number, temp_file_list_path)
+                for path, _ in volume:
+                    f.write(f"{path}\n")
+            compress_cmd = f"tar -cf - -C \"{source_dir}\" --files-from=\"{temp_file_list_path}\" | zstd -o \"{archive_path}\""
+            await run_command(compress_cmd, compress_cmd, status_file, task_id)
+            archive_paths.append(archive_path)
+            mark(number, "compressed")
+            os.remove(temp_file_list_path)
+
+        if builds:
+            # wait(), unlike gather(), leaves the builds alone if this job is cancelled meanwhile
+            done, _ = await asyncio.wait([build for _, build in builds], return_when=asyncio.FIRST_EXCEPTION)
+            for build in done:
+                build.result()
 
     finally:
+        # Builds still queued are dropped. Running ones finish in the pool regardless, so wait for
+        # them: the job's cleanup must see the files they write
+        running = []
+        for number, build in builds:
+            if number in started:
+                running.append(build)
+            else:
+                build.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
         if temp_file_list_path and os.path.exists(temp_file_list_path):
             os.remove(temp_file_list_path)
 
     return archive_paths
 
 
+def gofile_credentials(params: dict) -> tuple:
+    """(api token, folder id) for gofile uploads; per-job values override the settings."""
+    gofile_token = params.get("gofile_token") or db_config.get_config("WDM_GOFILE_TOKEN")
+    gofile_folder_id = params.get("gofile_folder_id") or db_config.get_config("WDM_GOFILE_FOLDER_ID")
+    if gofile_token and not gofile_folder_id:
+        gofile_folder_id = "ad957716-3899-498a-bebc-716f616f9b16"
+    return gofile_token, gofile_folder_id
+
+
+async def upload_archives(task_id: str, service: str, upload_path: str, params: dict, archive_paths: list, upload_log_file: Path, destination: Optional[str] = None):
+    """
+    Uploads the archives of a job to one destination, with progress in the task's upload_stats
+    (under the destination's entry if a destination label is given).
+    """
+    rclone_config_path = None
+    gofile_uploader = None
+    try:
+        # Initialize upload stats
+        total_upload_files = len(archive_paths)
+        update_upload_stats(task_id, {
+            "total_files": total_upload_files,
+            "uploaded_files": 0,
+            "percent": 0
+        }, destination)
+
+        if service == "gofile":
+            if debug_enabled:
+                logger.debug(f"[WORKFLOW] 使用 gofile.io 并发上传 {total_upload_files} 个文件")
+            # One pooled client for all archives of this job
+            gofile_uploader = GofileUploader(upload_log_file, *gofile_credentials(params))
+            total_archives_size = sum(p.stat().st_size for p in archive_paths)
+            # Bytes sent per archive; several archives are in flight at once
+            sent_bytes = {p: 0 for p in archive_paths}
+            gofile_links = []
+
+            def publish_gofile_stats(current_file=None):
+                stats = {
+                    "total_files": total_upload_files,
+                    "uploaded_files": len(gofile_links),
+                    "percent": int(sum(sent_bytes.values()) * 100 / total_archives_size) if total_archives_size > 0 else 0,
+                    "gofile_links": sorted(gofile_links, key=lambda item: item["index"]),
+                }
+                if current_file:
+                    stats["current_file"] = current_file
+                update_upload_stats(task_id, stats, destination)
+
+            def gofile_progress(path, current, total):
+                sent_bytes[path] = current
+                publish_gofile_stats(path.name)
+
+            def gofile_done(path, data):
+                sent_bytes[path] = path.stat().st_size
+                gofile_links.append({
+                    "index": archive_paths.index(path),
+                    "name": path.name,
+                    "link": data.get("downloadPage"),
+                    "server": data.get("server"),
+                })
+                publish_gofile_stats()
+
+            concurrency = get_upload_concurrency()
+            append_log(upload_log_file, f"Uploading {total_upload_files} file(s) to gofile.io, {concurrency} at a time...\n")
+            results = await gofile_uploader.upload_many(archive_paths, concurrency, gofile_progress, gofile_done)
+
+            # All chunks share one folder, so the first link is the folder page
+            download_link = results[0].get("downloadPage") if results else None
+            links = sorted(gofile_links, key=lambda item: item["index"])
+            update_task_status(task_id, {"gofile_link": download_link, "gofile_links": links})
+            update_upload_stats(task_id, {
+                "total_files": total_upload_files,
+                "uploaded_files": total_upload_files,
+                "percent": 100,
+                "gofile_link": download_link,
+                "gofile_links": links,
+            }, destination)
+            if debug_enabled:
+                logger.debug(f"[WORKFLOW] gofile.io 上传完成，链接: {download_link}")
+            return
+
+        uploaded_count = 0
+        for archive_path in archive_paths:
+            if service == "openlist":
+                if debug_enabled:
+                    logger.debug(f"[WORKFLOW] 使用 Openlist 上传: {archive_path}")
+                openlist_url = params.get("openlist_url") or db_config.get_config("WDM_OPENLIST_URL")
+                openlist_user = params.get("openlist_user") or db_config.get_config("WDM_OPENLIST_USER")
+                openlist_pass = params.get("openlist_pass") or db_config.get_config("WDM_OPENLIST_PASS")
+                if not all([openlist_url, openlist_user, openlist_pass, upload_path]):
+                    raise openlist.OpenlistError("Openlist URL, username, password, and remote path are all required.")
+                append_log(upload_log_file, f"\n--- Starting Openlist Upload ---\n")
+                token = await asyncio.to_thread(openlist.login, openlist_url, openlist_user, openlist_pass, upload_log_file)
+                await asyncio.to_thread(openlist.create_directory, openlist_url, token, upload_path, upload_log_file)
+
+                # Initialize tracking variables for archives
+                total_archives_size = sum(p.stat().st_size for p in archive_paths)
+                total_uploaded_archives_size = 0
+                last_update_time = 0
+
+                def format_size(size):
+                    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+                        if size < 1024.0:
+                            return f"{size:.2f} {unit}"
+                        size /= 1024.0
+                    return f"{size:.2f} PB"
+
+                # Single archive upload in openlist (could be multiple if split)
+                current_archive_size = archive_path.stat().st_size
+
+                def progress_handler(current, total):
+                    nonlocal last_update_time
+                    now = time.time()
+                    if now - last_update_time < 0.5 and current < total:
+                        return
+                    last_update_time = now
+
+                    # Total progress (considering previously uploaded archives in the loop)
+                    # Note: uploaded_count is updated AFTER the file is done in the loop
+                    # So current_total includes size of already uploaded files + current progress
+
+                    # We need to calculate size of *previous* archives in this loop
+                    # The loop iterates 'archive_paths'. We can use 'uploaded_count' as index if we are careful,
+                    # but simpler to just track accumulated size.
+
+                    # Actually, 'uploaded_count' is incremented at the end of loop.
+                    # So 'total_uploaded_archives_size' tracks completed files.
+
+                    current_total_uploaded = total_uploaded_archives_size + current
+                    total_percent = int((current_total_uploaded / total_archives_size) * 100) if total_archives_size > 0 else 0
+                    file_percent = int((current / total) * 100) if total > 0 else 0
+
+                    update_upload_stats(task_id, {
+                        "total_files": total_upload_files,
+                        "uploaded_files": uploaded_count,
+                        "percent": total_percent,
+                        "file_percent": file_percent,
+                        "current_file": archive_path.name,
+                        "transferred": format_size(current_total_uploaded),
+                        "total": format_size(total_archives_size)
+                    }, destination)
+
+                await asyncio.to_thread(openlist.upload_file, openlist_url, token, archive_path, upload_path, upload_log_file, progress_handler)
+
+                total_uploaded_archives_size += current_archive_size
+
+                uploaded_count += 1
+                percent = int((uploaded_count / total_upload_files) * 100)
+                update_upload_stats(task_id, {
+                    "total_files": total_upload_files,
+                    "uploaded_files": uploaded_count,
+                    "percent": percent
+                }, destination)
+
+                if debug_enabled:
+                    logger.debug(f"[WORKFLOW] Openlist 上传完成")
+            else:
+                if debug_enabled:
+                    logger.debug(f"[WORKFLOW] 使用 rclone 上传到 {service}: {archive_path}")
+                rclone_config_path = create_rclone_config(rclone_config_id(task_id, destination), service, params)
+                if not rclone_config_path:
+                    raise RuntimeError(f"Failed to create rclone configuration for {service}. Please check your settings in the Settings page.")
+
+                remote_full_path = f"remote:{upload_path}"
+                upload_cmd = (
+                    f"rclone copyto --config \"{rclone_config_path}\" \"{archive_path}\" \"{remote_full_path}/{archive_path.name}\" "
+                    f"-P --stats 1s --log-level=INFO --retries 5"
+                )
+                with bandwidth_controller.track(task_id, UP, params.get("upload_rate_limit")) as transfer:
+                    upload_cmd += transfer.rclone_flags()
+                    await run_rclone_upload(upload_cmd, upload_log_file, task_id, transfer, destination)
+
+                uploaded_count += 1
+                percent = int((uploaded_count / total_upload_files) * 100)
+                update_upload_stats(task_id, {
+                    "total_files": total_upload_files,
+                    "uploaded_files": uploaded_count,
+                    "percent": percent
+                }, destination)
+
+                if debug_enabled:
+                    logger.debug(f"[WORKFLOW] rclone 上传完成")
+    finally:
+        if rclone_config_path and os.path.exists(rclone_config_path):
+            os.remove(rclone_config_path)
+        if gofile_uploader is not None:
+            await gofile_uploader.aclose()
+
+
+async def upload_archive_stream(task_id: str, service: str, upload_path: str, params: dict, source_dir: Path, archive_file_name: str, upload_log_file: Path):
+    """
+    Compresses source_dir with tar | zstd straight into the upload: rclone rcat, a chunked PUT to
+    Openlist or a chunked multipart body to gofile. The archive never touches ARCHIVES_DIR and
+    compression overlaps the network transfer. Upload percent follows how much of the source tar
+    has read. A stream cannot be resumed, so a failed run starts over from the source tree.
+    """
+    total_size = (await asyncio.to_thread(get_manifest, source_dir)).size
+
+    def format_size(size):
+        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if size < 1024.0:
+                return f"{size:.2f} {unit}"
+            size /= 1024.0
+        return f"{size:.2f} PB"
+
+    for attempt in range(1, STREAM_ATTEMPTS + 1):
+        stream = ArchiveStream(source_dir, upload_log_file)
+        rclone_config_path = None
+        transfer = None
+        watchdog = None
+
+        async def report_progress():
+            while True:
+                await asyncio.sleep(1)
+                sent = stream.sent or ((transfer.rc_stats or {}).get("bytes", 0) if transfer else 0)
+                update_upload_stats(task_id, {
+                    "total_files": 1,
+                    "uploaded_files": 0,
+                    "percent": min(99, int(stream.read_progress() * 100 / total_size)) if total_size else 0,
+                    "current_file": archive_file_name,
+                    "transferred": format_size(sent),
+                    "streaming": True
+                })
+
+        def watch():
+            nonlocal watchdog
+            update_task_status(task_id, {"pgid": os.getpgid(stream.leader.pid)})
+            watchdog = ProcessWatchdog(task_id, stream.leader, upload_log_file, watch_log=False).start()
+
+        append_log(upload_log_file, f"\n[Attempt {attempt}] Streaming {archive_file_name} to {service}...\n")
+        reporter = asyncio.create_task(report_progress())
+        try:
+            if service == "gofile":
+                fd = await stream.start()
+                watch()
+                async with GofileUploader(upload_log_file, *gofile_credentials(params)) as uploader:
+                    data = await uploader.upload_stream(archive_file_name, stream.read_chunks(fd))
+                await stream.wait()
+                update_task_status(task_id, {"gofile_link": data.get("downloadPage")})
+            elif service == "openlist":
+                openlist_url = params.get("openlist_url") or db_config.get_config("WDM_OPENLIST_URL")
+                openlist_user = params.get("openlist_user") or db_config.get_config("WDM_OPENLIST_USER")
+                openlist_pass = params.get("openlist_pass") or db_config.get_config("WDM_OPENLIST_PASS")
+                if not all([openlist_url, openlist_user, openlist_pass, upload_path]):
+                    raise openlist.OpenlistError("Openlist URL, username, password, and remote path are all required.")
+                token = await asyncio.to_thread(openlist.login, openlist_url, openlist_user, openlist_pass, upload_log_file)
+                await asyncio.to_thread(openlist.create_directory, openlist_url, token, upload_path, upload_log_file)
+                fd = await stream.start()
+                watch()
+                await asyncio.to_thread(openlist.upload_stream, openlist_url, token, stream.iter_chunks(fd),
+                                        f"{upload_path.rstrip('/')}/{archive_file_name}", upload_log_file)
+                await stream.wait()
+            else:
+                rclone_config_path = create_rclone_config(task_id, service, params)
+                if not rclone_config_path:
+                    raise RuntimeError(f"Failed to create rclone configuration for {service}. Please check your settings in the Settings page.")
+                with bandwidth_controller.track(task_id, UP, params.get("upload_rate_limit")) as transfer:
+                    rcat_cmd = [
+                        "rclone", "rcat", "--config", str(rclone_config_path), f"remote:{upload_path}/{archive_file_name}",
+                        "--stats", "5s", "--log-level=INFO", "--retries", "5"
+                    ] + shlex.split(transfer.rclone_flags())
+                    await stream.start(rcat_cmd)
+                    watch()
+                    await stream.wait()
+
+            update_upload_stats(task_id, {
+                "total_files": 1,
+                "uploaded_files": 1,
+                "percent": 100,
+                "current_file": archive_file_name,
+                "transferred": format_size(stream.sent or ((transfer.rc_stats or {}).get("bytes", 0) if transfer else 0)),
+                "streaming": True
+            })
+            append_log(upload_log_file, f"[Attempt {attempt}] Streamed upload finished.\n")
+            update_task_status(task_id, {"stall": None})
+            return
+        except Exception as e:
+            append_log(upload_log_file, f"\n--- STREAMED UPLOAD FAILED (Attempt {attempt}/{STREAM_ATTEMPTS}) ---\n{e}\n")
+            if watchdog is not None and watchdog.killed:
+                e = RuntimeError("Streamed upload stalled without progress and was killed.")
+            if attempt >= STREAM_ATTEMPTS:
+                raise e
+        finally:
+            reporter.cancel()
+            if watchdog is not None:
+                watchdog.stop()
+            await stream.kill()
+            update_task_status(task_id, {"pgid": None})
+            if rclone_config_path and os.path.exists(rclone_config_path):
+                os.remove(rclone_config_path)
+
+
+async def upload_to_destinations(task_id: str, destinations: list, params: dict, archive_paths: list, upload_log_file: Path, source_dir: Optional[Path] = None):
+    """
+    Uploads the job's archives (or, with no archives, the uncompressed tree) to every destination.
+    A single destination keeps the classic upload_stats; several run concurrently from the same
+    local files, each with its own progress, retries and final state in upload_stats["destinations"].
+    Raises if any destination failed after its attempts.
+    """
+    async def upload(destination: dict, label: Optional[str]):
+        if archive_paths:
+            await upload_archives(task_id, destination["service"], destination["upload_path"], params, archive_paths, upload_log_file, destination=label)
+        else:
+            await upload_uncompressed(task_id, destination["service"], destination["upload_path"], params, upload_log_file,
+                                      source_dir=source_dir, destination=label)
+
+    if len(destinations) == 1:
+        await upload(destinations[0], None)
+        return
+
+    async def upload_one(destination: dict) -> Optional[str]:
+        label = destination["label"]
+        for attempt in range(1, DESTINATION_ATTEMPTS + 1):
+            update_upload_stats(task_id, {"status": "uploading", "attempt": attempt}, label)
+            append_log(upload_log_file, f"\n--- [{label}] Upload attempt {attempt}/{DESTINATION_ATTEMPTS} ---\n")
+            try:
+                await upload(destination, label)
+                update_upload_stats(task_id, {"status": "completed", "percent": 100, "error": None}, label)
+                append_log(upload_log_file, f"\n[{label}] Upload completed.\n")
+                return None
+            except Exception as e:
+                append_log(upload_log_file, f"\n[{label}] Upload failed: {e}\n")
+                if attempt < DESTINATION_ATTEMPTS:
+                    update_upload_stats(task_id, {"status": "retrying", "error": str(e)}, label)
+                    await asyncio.sleep(get_retry_delay(TRANSIENT, attempt))
+                else:
+                    update_upload_stats(task_id, {"status": "failed", "error": str(e)}, label)
+                    return f"{label}: {e}"
+
+    append_log(upload_log_file, f"Uploading to {len(destinations)} destinations: {', '.join(d['label'] for d in destinations)}\n")
+    errors = [e for e in await asyncio.gather(*(upload_one(d) for d in destinations)) if e]
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(destinations)} destination(s) failed: " + "; ".join(errors))
+
+
+async def upload_to_subscribers(task_id: str, archive_paths: list, status_file: Path):
+    """
+    Hands a finished download to the tasks that attached to this job (see job_dedup).
+    Subscribers with the primary's destination just share its result; the others get
+    their own upload of the same archives (or of the primary's download directory).
+    """
+    subscribers = inflight_jobs.close(task_id)
+    if not subscribers:
+        return
+    primary_destination = inflight_jobs.destination(task_id)
+    with open(get_task_status_path(task_id), "r") as f:
+        primary_status = json.load(f)
+    append_log(status_file, f"\nDelivering download to {len(subscribers)} attached task(s)...\n")
+
+    for subscriber in subscribers:
+        if not get_task_status_path(subscriber.task_id).exists():
+            # Deleted while waiting
+            continue
+        sub_status_file = STATUS_DIR / f"{subscriber.task_id}.log"
+        sub_upload_log = STATUS_DIR / f"{subscriber.task_id}_upload.log"
+        open_task_log(sub_status_file).write(f"Download shared from job {task_id}.\n")
+        if subscriber.destination == primary_destination:
+            append_log(sub_status_file, "Same upload destination as the shared job; nothing more to upload.\n")
+            update_task_status(subscriber.task_id, {
+                "status": "completed",
+                "gofile_link": primary_status.get("gofile_link"),
+                "gofile_links": primary_status.get("gofile_links"),
+                "upload_stats": primary_status.get("upload_stats"),
+            })
+            await close_log(sub_status_file)
+            continue
+
+        update_task_status(subscriber.task_id, {"status": "uploading"})
+        open_task_log(sub_upload_log, truncate=True).write(f"Starting upload for job {subscriber.task_id} to {subscriber.service}\n")
+        try:
+            sub_destinations = parse_destinations(subscriber.service, subscriber.upload_path, subscriber.params)
+            await upload_to_destinations(subscriber.task_id, sub_destinations, subscriber.params, archive_paths, sub_upload_log,
+                                         source_dir=DOWNLOADS_DIR / task_id)
+            update_task_status(subscriber.task_id, {"status": "completed"})
+            append_log(sub_upload_log, "\nUpload completed successfully!\n")
+            append_log(status_file, f"Delivered to task {subscriber.task_id} ({subscriber.service}).\n")
+        except Exception as e:
+            # One subscriber's destination failing must not fail the primary job
+            error_message = f"Upload of shared download failed: {e}"
+            append_log(sub_upload_log, f"\n--- UPLOAD FAILED ---\n{error_message}\n")
+            append_log(status_file, f"Delivery to task {subscriber.task_id} failed: {e}\n")
+            update_task_status(subscriber.task_id, {"status": "failed", "error": error_message})
+        finally:
+            await close_log(sub_status_file)
+            await close_log(sub_upload_log)
+
+
 async def process_download_job(task_id: str, url: str, downloader: str, service: str, upload_path: str, params: dict, enable_compression: bool = True, split_compression: bool = False, split_size: int = 1000, **kwargs):
     """The main background task for a download job."""
+    # Wait for disk space before anything else, so a job that cannot fit holds no slot. The log is
+    # started here, so the wait shows up in it and is kept once the job runs
+    status_file = STATUS_DIR / f"{task_id}.log"
+    open_task_log(status_file, truncate=True)
+    await disk_manager.admit(task_id, generate_archive_name(url), status_file=status_file)
+    try:
+        # Take the per-site slot first, so jobs queued behind a busy site do not hold a global slot
+        await site_budget.acquire(task_id, url, status_file=status_file)
+        await _process_download_job(task_id, url, downloader, service, upload_path, params, enable_compression, split_compression, split_size, **kwargs)
+    finally:
+        await site_budget.release(task_id)
+        await disk_manager.release(task_id)
+        # Tasks still attached here never got the download (the job failed or was cancelled)
+        for subscriber in inflight_jobs.finish(task_id):
+            update_task_status(subscriber.task_id, {"status": "failed", "error": f"Shared job {task_id} did not complete."})
+
+
+async def _process_download_job(task_id: str, url: str, downloader: str, service: str, upload_path: str, params: dict, enable_compression: bool, split_compression: bool, split_size: int, **kwargs):
     async with task_semaphore:
         task_download_dir = DOWNLOADS_DIR / task_id
         archive_name = generate_archive_name(url)
         status_file = STATUS_DIR / f"{task_id}.log"
         upload_log_file = STATUS_DIR / f"{task_id}_upload.log"
         archive_paths = []
-        rclone_config_path = None
+        upload_log_started = False
+        download_transfer = None
+        job_failed = False
         
         # Extract site specific options from kwargs or params
         kemono_posts = kwargs.get("kemono_posts") or params.get("kemono_posts")
@@ -450,9 +909,9 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
                 logger.debug(f"[WORKFLOW] Kemono 模板: {kemono_path_template}")
             
             update_task_status(task_id, {"status": "running", "url": url, "downloader": downloader})
+            destinations = parse_destinations(service, upload_path, params)
             
-            with open(status_file, "w") as f:
-                f.write(f"Starting job {task_id} for URL: {url}\n")
+            open_task_log(status_file).write(f"Starting job {task_id} for URL: {url}\n")
 
             proxy = params.get("proxy")
             if params.get("auto_proxy"):
@@ -467,9 +926,12 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
 
             # Create temporary gallery-dl config for this specific task
             task_gdl_config_path = STATUS_DIR / f"{task_id}_gdl.json"
+            # Per-task download archive: a retried run skips everything already fetched
+            task_gdl_archive_path = STATUS_DIR / f"{task_id}_gdl_archive.sqlite3"
             gdl_config_data = {
                 "extractor": {
                     "base-directory": str(task_download_dir),
+                    "archive": str(task_gdl_archive_path),
                     "directory": ["{user}", "{title}"] if kemono_path_template else ["{service}", "{user}", "{id}"]
                 }
             }
@@ -481,148 +943,215 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
                 logger.debug(f"[WORKFLOW] 代理设置: {proxy if proxy else '无'}")
                 logger.debug(f"[WORKFLOW] 速度限制: {params.get('rate_limit', '无')}")
 
-            # Use kemono-dl if explicitly selected or automatically for specific sites when uncompressed
+            site_lease = site_budget.get_lease(task_id)
+            rate_limit = site_lease.rate_limit(params.get("rate_limit")) if site_lease else params.get("rate_limit")
+            # The global download bandwidth may cut the limit further
+            download_transfer = bandwidth_controller.start(task_id, DOWN, rate_limit)
+            rate_limit = download_transfer.rate_limit()
+
+            # Use the native kemono engine if kemono-dl is selected or automatically for kemono sites when uncompressed
             is_kemono_site = any(domain in url for domain in ["kemono.cr", "kemono.su", "coomer.st", "coomer.su"])
             if downloader == "kemono-dl" or (is_kemono_site and not enable_compression):
                 if debug_enabled:
-                    logger.debug(f"[WORKFLOW] 自动切换到 kemono-dl 引擎处理 {url}")
+                    logger.debug(f"[WORKFLOW] 自动切换到原生 kemono 引擎处理 {url}")
                 
-                cookie_file = None
-                try:
-                    # 1. Prepare Command
-                    cmd = ["python3", "-m", "kemono_dl", "--path", str(task_download_dir), url]
-                    
-                    # Hierarchical structure as requested
-                    cmd.extend(["--output", "{service}/{creator_name}/{post_title}/{filename}"])
-
-                    # Get cookies from params or DB
-                    cookies_str = params.get("cookies")
-                    kemono_user = params.get("kemono_username") or db_config.get_config("WDM_KEMONO_USERNAME")
-                    kemono_pass = params.get("kemono_password") or db_config.get_config("WDM_KEMONO_PASSWORD")
-
-                    if cookies_str:
-                        cookie_file = create_netscape_cookies(cookies_str)
-                        cmd.extend(["--cookies", cookie_file])
-                    elif kemono_user and kemono_pass:
-                        cmd.extend(["--kemono-login", kemono_user, kemono_pass])
-
-                    with open(status_file, "a") as f:
-                        f.write(f"Starting kemono-dl for {url}...\n")
-
-                    # 2. Execute process
-                    process = await asyncio.create_subprocess_exec(
-                        *cmd,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.STDOUT
+                # Get cookies from params or DB
+                cookies_str = params.get("cookies")
+                kemono_user = params.get("kemono_username") or db_config.get_config("WDM_KEMONO_USERNAME")
+                kemono_pass = params.get("kemono_password") or db_config.get_config("WDM_KEMONO_PASSWORD")
+
+                append_log(status_file, f"Starting native kemono downloader for {url}...\n")
+                progress = DownloadProgress(task_id)
+                download_transfer.progress = progress
+                disk_manager.track(task_id, progress)
+
+                # A second pass resumes .part files and skips everything that already matches its hash
+                for kemono_pass_number in range(1, KEMONO_PASSES + 1):
+                    engine = KemonoEngine(
+                        task_id, url, task_download_dir, status_file, progress=progress,
+                        cookies=cookies_str,
+                        username=None if cookies_str else kemono_user,
+                        password=None if cookies_str else kemono_pass,
+                        proxy=proxy, rate_limit=rate_limit
                     )
-
-                    while True:
-                        line = await process.stdout.readline()
-                        if not line: break
-                        decoded_line = line.decode('utf-8', errors='ignore')
-                        with open(status_file, "a") as f: f.write(decoded_line)
-                        if "Downloading" in decoded_line:
-                            update_task_status(task_id, {"progress_count": "Downloading..."})
-
-                    await process.wait()
-                    if process.returncode != 0:
-                        raise Exception(f"kemono-dl exited with code {process.returncode}")
-
-                    with open(status_file, "a") as f:
-                        f.write("\nDownload complete. Starting upload...\n")
-
-                    # 3. Upload
-                    update_task_status(task_id, {"status": "uploading"})
-                    await upload_uncompressed(task_id, service, upload_path, params, upload_log_file)
-                    update_task_status(task_id, {"status": "completed"})
-                    return # Task finished successfully
-                    
-                finally:
-                    if cookie_file and os.path.exists(cookie_file):
-                        os.unlink(cookie_file)
+                    failed_files = await engine.run()
+                    if not failed_files:
+                        break
+                    append_log(status_file, f"\n{failed_files} file(s) failed in pass {kemono_pass_number}/{KEMONO_PASSES}.\n")
+                progress.publish(force=True)
+                if failed_files:
+                    raise Exception(f"{failed_files} kemono file(s) could not be downloaded")
+                bandwidth_controller.finish(download_transfer)
+                await site_budget.release(task_id)
+
+                append_log(status_file, "\nDownload complete. Starting upload...\n")
+
+                # Upload
+                update_task_status(task_id, {"status": "uploading"})
+                await upload_to_destinations(task_id, destinations, params, [], upload_log_file)
+                update_task_status(task_id, {"status": "completed"})
+                await upload_to_subscribers(task_id, [], status_file)
+                return # Task finished successfully
 
             if downloader == "megadl":
                 command = f"megadl --path {task_download_dir}"
-                if params.get("rate_limit"):
+                if rate_limit:
                     # Convert rate limit string to integer for megadl
-                    rate_limit = params['rate_limit'].strip().upper()
+                    rate_limit_upper = rate_limit.strip().upper()
                     try:
-                        if rate_limit.endswith('K'):
-                            bytes_per_second = int(float(rate_limit[:-1]) * 1000)
-                        elif rate_limit.endswith('M'):
-                            bytes_per_second = int(float(rate_limit[:-1]) * 1000000)
-                        elif rate_limit.endswith('G'):
-                            bytes_per_second = int(float(rate_limit[:-1]) * 1000000000)
+                        if rate_limit_upper.endswith('K'):
+                            bytes_per_second = int(float(rate_limit_upper[:-1]) * 1000)
+                        elif rate_limit_upper.endswith('M'):
+                            bytes_per_second = int(float(rate_limit_upper[:-1]) * 1000000)
+                        elif rate_limit_upper.endswith('G'):
+                            bytes_per_second = int(float(rate_limit_upper[:-1]) * 1000000000)
                         else:
-                            bytes_per_second = int(float(rate_limit))
+                            bytes_per_second = int(float(rate_limit_upper))
                         command += f" --limit-speed {bytes_per_second}"
                     except ValueError:
                         # If conversion fails, use original value (will likely fail but preserve error)
-                        command += f" --limit-speed {params['rate_limit']}"
+                        command += f" --limit-speed {rate_limit}"
                 command += f" {url}"
                 command_log = command
+            elif downloader == "http":
+                # Direct file URL, fetched in-process (segmented for large files)
+                command = None
+                command_log = f"HTTP download {url}"
+                if proxy:
+                    command_log += f" via proxy {proxy}"
             else:
-                # Use the temporary config file
-                command = f"gallery-dl --verbose -c \"{task_gdl_config_path}\""
-                
-                # Site Specific Options
+                # Site specific options as gallery-dl config paths, shared by both engines
+                gdl_options = {}
                 if kemono_posts:
-                    command += f" -o extractor.kemono.posts={kemono_posts}"
+                    gdl_options["extractor.kemono.posts"] = kemono_posts
                 if kemono_revisions:
-                    command += " -o extractor.kemono.revisions=true"
+                    gdl_options["extractor.kemono.revisions"] = True
                 
                 if pixiv_ugoira is False:
-                    command += " -o extractor.pixiv.ugoira=false"
+                    gdl_options["extractor.pixiv.ugoira"] = False
                 if twitter_retweets:
-                    command += " -o extractor.twitter.retweets=true"
+                    gdl_options["extractor.twitter.retweets"] = True
                 if twitter_replies:
-                    command += " -o extractor.twitter.replies=true"
+                    gdl_options["extractor.twitter.replies"] = True
 
                 # Add Kemono credentials if configured
                 kemono_user = db_config.get_config("WDM_KEMONO_USERNAME")
                 kemono_pass = db_config.get_config("WDM_KEMONO_PASSWORD")
                 if kemono_user and kemono_pass:
-                    command += f" -o extractor.kemono.username={kemono_user} -o extractor.kemono.password={kemono_pass}"
+                    gdl_options["extractor.kemono.username"] = kemono_user
+                    gdl_options["extractor.kemono.password"] = kemono_pass
 
-                # Add custom arguments from database
-                extra_args = db_config.get_config("WDM_GALLERY_DL_ARGS", "")
-                if extra_args:
-                    command += f" {extra_args}"
-                    
                 if params.get("deviantart_client_id") and params.get("deviantart_client_secret"):
-                    command += f" -o extractor.deviantart.client-id={params['deviantart_client_id']} -o extractor.deviantart.client-secret={params['deviantart_client_secret']}"
-                if proxy:
-                    command += f" --proxy {proxy}"
-                    if params.get("rate_limit"):
-                        command += f" --limit-rate {params['rate_limit']}"
-                command += f" {url}"
+                    gdl_options["extractor.deviantart.client-id"] = params["deviantart_client_id"]
+                    gdl_options["extractor.deviantart.client-secret"] = params["deviantart_client_secret"]
 
-                command_log = f"gallery-dl --verbose -c \"{task_gdl_config_path}\""
-                if proxy:
-                    command_log += f" --proxy {proxy}"
-                command_log += f" {url}"
+                # Custom arguments from database
+                extra_args = db_config.get_config("WDM_GALLERY_DL_ARGS", "")
+
+                if use_inprocess_engine():
+                    # Config is handed to a warm worker directly; no CLI, no per-job interpreter start-up
+                    command = None
+                    gdl_job_config = json.loads(json.dumps(gdl_config_data))
+                    for key, value in gdl_options.items():
+                        node = gdl_job_config
+                        *parents, leaf = key.split(".")
+                        for part in parents:
+                            node = node.setdefault(part, {})
+                        node[leaf] = value
+                    if proxy:
+                        gdl_job_config["extractor"]["proxy"] = proxy
+                    if rate_limit:
+                        gdl_job_config.setdefault("downloader", {})["rate"] = rate_limit
+                    merge_config(gdl_job_config, parse_extra_options(extra_args, status_file))
+                    command_log = f"gallery-dl (in-process engine) {url}"
+                    if proxy:
+                        command_log += f" via proxy {proxy}"
+                else:
+                    # Use the temporary config file
+                    command = f"gallery-dl --verbose -c \"{task_gdl_config_path}\""
+                    for key, value in gdl_options.items():
+                        if isinstance(value, bool):
+                            value = "true" if value else "false"
+                        command += f" -o {key}={value}"
+                    if extra_args:
+                        command += f" {extra_args}"
+                    if proxy:
+                        command += f" --proxy {proxy}"
+                    if rate_limit:
+                        command += f" --limit-rate {rate_limit}"
+                    command += f" {url}"
+
+                    command_log = f"gallery-dl --verbose -c \"{task_gdl_config_path}\""
+                    if proxy:
+                        command_log += f" --proxy {proxy}"
+                    command_log += f" {url}"
             
             if debug_enabled:
                 logger.debug(f"[WORKFLOW] 执行下载命令: {command_log}")
             
             update_task_status(task_id, {"command": command_log})
-            await run_command(command, command_log, status_file, task_id)
+            download_progress = None
+            if downloader == "http":
+                download_progress = DownloadProgress(task_id)
+                download_transfer.progress = download_progress
+            elif downloader != "megadl":
+                download_progress = DownloadProgress(task_id, make_gallery_dl_parser(task_download_dir))
+                download_transfer.progress = download_progress
+            disk_manager.track(task_id, download_progress)
+            try:
+                if downloader == "http":
+                    await run_direct_download(task_id, url, task_download_dir, status_file, progress=download_progress,
+                                              proxy=proxy, rate_limit=rate_limit)
+                elif command is None:
+                    await run_gallery_dl_inprocess(url, gdl_job_config, status_file, task_id, progress=download_progress)
+                else:
+                    await run_command(command, command_log, status_file, task_id, progress=download_progress)
+            except Exception:
+                if proxy and params.get("auto_proxy"):
+                    proxy_pool.record(proxy, False)
+                raise
+            bandwidth_controller.finish(download_transfer)
+            if proxy and params.get("auto_proxy"):
+                # Feed real job outcomes back into the pool's scores
+                proxy_pool.record(proxy, True)
+            # Downloading is done; let the next job for this site start
+            await site_budget.release(task_id)
+            # One walk of the finished download, reused for counting, split planning, uploads and cleanup
+            manifest = await asyncio.to_thread(scan_manifest, task_download_dir)
+            update_task_status(task_id, {"manifest": manifest.summary()})
+            # The download is on disk now; only archives (if any) are still to be written
+            disk_manager.expect(task_id, 0)
 
             if not enable_compression:
                 if debug_enabled:
                     logger.debug(f"[WORKFLOW] 跳过压缩，直接上传")
                 update_task_status(task_id, {"status": "uploading"})
-                with open(upload_log_file, "w") as f:
-                    f.write(f"Starting uncompressed upload for job {task_id}\n")
-                await upload_uncompressed(task_id, service, upload_path, params, upload_log_file)
+                open_task_log(upload_log_file, truncate=True).write(f"Starting uncompressed upload for job {task_id}\n")
+                upload_log_started = True
+                await upload_to_destinations(task_id, destinations, params, [], upload_log_file)
+                update_task_status(task_id, {"status": "completed"})
+                append_log(status_file, "\nJob completed successfully (compression disabled).\n")
+                append_log(upload_log_file, "\nUpload completed successfully.\n")
+                await upload_to_subscribers(task_id, [], status_file)
+                return
+
+            if (not split_compression and len(destinations) == 1 and use_stream_upload(params)
+                    and inflight_jobs.close_if_idle(task_id)):
+                # Compress and upload in one pass; nothing is written to ARCHIVES_DIR
+                if debug_enabled:
+                    logger.debug(f"[WORKFLOW] 流式压缩上传到 {service}")
+                update_task_status(task_id, {"status": "uploading"})
+                open_task_log(upload_log_file, truncate=True).write(f"Starting streamed upload for job {task_id} to {service}\n")
+                upload_log_started = True
+                await upload_archive_stream(task_id, service, upload_path, params, task_download_dir, f"{archive_name}.tar.zst", upload_log_file)
                 update_task_status(task_id, {"status": "completed"})
-                with open(status_file, "a") as f:
-                    f.write("\nJob completed successfully (compression disabled).\n")
-                with open(upload_log_file, "a") as f:
-                    f.write("\nUpload completed successfully.\n")
+                append_log(status_file, "\nJob completed successfully (streamed upload).\n")
+                append_log(upload_log_file, "\nUpload completed successfully!\n")
                 return
 
             update_task_status(task_id, {"status": "compressing"})
+            # Archives take at most about as much space as the files going into them
+            disk_manager.expect(task_id, manifest.size)
             
             if debug_enabled:
                 logger.debug(f"[WORKFLOW] 开始压缩文件")
@@ -635,9 +1164,17 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
             else:
                 task_archive_path = ARCHIVES_DIR / f"{archive_name}.tar.zst"
                 source_to_compress = task_download_dir
-                compress_cmd = f"tar -cf - -C \"{source_to_compress}\" . | zstd -o \"{task_archive_path}\""
-                await run_command(compress_cmd, compress_cmd, status_file, task_id)
-                archive_paths = [task_archive_path]
+                if use_python_builder():
+                    append_log(status_file, f"\nBuilding {task_archive_path.name} with the Python archive builder...\n")
+                    # Listed as it is written, so the finally block cleans up a half-built archive too
+                    archive_paths = [task_archive_path, index_path_for(task_archive_path)]
+                    manifest = await asyncio.to_thread(get_manifest, source_to_compress)
+                    result = await build_archive_async(source_to_compress, manifest.paths(), task_archive_path)
+                    append_log(status_file, f"Built {task_archive_path.name}: {result['members']} files, {result['size']} bytes\n")
+                else:
+                    compress_cmd = f"tar -cf - -C \"{source_to_compress}\" . | zstd -o \"{task_archive_path}\""
+                    await run_command(compress_cmd, compress_cmd, status_file, task_id)
+                    archive_paths = [task_archive_path]
 
             if debug_enabled:
                 logger.debug(f"[WORKFLOW] 压缩完成，生成 {len(archive_paths)} 个文件")
@@ -648,191 +1185,51 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
             if debug_enabled:
                 logger.debug(f"[WORKFLOW] 开始上传到 {service}")
             
-            with open(upload_log_file, "w") as f:
-                f.write(f"Starting upload for job {task_id} to {service}\n")
-
-            # Initialize upload stats
-            total_upload_files = len(archive_paths)
-            update_task_status(task_id, {
-                "upload_stats": {
-                    "total_files": total_upload_files,
-                    "uploaded_files": 0,
-                    "percent": 0
-                }
-            })
+            open_task_log(upload_log_file, truncate=True).write(f"Starting upload for job {task_id} to {service}\n")
+            upload_log_started = True
 
-            uploaded_count = 0
-            for archive_path in archive_paths:
-                if service == "gofile":
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] 使用 gofile.io 上传: {archive_path}")
-                    gofile_token = params.get("gofile_token") or db_config.get_config("WDM_GOFILE_TOKEN")
-                    gofile_folder_id = params.get("gofile_folder_id") or db_config.get_config("WDM_GOFILE_FOLDER_ID")
-                    if gofile_token and not gofile_folder_id:
-                        gofile_folder_id = "ad957716-3899-498a-bebc-716f616f9b16"
-                    download_link = await upload_to_gofile(archive_path, upload_log_file, api_token=gofile_token, folder_id=gofile_folder_id)
-                    
-                    uploaded_count += 1
-                    percent = int((uploaded_count / total_upload_files) * 100)
-                    update_task_status(task_id, {
-                        "status": "completed" if uploaded_count == total_upload_files else "uploading",
-                        "gofile_link": download_link,
-                        "upload_stats": {
-                            "total_files": total_upload_files,
-                            "uploaded_files": uploaded_count,
-                            "percent": percent
-                        }
-                    })
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] gofile.io 上传完成，链接: {download_link}")
+            await upload_to_destinations(task_id, destinations, params, archive_paths, upload_log_file)
+            update_task_status(task_id, {"status": "completed"})
+            await upload_to_subscribers(task_id, archive_paths, status_file)
 
-                
-
-                elif service == "openlist":
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] 使用 Openlist 上传: {archive_path}")
-                    openlist_url = params.get("openlist_url") or db_config.get_config("WDM_OPENLIST_URL")
-                    openlist_user = params.get("openlist_user") or db_config.get_config("WDM_OPENLIST_USER")
-                    openlist_pass = params.get("openlist_pass") or db_config.get_config("WDM_OPENLIST_PASS")
-                    if not all([openlist_url, openlist_user, openlist_pass, upload_path]):
-                        raise openlist.OpenlistError("Openlist URL, username, password, and remote path are all required.")
-                    with open(upload_log_file, "a") as f: f.write(f"\n--- Starting Openlist Upload ---\n")
-                    token = await asyncio.to_thread(openlist.login, openlist_url, openlist_user, openlist_pass, upload_log_file)
-                    await asyncio.to_thread(openlist.create_directory, openlist_url, token, upload_path, upload_log_file)
-                    
-                    # Initialize tracking variables for archives
-                    total_archives_size = sum(p.stat().st_size for p in archive_paths)
-                    total_uploaded_archives_size = 0
-                    last_update_time = 0
-                    
-                    def format_size(size):
-                        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-                            if size < 1024.0:
-                                return f"{size:.2f} {unit}"
-                            size /= 1024.0
-                        return f"{size:.2f} PB"
-
-                    # Single archive upload in openlist (could be multiple if split)
-                    current_archive_size = archive_path.stat().st_size
-                    
-                    def progress_handler(current, total):
-                        nonlocal last_update_time
-                        now = time.time()
-                        if now - last_update_time < 0.5 and current < total:
-                            return
-                        last_update_time = now
-                        
-                        # Total progress (considering previously uploaded archives in the loop)
-                        # Note: uploaded_count is updated AFTER the file is done in the loop
-                        # So current_total includes size of already uploaded files + current progress
-                        
-                        # We need to calculate size of *previous* archives in this loop
-                        # The loop iterates 'archive_paths'. We can use 'uploaded_count' as index if we are careful,
-                        # but simpler to just track accumulated size.
-                        
-                        # Actually, 'uploaded_count' is incremented at the end of loop.
-                        # So 'total_uploaded_archives_size' tracks completed files.
-                        
-                        current_total_uploaded = total_uploaded_archives_size + current
-                        total_percent = int((current_total_uploaded / total_archives_size) * 100) if total_archives_size > 0 else 0
-                        file_percent = int((current / total) * 100) if total > 0 else 0
-                        
-                        update_task_status(task_id, {
-                            "upload_stats": {
-                                "total_files": total_upload_files,
-                                "uploaded_files": uploaded_count,
-                                "percent": total_percent,
-                                "file_percent": file_percent,
-                                "current_file": archive_path.name,
-                                "transferred": format_size(current_total_uploaded),
-                                "total": format_size(total_archives_size)
-                            }
-                        })
-
-                    await asyncio.to_thread(openlist.upload_file, openlist_url, token, archive_path, upload_path, upload_log_file, progress_handler)
-                    
-                    total_uploaded_archives_size += current_archive_size
-                    
-                    uploaded_count += 1
-                    percent = int((uploaded_count / total_upload_files) * 100)
-                    update_task_status(task_id, {
-                        "upload_stats": {
-                            "total_files": total_upload_files,
-                            "uploaded_files": uploaded_count,
-                            "percent": percent
-                        }
-                    })
-                    
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] Openlist 上传完成")
-                else:
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] 使用 rclone 上传到 {service}: {archive_path}")
-                    rclone_config_path = create_rclone_config(task_id, service, params)
-                    if not rclone_config_path:
-                        raise RuntimeError(f"Failed to create rclone configuration for {service}. Please check your settings in the Settings page.")
-                    
-                    remote_full_path = f"remote:{upload_path}"
-                    upload_cmd = (
-                        f"rclone copyto --config \"{rclone_config_path}\" \"{archive_path}\" \"{remote_full_path}/{archive_path.name}\" "
-                        f"-P --stats 1s --log-level=INFO --retries 5"
-                    )
-                    if params.get("upload_rate_limit"):
-                        upload_cmd += f" --bwlimit {params['upload_rate_limit']}"
-                    await run_command(upload_cmd, upload_cmd, upload_log_file, task_id)
-                    
-                    uploaded_count += 1
-                    percent = int((uploaded_count / total_upload_files) * 100)
-                    update_task_status(task_id, {
-                        "upload_stats": {
-                            "total_files": total_upload_files,
-                            "uploaded_files": uploaded_count,
-                            "percent": percent
-                        }
-                    })
-                    
-                    if debug_enabled:
-                        logger.debug(f"[WORKFLOW] rclone 上传完成")
-
-
-            with open(status_file, "a") as f:
-                f.write("\nJob completed successfully!\n")
-            with open(upload_log_file, "a") as f:
-                f.write("\nUpload completed successfully!\n")
+            append_log(status_file, "\nJob completed successfully!\n")
+            append_log(upload_log_file, "\nUpload completed successfully!\n")
 
         except Exception as e:
+            job_failed = True
             error_message = f"An error occurred: {str(e)}"
-            with open(status_file, "a") as f:
-                f.write(f"\n--- JOB FAILED ---\n{error_message}\n")
+            append_log(status_file, f"\n--- JOB FAILED ---\n{error_message}\n")
             # Also write to upload log if it fails during upload
-            if os.path.exists(upload_log_file):
-                 with open(upload_log_file, "a") as f:
-                    f.write(f"\n--- UPLOAD FAILED ---\n{error_message}\n")
+            if upload_log_started or os.path.exists(upload_log_file):
+                append_log(upload_log_file, f"\n--- UPLOAD FAILED ---\n{error_message}\n")
             update_task_status(task_id, {"status": "failed", "error": error_message})
         finally:
+            if download_transfer:
+                bandwidth_controller.finish(download_transfer)
             # --- MEMORY LEAK FIX ---
             if debug_enabled:
                 logger.debug(f"[WORKFLOW] 开始清理任务资源")
             
-            with open(status_file, "a") as f:
-                f.write("\n--- Cleaning up task resources... ---\n")
+            append_log(status_file, "\n--- Cleaning up task resources... ---\n")
             
-            # [VERIFICATION] PRESERVING FILES FOR PROOF
-            verify_dir = Path("/root/web-dl-manager/TEST_VERIFY") / task_id
-            verify_dir.mkdir(parents=True, exist_ok=True)
+            # 0. Keep what the retention policy asks for (hardlinks, no copies) before deleting
             if os.path.exists(task_download_dir):
-                for item in task_download_dir.rglob("*"):
-                    if item.is_file():
-                        target = verify_dir / item.relative_to(task_download_dir)
-                        target.parent.mkdir(parents=True, exist_ok=True)
-                        shutil.copy2(item, target)
+                try:
+                    manifest = await asyncio.to_thread(get_manifest, task_download_dir)
+                    retained = await asyncio.to_thread(retain_download, task_id, task_download_dir, manifest, job_failed)
+                    if retained:
+                        update_task_status(task_id, {"retained": retained})
+                        append_log(status_file, f"Retained download ({retained['policy']}) until {time.ctime(retained['expires_at'])}: {retained['path']}\n")
+                except Exception as e:
+                    append_log(status_file, f"Could not retain download: {e}\n")
 
             # 1. Remove downloaded files
             if os.path.exists(task_download_dir):
                 if debug_enabled:
                     logger.debug(f"[WORKFLOW] 删除下载目录: {task_download_dir}")
                 shutil.rmtree(task_download_dir)
-                with open(status_file, "a") as f: f.write(f"Removed directory: {task_download_dir}\n")
+                append_log(status_file, f"Removed directory: {task_download_dir}\n")
+            forget_manifest(task_download_dir)
 
             # 2. Remove created archives
             for archive_path in archive_paths:
@@ -840,23 +1237,20 @@ async def process_download_job(task_id: str, url: str, downloader: str, service:
                     if debug_enabled:
                         logger.debug(f"[WORKFLOW] 删除压缩文件: {archive_path}")
                     os.remove(archive_path)
-                    with open(status_file, "a") as f: f.write(f"Removed archive: {archive_path}\n")
-
-            # 3. Remove temporary rclone config
-            if rclone_config_path and os.path.exists(rclone_config_path):
-                if debug_enabled:
-                    logger.debug(f"[WORKFLOW] 删除 rclone 配置: {rclone_config_path}")
-                os.remove(rclone_config_path)
-                with open(status_file, "a") as f: f.write(f"Removed rclone config: {rclone_config_path}\n")
+                    append_log(status_file, f"Removed archive: {archive_path}\n")
 
-            # 4. Remove temporary gallery-dl config
+            # 3. Remove temporary gallery-dl config
             if 'task_gdl_config_path' in locals() and os.path.exists(task_gdl_config_path):
                 if debug_enabled:
                     logger.debug(f"[WORKFLOW] 删除 gallery-dl 配置: {task_gdl_config_path}")
                 os.remove(task_gdl_config_path)
-                with open(status_file, "a") as f: f.write(f"Removed gallery-dl config: {task_gdl_config_path}\n")
+                append_log(status_file, f"Removed gallery-dl config: {task_gdl_config_path}\n")
+            if 'task_gdl_archive_path' in locals() and os.path.exists(task_gdl_archive_path):
+                os.remove(task_gdl_archive_path)
             
-            with open(status_file, "a") as f: f.write("Cleanup complete.\n")
+            append_log(status_file, "Cleanup complete.\n")
+            await close_log(status_file)
+            await close_log(upload_log_file)
             
             if debug_enabled:
                 logger.debug(f"[WORKFLOW] 任务 {task_id} 清理完成")
@@ -16,6 +16,9 @@ BRANCH = "main"
 VERSION_INFO_FILE = PROJECT_ROOT / ".version_info"
 CHANGELOG_FILE = PROJECT_ROOT / "CHANGELOG.md"
 REQUIREMENTS_FILE = PROJECT_ROOT / "app" / "requirements.txt"
+# Subprocess time limits (seconds); these run in worker threads that cannot be cancelled otherwise
+GIT_TIMEOUT = 10
+PIP_TIMEOUT = 600
 
 import re
 
@@ -83,7 +86,8 @@ def get_local_commit_sha() -> str | None:
             capture_output=True,
             text=True,
             check=False,
-            cwd=PROJECT_ROOT
+            cwd=PROJECT_ROOT,
+            timeout=GIT_TIMEOUT
         )
         if result.returncode == 0 and result.stdout.strip():
             return result.stdout.strip()
@@ -209,13 +213,13 @@ def update_dependencies() -> dict:
         # Update pip first
         log("Upgrading pip...")
         subprocess.run([sys.executable, "-m", "pip", "install", "--upgrade", "pip"], 
-                      check=False, capture_output=True, text=True)
+                      check=False, capture_output=True, text=True, timeout=PIP_TIMEOUT)
         
         # Install/upgrade dependencies
         log("Installing/upgrading dependencies...")
         result = subprocess.run(
             [sys.executable, "-m", "pip", "install", "-r", str(REQUIREMENTS_FILE)],
-            check=False, capture_output=True, text=True
+            check=False, capture_output=True, text=True, timeout=PIP_TIMEOUT
         )
         
         if result.returncode == 0:
@@ -440,7 +444,8 @@ def run_update():
                     capture_output=True,
                     text=True,
                     cwd=PROJECT_ROOT,
-                    check=True
+                    check=True,
+                    timeout=GIT_TIMEOUT
                 ).stdout.strip()
                 
                 log(f"Updated to version: {new_local_sha[:7]}")
@@ -450,7 +455,7 @@ def run_update():
                 
                 # Update dependencies
                 log("Updating dependencies...")
-                subprocess.run([sys.executable, "-m", "pip", "install", "-r", str(REQUIREMENTS_FILE)], check=True)
+                subprocess.run([sys.executable, "-m", "pip", "install", "-r", str(REQUIREMENTS_FILE)], check=True, timeout=PIP_TIMEOUT)
                 log("Dependencies updated.")
                 
                 # Update changelog
@@ -460,9 +465,9 @@ def run_update():
                 log(f"Successfully updated to version {new_local_sha[:7]} via git pull.")
                 return {"status": "success", "message": f"Update to version {new_local_sha[:7]} successful. Restarting...", "updated": True}
                 
-            except subprocess.TimeoutExpired:
-                log("Git pull timed out.")
-                raise Exception("Git pull timed out after 5 minutes.")
+            except subprocess.TimeoutExpired as e:
+                log(f"Update step timed out: {e.cmd}")
+                raise Exception(f"Update step timed out after {e.timeout} seconds.")
             except Exception as git_error:
                 log(f"Git pull failed, falling back to raw file download: {git_error}")
                 # Fall through to raw file download
@@ -505,7 +510,7 @@ def run_update():
         log("File download complete.")
         
         log("Updating dependencies...")
-        subprocess.run([sys.executable, "-m", "pip", "install", "-r", str(REQUIREMENTS_FILE)], check=True)
+        subprocess.run([sys.executable, "-m", "pip", "install", "-r", str(REQUIREMENTS_FILE)], check=True, timeout=PIP_TIMEOUT)
         log("Dependencies updated.")
 
         log("Updating changelog...")
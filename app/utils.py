@@ -1,24 +1,28 @@
 import os
 import json
-import random
-import httpx
 import subprocess
 import asyncio
 import base64
 import tempfile
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any
 from fastapi import Request
 
 from . import openlist
 from .database import db_config
 from .config import STATUS_DIR, CONFIG_BACKUP_RCLONE_BASE64, CONFIG_BACKUP_REMOTE_PATH, GALLERY_DL_CONFIG_DIR
+from .task_log import append_log, flush_task_logs_soon
+from .proxy_pool import proxy_pool
+from .manifest import get_manifest
 
 logger = logging.getLogger(__name__) 
 
 import time
+import functools
+import threading
 import psutil
+from concurrent.futures import ThreadPoolExecutor
 
 # Cache for network speed calculation
 _net_io_cache = {"last_time": time.time(), "last_recv": psutil.net_io_counters().bytes_recv, "last_sent": psutil.net_io_counters().bytes_sent}
@@ -45,165 +49,131 @@ def get_net_speed():
     return max(0, recv_speed), max(0, sent_speed)
 
 def count_files_in_dir(directory: Path) -> Dict[str, Any]:
-    """Counts files and total size in a directory or single file."""
-    count = 0
-    total_size = 0
-    
+    """Counts files and total size in a directory or single file (from the download's manifest if it has one)."""
     if not directory.exists():
         return {"count": 0, "size": 0}
         
     if directory.is_file():
         return {"count": 1, "size": directory.stat().st_size}
-        
-    for item in directory.rglob("*"):
-        if item.is_file():
-            count += 1
-            total_size += item.stat().st_size
-    return {"count": count, "size": total_size}
 
-# --- Helper Functions ---
+    manifest = get_manifest(directory)
+    return {"count": manifest.count, "size": manifest.size}
 
-def get_task_status_path(task_id: str) -> Path:
-    """Returns the path to the JSON status file for a given task."""
-    return STATUS_DIR / f"{task_id}.json"
+# --- Background Execution ---
 
-def update_task_status(task_id: str, updates: Dict[str, Any]):
-    """Updates the JSON status file for a given task."""
-    status_path = get_task_status_path(task_id)
-    status_data = {}
-    if status_path.exists():
-        with open(status_path, "r") as f:
-            try:
-                status_data = json.load(f)
-            except json.JSONDecodeError:
-                pass  # Overwrite if file is corrupted
-    
-    status_data.update(updates)
-    
-    with open(status_path, "w") as f:
-        json.dump(status_data, f, indent=4)
-
-async def get_working_proxy(status_file: Path) -> str:
-    """Fetches a list of HTTP proxies, tests them concurrently, and returns a working one."""
-    proxy_list_url = "https://raw.githubusercontent.com/TheSpeedX/PROXY-List/master/http.txt"
-    with open(status_file, "a") as f:
-        f.write("Fetching proxy list...\n")
-    async with httpx.AsyncClient() as client:
-        response = await client.get(proxy_list_url)
-        response.raise_for_status()
-        proxies = response.text.splitlines()
-
-    async def test_proxy(proxy):
-        try:
-            async with httpx.AsyncClient(proxies=f"http://{proxy}", timeout=5) as client:
-                response = await client.get("https://www.google.com", timeout=5)
-                response.raise_for_status()
-                return proxy
-        except Exception:
-            return None
-
-    i = 0
-    while True:
-        i += 1
-        shuffled_proxies = random.sample(proxies, min(len(proxies), 3000))
-        with open(status_file, "a") as f:
-            f.write(f"Attempt {i}: Concurrently testing {len(shuffled_proxies)} proxies...\n")
-
-        tasks = [test_proxy(p) for p in shuffled_proxies]
-        for future in asyncio.as_completed(tasks):
-            result = await future
-            if result:
-                with open(status_file, "a") as f:
-                    f.write(f"Found working proxy: {result}\n")
-                return result
-        
-        with open(status_file, "a") as f:
-            f.write(f"No working proxy found in attempt {i}. Retrying with a new batch...\n")
+# Shared pool for blocking work (pip, git, sync httpx) triggered from async request handlers
+_blocking_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="wdm-blocking")
+# In-flight calls keyed by operation name, so concurrent callers share a single result
+_inflight_calls: Dict[str, asyncio.Future] = {}
 
-async def upload_to_gofile(file_path: Path, status_file: Path, api_token: Optional[str] = None, folder_id: Optional[str] = None) -> str:
+async def single_flight(key: str, factory, timeout: Optional[float] = None):
     """
-    Uploads a file to gofile.io, using the correct server-specific endpoint for both authenticated and public uploads.
+    Runs the awaitable produced by factory() once per key; concurrent callers with the same key
+    await the same in-flight result. A caller timing out does not cancel the shared operation.
     """
+    future = _inflight_calls.get(key)
+    if future is None:
+        future = asyncio.ensure_future(factory())
+        _inflight_calls[key] = future
+
+        def _forget(done, key=key):
+            if _inflight_calls.get(key) is done:
+                _inflight_calls.pop(key, None)
+        future.add_done_callback(_forget)
+
+    return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+async def run_blocking(key: str, func, *args, timeout: Optional[float] = None, **kwargs):
+    """Runs a blocking function in the shared executor with single-flight deduplication and a timeout."""
+    loop = asyncio.get_running_loop()
+    return await single_flight(
+        key,
+        lambda: loop.run_in_executor(_blocking_executor, functools.partial(func, *args, **kwargs)),
+        timeout=timeout
+    )
 
-    async def _attempt_upload(use_token: bool, servers: List[Dict]):
-        """Internal helper to attempt an upload by iterating through available servers."""
-        upload_type = "authenticated" if use_token and api_token else "public"
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write(f"Attempting {upload_type} upload...\n")
-
-        for server in servers:
-            server_name = server["name"]
-            upload_url = f"https://{server_name}.gofile.io/uploadFile"
-            
-            with open(status_file, "a", encoding="utf-8") as f:
-                f.write(f"Trying {upload_type} upload via server: {server_name}...\n")
-
-            try:
-                async with httpx.AsyncClient(timeout=300) as client:
-                    form_data = {}
-                    if use_token and api_token:
-                        form_data['token'] = api_token
-                        if folder_id:
-                            form_data['folderId'] = folder_id
-                    
-                    with open(file_path, "rb") as f_upload:
-                        files = {'file': (file_path.name, f_upload, "application/octet-stream")}
-                        response = await client.post(upload_url, data=form_data or None, files=files)
-                    
-                    response.raise_for_status()
-                    upload_result = response.json()
-
-                    if upload_result.get("status") == "ok":
-                        download_link = upload_result["data"]["downloadPage"]
-                        with open(status_file, "a", encoding="utf-8") as f:
-                            f.write(f"Gofile.io {upload_type} upload successful on server {server_name}! Link: {download_link}\n")
-                        return download_link
-                    else:
-                        with open(status_file, "a", encoding="utf-8") as f:
-                            f.write(f"Gofile API returned an error on {upload_type} upload to {server_name}: {upload_result}. Trying next server...\n")
-                        continue
-            except Exception as e:
-                with open(status_file, "a", encoding="utf-8") as f:
-                    f.write(f"An exception occurred during {upload_type} upload to {server_name}: {e}. Trying next server...\n")
-                continue
-        
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write(f"All Gofile servers failed for {upload_type} upload.\n")
+async def run_subprocess_output(*cmd: str, timeout: float = 10) -> Optional[str]:
+    """Runs a command without blocking the event loop and returns its stdout, or None on failure/timeout."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    except (FileNotFoundError, PermissionError):
         return None
 
-    servers = []
     try:
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write("Fetching Gofile server list...\n")
-        async with httpx.AsyncClient(timeout=60) as client:
-            servers_res = await client.get("https://api.gofile.io/servers")
-            servers_res.raise_for_status()
-            servers_data = servers_res.json()
-            if servers_data.get("status") != "ok":
-                 raise Exception(f"Gofile API did not return 'ok' for server list: {servers_data}")
-            servers = servers_data["data"]["servers"]
-            random.shuffle(servers)
-    except Exception as e:
-        error_message = f"FATAL: Could not fetch Gofile server list: {e}"
-        with open(status_file, "a", encoding="utf-8") as f:
-            f.write(f"{error_message}\n")
-        raise Exception(error_message)
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return None
+
+    if process.returncode != 0:
+        return None
+    return stdout.decode("utf-8", errors="ignore")
 
-    download_link = None
-    if api_token:
-        download_link = await _attempt_upload(use_token=True, servers=servers)
+# --- Helper Functions ---
 
-    if not download_link:
-        if api_token:
-            with open(status_file, "a", encoding="utf-8") as f:
-                f.write("Authenticated upload failed. Falling back to public upload.\n")
-        download_link = await _attempt_upload(use_token=False, servers=servers)
+def get_task_status_path(task_id: str) -> Path:
+    """Returns the path to the JSON status file for a given task."""
+    return STATUS_DIR / f"{task_id}.json"
 
-    if not download_link:
-        raise Exception("Gofile.io upload failed completely after trying all available servers and fallback options.")
+# Status files are read, modified and rewritten from the event loop and from upload threads
+# (progress callbacks); one lock keeps those updates from overwriting each other
+_status_lock = threading.RLock()
 
-    return download_link
+def _read_task_status(status_path: Path) -> Dict[str, Any]:
+    if status_path.exists():
+        with open(status_path, "r") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                pass  # Overwrite if file is corrupted
+    return {}
 
+def update_task_status(task_id: str, updates: Dict[str, Any]):
+    """Updates the JSON status file for a given task."""
+    status_path = get_task_status_path(task_id)
+    with _status_lock:
+        status_data = _read_task_status(status_path)
+        status_data.update(updates)
+        # Written aside and renamed into place, so readers never see a half-written file
+        tmp_path = status_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(status_data, f, indent=4)
+        os.replace(tmp_path, status_path)
+
+    # Status transitions are natural checkpoints for the buffered task logs
+    if "status" in updates:
+        flush_task_logs_soon(task_id)
+
+def update_upload_stats(task_id: str, stats: Dict[str, Any], destination: Optional[str] = None):
+    """
+    Publishes upload progress. Without a destination, stats replace the task's upload_stats.
+    With one (jobs uploading to several destinations at once), they are stored under
+    upload_stats["destinations"][destination] and the top-level figures become the aggregate:
+    the average percent and the fewest files uploaded by any destination.
+    """
+    if destination is None:
+        update_task_status(task_id, {"upload_stats": stats})
+        return
+    with _status_lock:
+        upload_stats = _read_task_status(get_task_status_path(task_id)).get("upload_stats") or {}
+        destinations = upload_stats.get("destinations") or {}
+        destinations[destination] = {**destinations.get(destination, {}), **stats}
+        entries = list(destinations.values())
+        update_task_status(task_id, {"upload_stats": {
+            "total_files": max((d.get("total_files") or 0) for d in entries),
+            "uploaded_files": min((d.get("uploaded_files") or 0) for d in entries),
+            "percent": int(sum((d.get("percent") or 0) for d in entries) / len(entries)),
+            "destinations": destinations,
+        }})
+
+async def get_working_proxy(status_file: Path) -> Optional[str]:
+    """Returns a ranked proxy from the background-checked proxy pool, or None if none is healthy."""
+    return await proxy_pool.get_proxy(status_file)
 
 def create_rclone_config(task_id: str, service: str, params: dict) -> Path:
     """Creates a temporary rclone config file."""
@@ -322,8 +292,7 @@ async def _run_rclone_command(command: str, log_file: Optional[Path] = None):
     """Helper to run an rclone command and log its output."""
     log_message = f"Executing rclone command: {command}\n"
     if log_file:
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(log_message)
+        append_log(log_file, log_message)
     else:
         logger.info(log_message)
 
@@ -340,8 +309,7 @@ async def _run_rclone_command(command: str, log_file: Optional[Path] = None):
     if process.returncode == 0:
         log_message = f"Rclone command finished successfully.\nOutput: {output}\n"
         if log_file:
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(log_message)
+            append_log(log_file, log_message)
         else:
             logger.info(log_message)
     else:
@@ -349,8 +317,7 @@ async def _run_rclone_command(command: str, log_file: Optional[Path] = None):
         # so we log this as INFO, not ERROR, for the restore case.
         log_message = f"Rclone command finished with exit code {process.returncode}.\nError: {error}\n"
         if log_file:
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(log_message)
+            append_log(log_file, log_message)
         else:
             logger.info(log_message)
     
@@ -420,32 +387,3 @@ async def backup_gallery_dl_config():
     finally:
         if os.path.exists(tmp_config_path):
             os.unlink(tmp_config_path)
-
-# --- Kemono DL Pro Constants & Helpers ---
-SITE_BASE_URL = "https://kemono.cr"
-API_BASE_URL = "https://kemono.cr/api/v1"
-
-def sanitize_filename(filename):
-    if not filename:
-        return "untitled"
-    import re
-    sanitized = re.sub(r'[/*?:\"<>|]', "_", filename)
-    return re.sub(r'\s+', ' ', sanitized).strip()
-
-def download_file(url, destination_path, session):
-    """Synchronous file download with retry logic, designed to be run in a thread."""
-    max_retries = 5
-    for attempt in range(max_retries):
-        try:
-            with session.get(url, stream=True, timeout=300) as r:
-                r.raise_for_status()
-                with open(destination_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-            return True
-        except Exception as e:
-            if attempt + 1 == max_retries:
-                return False
-            time.sleep(5)
-    return False
\ No newline at end of file
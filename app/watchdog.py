@@ -0,0 +1,182 @@
+import os
+import signal
+import asyncio
+import time
+import logging
+from pathlib import Path
+from typing import Optional
+
+import psutil
+
+from .database import db_config
+from .utils import update_task_status
+from .task_log import append_log
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 15  # seconds
+DEFAULT_STALL_TIMEOUT = 900  # seconds without progress before a process counts as stalled
+# Process-tree I/O below this per check is treated as noise (e.g. rclone printing stats with nothing moving)
+MIN_IO_DELTA = 64 * 1024
+# The effective timeout adapts to the slowest progress gap seen so far, up to this multiple of the base
+ADAPTIVE_GAP_FACTOR = 3
+MAX_TIMEOUT_FACTOR = 4
+
+# Process-wide counters, exposed through the server status API
+stall_metrics = {"checked_processes": 0, "stalls_detected": 0, "stalls_killed": 0}
+
+
+def get_stall_settings() -> tuple:
+    """Returns (timeout_seconds, action); a timeout of 0 disables stall detection."""
+    try:
+        timeout = int(db_config.get_config("WDM_STALL_TIMEOUT", DEFAULT_STALL_TIMEOUT) or DEFAULT_STALL_TIMEOUT)
+    except (TypeError, ValueError):
+        timeout = DEFAULT_STALL_TIMEOUT
+    action = str(db_config.get_config("WDM_STALL_ACTION", "kill") or "kill").lower()
+    return max(0, timeout), ("flag" if action == "flag" else "kill")
+
+
+def _process_tree_io(pid: int) -> Optional[int]:
+    """Total characters read+written (including sockets) by a process and its children."""
+    try:
+        root = psutil.Process(pid)
+        procs = [root] + root.children(recursive=True)
+    except psutil.Error:
+        return None
+    total = 0
+    for proc in procs:
+        try:
+            io = proc.io_counters()
+            total += getattr(io, "read_chars", io.read_bytes) + getattr(io, "write_chars", io.write_bytes)
+        except (psutil.Error, AttributeError):
+            continue
+    return total
+
+
+def _is_stopped(pid: int) -> bool:
+    """True while the task is paused with SIGSTOP."""
+    try:
+        return psutil.Process(pid).status() == psutil.STATUS_STOPPED
+    except psutil.Error:
+        return False
+
+
+class ProcessWatchdog:
+    """
+    Watches one running subprocess for signs of progress: process-tree I/O, log growth and
+    the download tracker's last activity. When nothing moves for longer than the (adaptive)
+    timeout, the task is flagged as stalled and, depending on WDM_STALL_ACTION, its process
+    group is killed so run_command's retry logic can take over.
+    """
+
+    def __init__(self, task_id: str, process: asyncio.subprocess.Process, status_file: Path,
+                 progress=None, watch_log: bool = True):
+        self.task_id = task_id
+        self.process = process
+        self.status_file = Path(status_file)
+        self.progress = progress
+        self.watch_log = watch_log
+        self.timeout, self.action = get_stall_settings()
+        self.stalled = False  # currently stalled (in flag mode it clears once progress resumes)
+        self.killed = False  # the process was killed for stalling
+        self._monitor = None
+        self._last_progress = time.time()
+        self._max_gap = 0.0
+        self._last_io = None
+        self._last_log_size = None
+        self._last_activity = None
+
+    def start(self):
+        if self.timeout > 0:
+            stall_metrics["checked_processes"] += 1
+            self._monitor = asyncio.create_task(self._run())
+        return self
+
+    def stop(self):
+        if self._monitor:
+            self._monitor.cancel()
+            self._monitor = None
+
+    def effective_timeout(self) -> float:
+        adaptive = max(self.timeout, self._max_gap * ADAPTIVE_GAP_FACTOR)
+        return min(adaptive, self.timeout * MAX_TIMEOUT_FACTOR)
+
+    def _made_progress(self) -> bool:
+        moved = False
+
+        io_total = _process_tree_io(self.process.pid)
+        if io_total is not None:
+            if self._last_io is not None and io_total - self._last_io >= MIN_IO_DELTA:
+                moved = True
+            self._last_io = io_total
+
+        if self.watch_log:
+            try:
+                log_size = self.status_file.stat().st_size
+            except OSError:
+                log_size = None
+            if log_size is not None and self._last_log_size is not None and log_size > self._last_log_size:
+                moved = True
+            self._last_log_size = log_size
+
+        if self.progress is not None:
+            if self._last_activity is not None and self.progress.last_activity > self._last_activity:
+                moved = True
+            self._last_activity = self.progress.last_activity
+
+        return moved
+
+    async def _run(self):
+        while self.process.returncode is None:
+            await asyncio.sleep(CHECK_INTERVAL)
+            if self.process.returncode is not None:
+                return
+
+            now = time.time()
+            if _is_stopped(self.process.pid):
+                # Paused by the user; idle time while stopped does not count
+                self._last_progress = now
+                continue
+
+            if self._made_progress():
+                self._max_gap = max(self._max_gap, now - self._last_progress)
+                self._last_progress = now
+                if self.stalled:
+                    self.stalled = False
+                    append_log(self.status_file, "Progress resumed.\n")
+                    update_task_status(self.task_id, {"stall": None})
+                continue
+
+            idle = now - self._last_progress
+            timeout = self.effective_timeout()
+            if idle < timeout:
+                continue
+
+            self.stalled = True
+            stall_metrics["stalls_detected"] += 1
+            append_log(self.status_file, f"\n--- STALL DETECTED: no progress for {int(idle)}s (timeout {int(timeout)}s) ---\n")
+            logger.warning(f"Task {self.task_id} stalled: no progress for {int(idle)}s")
+            update_task_status(self.task_id, {"stall": {
+                "stalled": True,
+                "idle_seconds": int(idle),
+                "timeout": int(timeout),
+                "detected_at": now,
+                "action": self.action
+            }})
+
+            if self.action == "kill":
+                try:
+                    pgid = os.getpgid(self.process.pid)
+                    if pgid == os.getpgrp():
+                        # Never signal our own process group
+                        self.process.kill()
+                    else:
+                        os.killpg(pgid, signal.SIGKILL)
+                    self.killed = True
+                    stall_metrics["stalls_killed"] += 1
+                    append_log(self.status_file, "Killed stalled process; it will be retried.\n")
+                except (ProcessLookupError, PermissionError):
+                    pass
+                return
+            # Flag-only mode: report again only after another full timeout
+            self._last_progress = now